@@ -0,0 +1,146 @@
+"""Baseline schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16
+
+Databases created before migrations existed (by Base.metadata.create_all)
+already have some or all of these tables, so each table and index is only
+created when it is missing. A table that exists may predate columns added
+to its model later, such as files.sha256; those are added, all of them
+being nullable. Offline (--sql) scripts create everything.
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def create_table(name: str, *columns) -> None:
+    if context.is_offline_mode():
+        op.create_table(name, *columns)
+        return
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(name):
+        op.create_table(name, *columns)
+        return
+    existing = {column["name"] for column in inspector.get_columns(name)}
+    missing = [column for column in columns if column.name not in existing]
+    if missing:
+        # Batch mode, as SQLite can't add a foreign key with ALTER TABLE;
+        # batch mode needs a name for it
+        with op.batch_alter_table(name) as batch:
+            for column in missing:
+                for foreign_key in column.foreign_keys:
+                    foreign_key.name = f"fk_{name}_{column.name}"
+                batch.add_column(column)
+
+
+def create_index(name: str, table: str, columns: list, unique: bool = False) -> None:
+    if not context.is_offline_mode():
+        existing = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+        if name in existing:
+            return
+    op.create_index(name, table, columns, unique=unique)
+
+
+def upgrade() -> None:
+    create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("user_type", sa.String(), nullable=False),
+        sa.Column("is_verified", sa.Boolean(), nullable=True),
+        sa.Column("verification_token", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    create_index("ix_users_id", "users", ["id"])
+    create_index("ix_users_email", "users", ["email"], unique=True)
+
+    create_table(
+        "blobs",
+        sa.Column("sha256", sa.String(64), primary_key=True),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("file_size", sa.Integer(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+
+    create_table(
+        "files",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("original_filename", sa.String(), nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("file_type", sa.String(), nullable=False),
+        sa.Column("file_size", sa.Integer(), nullable=False),
+        sa.Column("sha256", sa.String(64), sa.ForeignKey("blobs.sha256"), nullable=True),
+        sa.Column("uploaded_by", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("uploaded_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    create_index("ix_files_id", "files", ["id"])
+    create_index("ix_files_sha256", "files", ["sha256"])
+
+    create_table(
+        "downloads",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("file_id", sa.Integer(), sa.ForeignKey("files.id"), nullable=True),
+        sa.Column("download_token", sa.String(), nullable=False, unique=True),
+        sa.Column("downloaded_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("is_used", sa.Boolean(), nullable=True),
+    )
+    create_index("ix_downloads_id", "downloads", ["id"])
+    create_index("ix_downloads_expires_at", "downloads", ["expires_at"])
+
+    create_table(
+        "upload_sessions",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("original_filename", sa.String(), nullable=False),
+        sa.Column("total_size", sa.Integer(), nullable=False),
+        sa.Column("committed_size", sa.Integer(), nullable=False),
+        sa.Column("sha256", sa.String(64), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    create_index("ix_upload_sessions_id", "upload_sessions", ["id"])
+    create_index("ix_upload_sessions_expires_at", "upload_sessions", ["expires_at"])
+
+    create_table(
+        "revoked_download_tokens",
+        sa.Column("token_id", sa.String(16), primary_key=True),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    create_index("ix_revoked_download_tokens_expires_at", "revoked_download_tokens", ["expires_at"])
+
+    create_table(
+        "download_archive",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("file_id", sa.Integer(), sa.ForeignKey("files.id"), nullable=True),
+        sa.Column("downloaded_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("is_used", sa.Boolean(), nullable=True),
+    )
+    create_index("ix_download_archive_user_id_id", "download_archive", ["user_id", "id"])
+    create_index("ix_download_archive_file_id", "download_archive", ["file_id"])
+
+
+def downgrade() -> None:
+    for table in (
+        "download_archive",
+        "revoked_download_tokens",
+        "upload_sessions",
+        "downloads",
+        "files",
+        "blobs",
+        "users",
+    ):
+        op.drop_table(table)
@@ -0,0 +1,52 @@
+"""Indexes for the hot queries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16
+
+One index per query shape in the routers: keyset listings seek on
+(filter, sort key, id), download history on (user_id, id), and on
+PostgreSQL the secure-download token lookup is answered from the index
+alone. Each one is
+checked by tests/test_query_plans.py.
+"""
+from alembic import op
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_users_user_type_id", "users", ["user_type", "id"]),
+    ("ix_users_verification_token", "users", ["verification_token"]),
+    ("ix_files_uploaded_by_id", "files", ["uploaded_by", "id"]),
+    ("ix_files_uploaded_by_original_filename_id", "files", ["uploaded_by", "original_filename", "id"]),
+    ("ix_files_file_type_id", "files", ["file_type", "id"]),
+    ("ix_files_original_filename_id", "files", ["original_filename", "id"]),
+    ("ix_files_file_type_original_filename_id", "files", ["file_type", "original_filename", "id"]),
+    ("ix_downloads_user_id_id", "downloads", ["user_id", "id"]),
+    ("ix_downloads_file_id", "downloads", ["file_id"]),
+    ("ix_download_archive_expires_at", "download_archive", ["expires_at"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+    if op.get_bind().dialect.name == "postgresql":
+        # Index-only secure-download lookups; SQLite has no INCLUDE
+        op.create_index(
+            "ix_downloads_token_lookup",
+            "downloads",
+            ["download_token"],
+            postgresql_include=["user_id", "file_id", "expires_at"],
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index("ix_downloads_token_lookup", table_name="downloads")
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,62 @@
+"""Store backend-relative storage keys instead of file paths
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16
+
+Blobs and files pointed at their content with a path under UPLOAD_DIR.
+They now carry a key relative to the storage backend. Files were always
+written directly under UPLOAD_DIR, so the key of an existing file is its
+file name, which the local backend resolves to the same file. The rehome
+tool (python -m app.core.rehome) later moves them into the fan-out layout.
+
+Dropping a column rebuilds the table on SQLite, which needs a live
+connection, so SQLite databases can't be upgraded from --sql scripts past
+this revision; the app upgrades them itself on startup.
+"""
+import os
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+TABLES = {"blobs": "sha256", "files": "id"}
+
+
+def backfill(table: str, primary_key: str, source: str, target: str, convert, batch_size: int = 1000) -> None:
+    # Offline scripts are for new databases, which have no rows to convert
+    if context.is_offline_mode():
+        return
+    connection = op.get_bind()
+    rows = sa.table(table, sa.column(primary_key), sa.column(source), sa.column(target))
+    update = rows.update().where(rows.c[primary_key] == sa.bindparam("row_id")).values(
+        {target: sa.bindparam("converted")}
+    )
+    result = connection.execute(sa.select(rows.c[primary_key], rows.c[source]))
+    while batch := result.fetchmany(batch_size):
+        connection.execute(update, [{"row_id": row_id, "converted": convert(value)} for row_id, value in batch])
+
+
+def upgrade() -> None:
+    for table, primary_key in TABLES.items():
+        op.add_column(table, sa.Column("storage_key", sa.String(), nullable=True))
+        backfill(table, primary_key, "file_path", "storage_key", os.path.basename)
+        with op.batch_alter_table(table) as batch:
+            batch.alter_column("storage_key", existing_type=sa.String(), nullable=False)
+            batch.drop_column("file_path")
+
+
+def downgrade() -> None:
+    upload_dir = os.getenv("UPLOAD_DIR", "uploads")
+    for table, primary_key in TABLES.items():
+        op.add_column(table, sa.Column("file_path", sa.String(), nullable=True))
+        # Only right for files kept by the local backend
+        backfill(table, primary_key, "storage_key", "file_path", lambda key: os.path.join(upload_dir, *key.split("/")))
+        with op.batch_alter_table(table) as batch:
+            batch.alter_column("file_path", existing_type=sa.String(), nullable=False)
+            batch.drop_column("storage_key")
@@ -0,0 +1,29 @@
+"""Full-text search index over file names and document text
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16
+
+An FTS5 virtual table on SQLite, a table with a weighted tsvector column
+and a GIN index on PostgreSQL (see SEARCH_INDEX_DDL in app/models.py).
+The index starts out empty; the search_index maintenance job fills it in
+from the stored files, a batch per run.
+"""
+from alembic import op
+
+from app.models import SEARCH_INDEX_DDL
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for statement in SEARCH_INDEX_DDL[op.get_bind().dialect.name]:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE file_search")
@@ -0,0 +1,37 @@
+"""Previews of stored documents
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-16
+
+One row per content digest, written by the preview pool
+(app/core/previews.py). The previews maintenance job makes them for
+files stored before this revision, a batch per run.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "previews",
+        sa.Column("sha256", sa.String(64), primary_key=True),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=True),
+        sa.Column("thumbnail_key", sa.String(), nullable=True),
+        sa.Column("thumbnail_type", sa.String(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("previews")
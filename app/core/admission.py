@@ -0,0 +1,388 @@
+import asyncio
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.principal_cache import principal_cache
+from app.core.security import decode_access_token
+
+# Requests in flight that are capped host-wide
+UPLOADS, DOWNLOADS = 0, 1
+
+
+@dataclass(frozen=True)
+class Budget:
+    per_minute: float
+    burst: int
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60
+
+
+def default_budgets() -> Dict[str, Budget]:
+    return {
+        "auth": Budget(settings.RATE_LIMIT_AUTH_PER_MINUTE, settings.RATE_LIMIT_AUTH_BURST),
+        "upload": Budget(settings.RATE_LIMIT_UPLOAD_PER_MINUTE, settings.RATE_LIMIT_UPLOAD_BURST),
+        "download": Budget(settings.RATE_LIMIT_DOWNLOAD_PER_MINUTE, settings.RATE_LIMIT_DOWNLOAD_BURST),
+        "listing": Budget(settings.RATE_LIMIT_LISTING_PER_MINUTE, settings.RATE_LIMIT_LISTING_BURST),
+    }
+
+
+def classify(method: str, path: str) -> Tuple[Optional[str], Optional[int]]:
+    """The rate-limit class of a request and the in-flight cap it counts against."""
+    if path.startswith("/api/auth/"):
+        # Sign-up, sign-in and verification run bcrypt or write; reads are cheap
+        return ("auth", None) if method == "POST" else (None, None)
+    if not path.startswith("/api/files/"):
+        return None, None
+    name = path[len("/api/files/"):]
+    if name == "upload":
+        return "upload", UPLOADS
+    if name.startswith("upload-sessions"):
+        return "upload", UPLOADS if method == "PUT" else None
+    if name.startswith(("secure-download/", "archive")):
+        return "download", DOWNLOADS
+    if name.startswith(("download-file/", "download-links")):
+        return "download", None
+    if name in ("list", "uploaded", "search") or name.startswith("download-history"):
+        return "listing", None
+    if name.endswith(("/preview", "/thumbnail")):
+        # Polled while a preview is made
+        return "listing", None
+    return None, None
+
+
+class SharedLimits:
+    """Token buckets and in-flight counts in a file shared by the workers on a host.
+
+    Each process maps the file into memory and changes it under a file lock,
+    which costs a pair of uncontended system calls. Buckets live in an open
+    addressing table keyed by a hash of (class, client); a key probes a few
+    slots and, when they are all taken, reuses the one idle the longest
+    (that client starts over with a full bucket). In-flight counts are kept
+    per worker process, so a worker that dies doesn't leak its requests:
+    the next process to take its slot starts from zero.
+    """
+
+    _worker = struct.Struct("<qiii")  # pid, uploads, downloads, queued
+    _bucket = struct.Struct("<Qdd")  # key hash, tokens, last refill (monotonic)
+    worker_slots = 128
+    probes = 8
+
+    def __init__(self, path: str, table_size: int):
+        self.path = path
+        self.table_size = table_size
+        self._buckets_offset = self.worker_slots * self._worker.size
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._pid: Optional[int] = None
+        self._slot: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _mapped(self) -> mmap.mmap:
+        if self._map is None:
+            size = self._buckets_offset + self.table_size * self._bucket.size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size != size:
+                    # New, or laid out for another table size
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._map = mmap.mmap(fd, size)
+        return self._map
+
+    def _locked(self):
+        return _FileLock(self)
+
+    def take(self, key: str, budget: Budget) -> float:
+        """Take a token from key's bucket; 0 if allowed, else seconds until one is due."""
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        now = time.monotonic()
+        with self._locked() as mapped:
+            start = key_hash % self.table_size
+            offset = None
+            oldest = None
+            for probe in range(self.probes):
+                candidate = self._buckets_offset + ((start + probe) % self.table_size) * self._bucket.size
+                stored_hash, tokens, updated = self._bucket.unpack_from(mapped, candidate)
+                if stored_hash == key_hash:
+                    offset = candidate
+                    tokens = min(budget.burst, tokens + (now - updated) * budget.rate)
+                    break
+                if stored_hash == 0 or oldest is None or updated < oldest[1]:
+                    oldest = (candidate, updated if stored_hash else -math.inf)
+            if offset is None:
+                offset, tokens = oldest[0], float(budget.burst)
+            if tokens >= 1:
+                self._bucket.pack_into(mapped, offset, key_hash, tokens - 1, now)
+                return 0.0
+            self._bucket.pack_into(mapped, offset, key_hash, tokens, now)
+            return (1 - tokens) / budget.rate if budget.rate > 0 else math.inf
+
+    def _own_offset(self, mapped: mmap.mmap) -> Optional[int]:
+        # Called under the lock; claims a worker slot on first use in this process
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._slot
+        self._pid, self._slot = pid, None
+        for slot in range(self.worker_slots):
+            offset = slot * self._worker.size
+            owner = self._worker.unpack_from(mapped, offset)[0]
+            if owner and owner != pid and _alive(owner):
+                continue
+            # Free, or left by a process that has exited: its requests are gone too
+            self._worker.pack_into(mapped, offset, 0, 0, 0, 0)
+            if self._slot is None:
+                self._worker.pack_into(mapped, offset, pid, 0, 0, 0)
+                self._slot = offset
+        return self._slot
+
+    def in_flight(self, kind: int) -> Tuple[int, int]:
+        """Requests of kind in flight, and requests queued, across the host."""
+        with self._locked() as mapped:
+            return self._totals(mapped, kind)
+
+    def _totals(self, mapped: mmap.mmap, kind: int) -> Tuple[int, int]:
+        running = queued = 0
+        for pid, uploads, downloads, waiting in self._worker.iter_unpack(mapped[:self._buckets_offset]):
+            if pid:
+                running += downloads if kind == DOWNLOADS else uploads
+                queued += waiting
+        return running, queued
+
+    def acquire(self, kind: int, limit: int) -> bool:
+        with self._locked() as mapped:
+            offset = self._own_offset(mapped)
+            if offset is None:
+                # More processes than worker slots; don't cap this one
+                return True
+            if self._totals(mapped, kind)[0] >= limit:
+                return False
+            self._add(mapped, offset, 1 + kind, 1)
+            return True
+
+    def release(self, kind: int) -> None:
+        self._change(1 + kind, -1)
+
+    def queue(self, amount: int) -> int:
+        """Change this worker's queued count; returns the host-wide queue before it."""
+        with self._locked() as mapped:
+            offset = self._own_offset(mapped)
+            if offset is None:
+                return 0
+            queued = self._totals(mapped, UPLOADS)[1]
+            self._add(mapped, offset, 3, amount)
+            return queued
+
+    def _change(self, field: int, amount: int) -> None:
+        with self._locked() as mapped:
+            offset = self._own_offset(mapped)
+            if offset is not None:
+                self._add(mapped, offset, field, amount)
+
+    def _add(self, mapped: mmap.mmap, offset: int, field: int, amount: int) -> None:
+        values = list(self._worker.unpack_from(mapped, offset))
+        values[field] = max(values[field] + amount, 0)
+        self._worker.pack_into(mapped, offset, *values)
+
+
+class _FileLock:
+    def __init__(self, limits: SharedLimits):
+        self.limits = limits
+
+    def __enter__(self) -> mmap.mmap:
+        self.limits._lock.acquire()
+        mapped = self.limits._mapped()
+        fcntl.flock(self.limits._fd, fcntl.LOCK_EX)
+        return mapped
+
+    def __exit__(self, *exc_info) -> None:
+        fcntl.flock(self.limits._fd, fcntl.LOCK_UN)
+        self.limits._lock.release()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AdmissionController:
+    """Decides whether a request may run now, later, or not at all.
+
+    Every request in a rate-limited class takes a token from the bucket of
+    its user (its IP address for anonymous requests and for the auth
+    routes); an empty bucket means 429 with the seconds until the next
+    token. Uploads and downloads additionally need one of a fixed number of
+    host-wide slots. Without one they wait, up to queue_timeout, in a queue
+    of at most max_queued requests; a full queue or a timeout means 503.
+    """
+
+    def __init__(
+        self,
+        limits: SharedLimits,
+        budgets: Dict[str, Budget],
+        max_in_flight: Dict[int, int],
+        max_queued: int,
+        queue_timeout: float,
+        enabled: bool = True,
+    ):
+        self.limits = limits
+        self.budgets = budgets
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+        self.rate_limited = 0
+        self.shed = 0
+
+    def identity(self, scope: Scope, rate_class: str) -> str:
+        headers = Headers(scope=scope)
+        if rate_class != "auth":
+            scheme, _, token = headers.get("authorization", "").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                principal = principal_cache.get(token)
+                if principal is not None:
+                    return f"user:{principal.email}"
+                try:
+                    return f"user:{decode_access_token(token)['sub']}"
+                except HTTPException:
+                    pass
+        if settings.RATE_LIMIT_TRUST_FORWARDED_FOR and "x-forwarded-for" in headers:
+            return "ip:" + headers["x-forwarded-for"].split(",", 1)[0].strip()
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    def check_rate(self, scope: Scope, rate_class: str) -> float:
+        retry_after = self.limits.take(f"{rate_class}:{self.identity(scope, rate_class)}", self.budgets[rate_class])
+        if retry_after:
+            self.rate_limited += 1
+        return retry_after
+
+    async def acquire(self, kind: int) -> bool:
+        """Take an in-flight slot, waiting in the queue if need be."""
+        limit = self.max_in_flight[kind]
+        if self.limits.acquire(kind, limit):
+            return True
+        if self.limits.queue(1) >= self.max_queued:
+            self.limits.queue(-1)
+            self.shed += 1
+            return False
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            delay = 0.005
+            while time.monotonic() < deadline:
+                # Slots are freed by other workers too, so poll, backing off
+                await asyncio.sleep(delay)
+                if self.limits.acquire(kind, limit):
+                    return True
+                delay = min(delay * 2, 0.05)
+        finally:
+            self.limits.queue(-1)
+        self.shed += 1
+        return False
+
+    def release(self, kind: int) -> None:
+        self.limits.release(kind)
+
+    def stats(self) -> dict:
+        uploads, queued = self.limits.in_flight(UPLOADS)
+        downloads, _ = self.limits.in_flight(DOWNLOADS)
+        return {
+            "enabled": self.enabled,
+            "uploads_in_flight": uploads,
+            "downloads_in_flight": downloads,
+            "queued": queued,
+            "max_uploads": self.max_in_flight[UPLOADS],
+            "max_downloads": self.max_in_flight[DOWNLOADS],
+            "max_queued": self.max_queued,
+            "rate_limited": self.rate_limited,
+            "shed": self.shed,
+        }
+
+
+def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status_code,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class AdmissionMiddleware:
+    """Apply the admission controller before a request reaches routing.
+
+    Requests outside the rate-limited classes (health checks, metrics,
+    event streams) pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+        rate_class, kind = classify(scope["method"], scope["path"])
+        if rate_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = self.controller.check_rate(scope, rate_class)
+        if retry_after:
+            response = _reject(429, "Too many requests, please slow down", retry_after)
+            await response(scope, receive, send)
+            return
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.controller.acquire(kind):
+            response = _reject(503, "Server busy, please retry shortly", self.controller.queue_timeout)
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(kind)
+
+
+def default_state_path() -> str:
+    # One state file per database, shared by the workers on this host
+    digest = hashlib.sha256(settings.DATABASE_URL.encode()).hexdigest()[:16]
+    return str(Path(tempfile.gettempdir()) / f"secure-files-admission-{digest}")
+
+
+admission = AdmissionController(
+    SharedLimits(settings.ADMISSION_STATE_FILE or default_state_path(), settings.RATE_LIMIT_TABLE_SIZE),
+    default_budgets(),
+    {UPLOADS: settings.ADMISSION_MAX_UPLOADS, DOWNLOADS: settings.ADMISSION_MAX_DOWNLOADS},
+    settings.ADMISSION_MAX_QUEUED,
+    settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    enabled=settings.ADMISSION_ENABLED,
+)
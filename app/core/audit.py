@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import DownloadRecord
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingLink:
+    token: str
+    user_id: int
+    file_id: int
+    expires_at: datetime
+    is_used: bool = False
+    downloaded_at: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass
+class _AuditItem:
+    link: Optional[PendingLink] = None
+    used_token: Optional[str] = None
+    future: Optional[Future] = None
+
+
+_STOP = object()
+
+
+class AuditWriter:
+    """Write-behind queue for download records.
+
+    Link creations and "used" marks are queued by request handlers and
+    written by one background thread in batched transactions, flushed when
+    batch_size items are waiting or flush_interval seconds after the first
+    one arrived. Handlers that need durability wait on a barrier, which
+    flushes straight away and resolves once everything before it is
+    committed.
+    Links waiting to be written can be looked up with pending_link, so a
+    download can follow its link immediately in the same process, and
+    listed with pending_links_for.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], batch_size: int, flush_interval: float):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_seconds = 0.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending_links: Dict[str, PendingLink] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    # Producers
+
+    def add_link(self, link: PendingLink) -> None:
+        with self._lock:
+            self._pending_links[link.token] = link
+        self._put(_AuditItem(link=link))
+
+    def mark_used(self, token: str) -> None:
+        with self._lock:
+            pending = self._pending_links.get(token)
+            if pending is not None:
+                pending.is_used = True
+        self._put(_AuditItem(used_token=token))
+
+    def barrier(self) -> Future:
+        """Flush now; the future resolves once everything queued so far is committed."""
+        item = _AuditItem(future=Future())
+        self._put(item)
+        return item.future
+
+    async def wait_durable(self) -> None:
+        await asyncio.wrap_future(self.barrier())
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        self.barrier().result(timeout)
+
+    def pending_link(self, token: str) -> Optional[PendingLink]:
+        with self._lock:
+            return self._pending_links.get(token)
+
+    def pending_links_for(self, user_id: int) -> List[PendingLink]:
+        """A user's links waiting to be written, newest first."""
+        with self._lock:
+            return [link for link in reversed(self._pending_links.values()) if link.user_id == user_id]
+
+    def close(self) -> None:
+        """Write everything still queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _put(self, item: _AuditItem) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+            if item.link is not None or item.used_token is not None:
+                self.enqueued += 1
+        self._queue.put(item)
+
+    # Writer thread
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            urgent = item.future is not None
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    if urgent:
+                        item = self._queue.get_nowait()
+                    else:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                urgent = urgent or item.future is not None
+            self._flush(batch)
+
+    def _flush(self, batch: List[_AuditItem]) -> None:
+        started = time.perf_counter()
+        try:
+            self._write(batch)
+            error = None
+        except Exception as exc:
+            # Retry one item per transaction so a bad row can't sink the whole batch
+            logger.warning("Audit batch of %d failed, retrying items one by one: %s", len(batch), exc)
+            error = exc
+        if error is not None:
+            for item in batch:
+                try:
+                    self._write([item])
+                except Exception as exc:
+                    logger.error("Dropping audit record: %s", exc)
+                    self._finish([item], exc)
+                else:
+                    self._finish([item], None)
+        else:
+            self._finish(batch, None)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.batches += 1
+            self.last_flush_seconds = elapsed
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    def _write(self, batch: List[_AuditItem]) -> None:
+        links: Dict[str, PendingLink] = {}
+        used = set()
+        for item in batch:
+            if item.link is not None:
+                links[item.link.token] = item.link
+            if item.used_token is not None:
+                used.add(item.used_token)
+        if not links and not used:
+            return
+        existing = set()
+        with self.session_factory() as db:
+            if links:
+                # Signed links are recorded on every download; keep only the first
+                existing = set(db.scalars(
+                    select(DownloadRecord.download_token)
+                    .where(DownloadRecord.download_token.in_(list(links)))
+                ))
+                db.add_all([
+                    DownloadRecord(
+                        user_id=link.user_id,
+                        file_id=link.file_id,
+                        download_token=token,
+                        downloaded_at=link.downloaded_at,
+                        expires_at=link.expires_at,
+                        is_used=link.is_used or token in used
+                    )
+                    for token, link in links.items() if token not in existing
+                ])
+            used_existing = used - (links.keys() - existing)
+            if used_existing:
+                db.execute(
+                    update(DownloadRecord)
+                    .where(DownloadRecord.download_token.in_(list(used_existing)))
+                    .values(is_used=True)
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+
+    def _finish(self, batch: List[_AuditItem], error: Optional[Exception]) -> None:
+        with self._lock:
+            for item in batch:
+                if item.link is not None and self._pending_links.get(item.link.token) is item.link:
+                    del self._pending_links[item.link.token]
+                if item.link is not None or item.used_token is not None:
+                    if error is None:
+                        self.written += 1
+                    else:
+                        self.failed += 1
+        for item in batch:
+            if item.future is not None:
+                if error is None:
+                    item.future.set_result(None)
+                else:
+                    item.future.set_exception(error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "pending_links": len(self._pending_links),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "failed": self.failed,
+                "batches": self.batches,
+                "flush_seconds_last": self.last_flush_seconds,
+                "flush_seconds_max": self.flush_seconds_max,
+                "flush_seconds_avg": self.flush_seconds_total / self.batches if self.batches else 0.0,
+            }
+
+
+audit_writer = AuditWriter(
+    SessionLocal,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL_MS / 1000
+)
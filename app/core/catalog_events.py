@@ -0,0 +1,282 @@
+import asyncio
+import fcntl
+import hashlib
+import itertools
+import mmap
+import os
+import secrets
+import struct
+import tempfile
+import threading
+import weakref
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+
+import orjson
+
+from app.core.config import settings
+from app.core.metrics import app_metrics
+
+RESYNC = orjson.dumps({"type": "resync"})
+
+
+class EventRing:
+    """The latest catalog events, in a file shared by the workers on a host.
+
+    Each process maps the file into memory. A publisher takes a file lock,
+    clears the slot for the next sequence number, writes the event into it
+    and then advances the head; readers take no lock, notice new events by
+    the head moving and drop a copy whose slot changed while they read it.
+    Only the newest `slots` events are kept. Like the catalog version, the
+    file holds a random epoch so sequence numbers counted again in a new
+    file can't be mistaken for old ones.
+    """
+
+    _header = struct.Struct("<QQ")  # epoch, head sequence number
+    _slot_header = struct.Struct("<QI")  # sequence number, payload length
+
+    def __init__(self, path: str, slots: int, slot_size: int):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - self._slot_header.size
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def _mapped(self) -> mmap.mmap:
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    size = self._header.size + self.slots * self.slot_size
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    try:
+                        if os.fstat(fd).st_size != size:
+                            # New, or laid out for other settings
+                            os.ftruncate(fd, 0)
+                            os.ftruncate(fd, size)
+                            os.pwrite(fd, self._header.pack(secrets.randbits(32), 0), 0)
+                    finally:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                    self._fd = fd
+                    self._map = mmap.mmap(fd, size)
+        return self._map
+
+    def _offset(self, seq: int) -> int:
+        return self._header.size + (seq % self.slots) * self.slot_size
+
+    def head(self) -> Tuple[int, int]:
+        return self._header.unpack_from(self._mapped())
+
+    def publish(self, payload: bytes) -> int:
+        """Append an event and return its sequence number."""
+        mapped = self._mapped()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            epoch, head = self._header.unpack_from(mapped)
+            seq = head + 1
+            offset = self._offset(seq)
+            if len(payload) > self.capacity:
+                # Readers fall back to a resync for events that don't fit
+                payload = b""
+            # Sequence numbers start at 1, so readers can't take the slot for
+            # any event while its payload is half written
+            self._slot_header.pack_into(mapped, offset, 0, 0)
+            mapped[offset + self._slot_header.size:offset + self._slot_header.size + len(payload)] = payload
+            self._slot_header.pack_into(mapped, offset, seq, len(payload))
+            self._header.pack_into(mapped, 0, epoch, seq)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return seq
+
+    def read(self, seq: int) -> Optional[bytes]:
+        """The event with sequence number seq, or None once it is overwritten."""
+        mapped = self._mapped()
+        offset = self._offset(seq)
+        stored_seq, length = self._slot_header.unpack_from(mapped, offset)
+        if stored_seq != seq or length == 0:
+            return None
+        start = offset + self._slot_header.size
+        payload = bytes(mapped[start:start + length])
+        # A publisher that lapped the ring while we copied leaves another
+        # header behind, or a cleared one while it is still writing
+        if self._slot_header.unpack_from(mapped, offset) != (seq, length):
+            return None
+        return payload
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class CatalogFeed:
+    """Server-sent event streams of catalog changes for this worker.
+
+    Events published by any worker on the host are picked up from the ring
+    by one polling thread (immediately when this worker published them),
+    encoded once as SSE frames and kept in memory. Idle streams on an event
+    loop all wait on one shared future, so a change costs one wake-up per
+    loop and one write per stream no matter how many streams are open.
+    """
+
+    def __init__(self, ring: EventRing, poll_interval: float, keepalive: float, max_connections: int):
+        self.ring = ring
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self.max_connections = max_connections
+        self.connections = 0
+        self._frames: deque = deque(maxlen=ring.slots)  # (seq, frame), consecutive
+        self._seen: Optional[int] = None
+        self._waiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Future]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def frame(self, seq: int, payload: bytes) -> bytes:
+        epoch, _ = self.ring.head()
+        return b"id: %x.%d\ndata: %s\n\n" % (epoch, seq, payload)
+
+    def publish(self, event: dict) -> int:
+        seq = self.ring.publish(orjson.dumps(event, option=orjson.OPT_UTC_Z))
+        self.poll()
+        return seq
+
+    def poll(self) -> None:
+        """Take in events published since the last poll and wake the streams."""
+        _, head = self.ring.head()
+        with self._lock:
+            if self._seen is None:
+                self._seen = head
+                return
+            if head <= self._seen:
+                return
+            for seq in range(max(self._seen + 1, head - self.ring.slots + 1), head + 1):
+                self._frames.append((seq, self.frame(seq, self.ring.read(seq) or RESYNC)))
+            self._seen = head
+            waiters = list(self._waiters.items())
+            self._waiters.clear()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # The loop has been closed
+                pass
+
+    def since(self, position: int) -> Tuple[List[bytes], int, bool]:
+        """Frames after position, the new position, and whether the stream fell behind."""
+        with self._lock:
+            if position >= self._seen:
+                return [], position, False
+            first = self._frames[0][0] if self._frames else self._seen + 1
+            if position + 1 < first:
+                return [], self._seen, True
+            frames = [frame for _, frame in itertools.islice(self._frames, position + 1 - first, None)]
+            return frames, self._seen, False
+
+    async def wait(self, position: int, timeout: float) -> bool:
+        """Wait until there are events after position; False on timeout."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._seen > position:
+                return True
+            future = self._waiters.get(loop)
+            if future is None:
+                future = self._waiters[loop] = loop.create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="catalog-events", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.poll()
+
+    def _resume_position(self, last_event_id: Optional[str]) -> Optional[int]:
+        # Event ids are "{epoch:x}.{seq}"; ids from another ring file can't resume
+        epoch, _ = self.ring.head()
+        try:
+            id_epoch, _, id_seq = (last_event_id or "").partition(".")
+            if int(id_epoch, 16) == epoch and int(id_seq) <= self._seen:
+                return int(id_seq)
+        except ValueError:
+            pass
+        return None
+
+    async def stream(self, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """SSE frames for one client, resuming after last_event_id when possible.
+
+        A client that reconnects too late to be sent what it missed, or
+        falls that far behind, gets a "resync" event and should reload the
+        listing.
+        """
+        self.start()
+        self.poll()
+        with self._lock:
+            self.connections += 1
+        try:
+            with app_metrics.event_streams.track():
+                yield b"retry: 3000\n\n"
+                position = self._resume_position(last_event_id)
+                if position is None:
+                    position = self._seen
+                    if last_event_id:
+                        yield self.frame(position, RESYNC)
+                while True:
+                    frames, position, lagged = self.since(position)
+                    if lagged:
+                        yield self.frame(position, RESYNC)
+                    elif frames:
+                        yield b"".join(frames)
+                    elif not await self.wait(position, self.keepalive):
+                        yield b": keepalive\n\n"
+        finally:
+            with self._lock:
+                self.connections -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "max_connections": self.max_connections,
+                "sequence": self._seen,
+                "buffered_events": len(self._frames),
+            }
+
+
+def default_events_path() -> str:
+    # One ring per database, shared by the workers on this host
+    digest = hashlib.sha256(settings.DATABASE_URL.encode()).hexdigest()[:16]
+    return str(Path(tempfile.gettempdir()) / f"secure-files-events-{digest}")
+
+
+catalog_feed = CatalogFeed(
+    EventRing(
+        settings.CATALOG_EVENTS_FILE or default_events_path(),
+        settings.CATALOG_EVENTS_SLOTS,
+        settings.CATALOG_EVENTS_SLOT_SIZE,
+    ),
+    poll_interval=settings.CATALOG_EVENTS_POLL_MS / 1000,
+    keepalive=settings.CATALOG_EVENTS_KEEPALIVE_SECONDS,
+    max_connections=settings.CATALOG_EVENTS_MAX_CONNECTIONS,
+)
@@ -1,20 +1,153 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 import os
 
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./secure_files.db"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a connection
+    DB_POOL_RECYCLE: int = 1800  # seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = True
+    MIGRATE_ON_STARTUP: bool = True  # set to false when migrations run before the workers start
     
     # Security
     SECRET_KEY: str = "your-super-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    BCRYPT_ROUNDS: int = 12  # existing hashes are upgraded on the next login
+    PASSWORD_HASH_WORKERS: Optional[int] = None  # defaults to the CPU count
+    PASSWORD_HASH_MAX_PENDING: int = 64  # further logins get 503 until the queue drains
+    
+    # Authenticated-principal cache (per worker process)
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 30
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Admission control, shared by the workers on a host. Each user (each IP
+    # for anonymous requests and sign-ins) gets a token bucket per route class
+    # that refills at the per-minute rate up to the burst; uploads and
+    # downloads in flight are capped, and further ones wait in a bounded queue
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_STATE_FILE: Optional[str] = None  # defaults to one per database in the temp dir
+    RATE_LIMIT_AUTH_PER_MINUTE: float = 30
+    RATE_LIMIT_AUTH_BURST: int = 10
+    RATE_LIMIT_UPLOAD_PER_MINUTE: float = 120
+    RATE_LIMIT_UPLOAD_BURST: int = 30
+    RATE_LIMIT_DOWNLOAD_PER_MINUTE: float = 300
+    RATE_LIMIT_DOWNLOAD_BURST: int = 60
+    RATE_LIMIT_LISTING_PER_MINUTE: float = 600
+    RATE_LIMIT_LISTING_BURST: int = 120
+    RATE_LIMIT_TABLE_SIZE: int = 65536  # buckets; idle ones are reused when the table fills
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool = False  # only behind a proxy that sets it
+    ADMISSION_MAX_UPLOADS: int = 32  # in flight on the host
+    ADMISSION_MAX_DOWNLOADS: int = 128
+    ADMISSION_MAX_QUEUED: int = 256  # beyond this, uploads and downloads get 503
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 10.0
     
     # File Upload
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: list = [".pptx", ".docx", ".xlsx"]
-    UPLOAD_DIR: str = "uploads"
+    UPLOAD_DIR: str = "uploads"  # staging for uploads, and the local storage root
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 1MB
+    UPLOAD_SESSION_TTL_HOURS: int = 24
+    UPLOAD_SESSION_PURGE_INTERVAL_SECONDS: int = 300
+    
+    # Uploads must be Office Open XML packages of the type their name claims.
+    # The ZIP directory is checked as the upload completes; the parts'
+    # content types in a pool of processes
+    UPLOAD_VALIDATION_WORKERS: int = 1  # processes per worker; 0 checks in a thread instead
+    UPLOAD_VALIDATION_MAX_PENDING: int = 64  # further uploads get 503 until checks drain
+    UPLOAD_MAX_PARTS: int = 10000  # ZIP entries per package
+    UPLOAD_MAX_UNCOMPRESSED_SIZE: int = 1024 * 1024 * 1024  # all parts inflated, 1GB
+    UPLOAD_MAX_COMPRESSION_RATIO: int = 100  # per part larger than 100KB inflated
+    
+    # File storage: "local" keeps files under UPLOAD_DIR, "s3" in a bucket
+    # (credentials from the usual AWS environment variables or profile).
+    # Keys are spread over STORAGE_FAN_OUT_DEPTH levels of hash prefixes.
+    STORAGE_BACKEND: Literal["local", "s3"] = "local"
+    STORAGE_FAN_OUT_DEPTH: int = 2
+    S3_BUCKET: Optional[str] = None
+    S3_PREFIX: str = ""
+    S3_ENDPOINT_URL: Optional[str] = None  # for MinIO and other S3-compatible stores
+    S3_REGION: Optional[str] = None
+    
+    # Download links: "database" stores a row per link, "signed" issues
+    # HMAC-signed tokens that are checked without a database write
+    DOWNLOAD_TOKEN_MODE: Literal["database", "signed"] = "database"
+    DOWNLOAD_LINK_TTL_HOURS: int = 24
+    DOWNLOAD_DENY_LIST_REFRESH_SECONDS: int = 30
+    BULK_DOWNLOAD_MAX_FILES: int = 100  # per batch of links or ZIP archive
+    
+    # Download records are written behind the request in batched transactions
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL_MS: int = 200
+    
+    # Background maintenance: expired download records are moved to the
+    # archive table in batches; archived rows are kept for the retention
+    # period, or forever when it isn't set
+    MAINTENANCE_INTERVAL_SECONDS: int = 60
+    DOWNLOAD_ARCHIVE_AFTER_HOURS: int = 24  # after the link expires
+    DOWNLOAD_ARCHIVE_BATCH_SIZE: int = 1000
+    DOWNLOAD_ARCHIVE_MAX_BATCHES: int = 10  # per maintenance run
+    DOWNLOAD_ARCHIVE_RETENTION_DAYS: Optional[int] = None
+    
+    # Listing pages are cached per worker until the catalog changes; the
+    # catalog version is a counter file shared by the workers on a host
+    LISTING_CACHE_MAX_ENTRIES: int = 256  # per worker; 0 turns the cache off
+    CATALOG_VERSION_FILE: Optional[str] = None  # defaults to one per database in the temp dir
+    
+    # Catalog changes pushed to clients over server-sent events; the event
+    # ring is a file shared by the workers on a host like the catalog version
+    CATALOG_EVENTS_FILE: Optional[str] = None  # defaults to one per database in the temp dir
+    CATALOG_EVENTS_SLOTS: int = 1024  # events kept for reconnecting clients
+    CATALOG_EVENTS_SLOT_SIZE: int = 1024  # bytes; larger events are sent as a resync
+    CATALOG_EVENTS_POLL_MS: int = 200  # how often a worker looks for other workers' events
+    CATALOG_EVENTS_KEEPALIVE_SECONDS: float = 15.0
+    CATALOG_EVENTS_MAX_CONNECTIONS: int = 10000  # per worker
+    
+    # Full-text search over file names and document text. Text is extracted
+    # in the background after upload into SQLite FTS5 (tsvector on
+    # PostgreSQL); the maintenance job indexes anything that was missed
+    SEARCH_MAX_TEXT_CHARS: int = 200_000  # per document; the rest isn't searchable
+    SEARCH_MAX_RANKED: int = 2000  # matches scored per query, newest first
+    SEARCH_INDEX_BATCH_SIZE: int = 50  # files per transaction
+    SEARCH_BACKFILL_BATCH_SIZE: int = 500  # files per maintenance run
+    
+    # Previews: the beginning of each document, slide or sheet, and the
+    # thumbnail Office embeds, made after upload by a pool of processes and
+    # kept per content digest; the maintenance job retries and backfills
+    PREVIEW_WORKERS: int = 1  # processes per worker, each parsing one file at a time; 0 turns previews off
+    PREVIEW_MAX_QUEUED: int = 1000  # per worker; beyond this, files wait for the maintenance job
+    PREVIEW_MAX_ATTEMPTS: int = 3
+    PREVIEW_BACKFILL_BATCH_SIZE: int = 100  # files queued per maintenance run
+    PREVIEW_MAX_CHARS: int = 2000  # of document or first-slide text
+    PREVIEW_MAX_ROWS: int = 20  # of the first sheet
+    PREVIEW_MAX_THUMBNAIL_BYTES: int = 1024 * 1024
+    
+    # Response compression (brotli when installed, otherwise gzip)
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes
+    GZIP_COMPRESSION_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+    
+    # Metrics on /metrics in the Prometheus text format. With several
+    # workers, set METRICS_DIR to a directory they share (emptied before
+    # they start) so any worker can report the totals of all of them.
+    METRICS_ENABLED: bool = True
+    METRICS_DIR: Optional[str] = None
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 5.0
+    METRICS_TOKEN: Optional[str] = None  # require "Authorization: Bearer <token>" to scrape
+    
+    # On-demand profiling: ops users send the header to profile a request,
+    # and a sample rate profiles that share of all requests. Profiles are
+    # collapsed-stack files for flame graphs, listed on /api/profiles.
+    PROFILING_ENABLED: bool = False  # when off the middleware isn't installed
+    PROFILING_HEADER: str = "X-Profile"
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_INTERVAL_MS: float = 5.0
+    PROFILING_MAX_CONCURRENT: int = 2
+    PROFILE_DIR: str = "profiles"
+    PROFILING_MAX_FILES: int = 200
     
     # Email (for production)
     SMTP_SERVER: Optional[str] = None
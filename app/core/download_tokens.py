@@ -0,0 +1,126 @@
+import base64
+import calendar
+import hashlib
+import hmac
+import secrets
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Tuple
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+
+# version, file id, user id, expiry (Unix seconds), token id
+_CLAIMS = struct.Struct(">BQQI8s")
+_VERSION = 1
+_SIGNATURE_BYTES = 16
+
+
+@dataclass(frozen=True)
+class DownloadClaims:
+    file_id: int
+    user_id: int
+    expires_at: datetime
+    token_id: str
+
+
+def _signing_key() -> bytes:
+    # Derived from SECRET_KEY so download links can't be confused with access tokens
+    return hmac.new(settings.SECRET_KEY.encode(), b"download-token", hashlib.sha256).digest()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(payload: bytes) -> bytes:
+    return hmac.new(_signing_key(), payload, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+
+
+def is_signed_download_token(token: str) -> bool:
+    # Database tokens are plain URL-safe base64 and never contain a dot
+    return "." in token
+
+
+def create_signed_download_token(file_id: int, user_id: int, expires_at: datetime) -> str:
+    """Create a compact, self-contained download token.
+
+    The token carries the file, the user and the expiry and is verified with
+    an HMAC, so issuing and checking it needs no database row.
+    """
+    payload = _CLAIMS.pack(
+        _VERSION, file_id, user_id, calendar.timegm(expires_at.utctimetuple()), secrets.token_bytes(8)
+    )
+    return f"{_b64encode(payload)}.{_b64encode(_signature(payload))}"
+
+
+def verify_signed_download_token(token: str) -> DownloadClaims:
+    """Check a signed token's signature and return its claims.
+
+    Expiry and revocation are left to the caller.
+    """
+    try:
+        encoded_payload, encoded_signature = token.split(".")
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+        version, file_id, user_id, expires, token_id = _CLAIMS.unpack(payload)
+    except (ValueError, struct.error):
+        version = None
+    if version != _VERSION or not hmac.compare_digest(signature, _signature(payload)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invalid download link or access denied"
+        )
+    return DownloadClaims(
+        file_id=file_id,
+        user_id=user_id,
+        expires_at=datetime.utcfromtimestamp(expires),
+        token_id=token_id.hex()
+    )
+
+
+class DownloadDenyList:
+    """In-process copy of the revoked signed-token ids.
+
+    Only ids of tokens that have not expired yet are kept, so the list stays
+    small. Revocations made in this process apply immediately; other worker
+    processes see them after their next refresh from the database.
+    """
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._revoked: Dict[str, datetime] = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def needs_refresh(self) -> bool:
+        with self._lock:
+            return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds
+
+    def replace(self, entries: Iterable[Tuple[str, datetime]]) -> None:
+        with self._lock:
+            self._revoked = dict(entries)
+            self._loaded_at = time.monotonic()
+
+    def add(self, token_id: str, expires_at: datetime) -> None:
+        with self._lock:
+            self._revoked[token_id] = expires_at
+
+    def is_revoked(self, token_id: str) -> bool:
+        with self._lock:
+            return token_id in self._revoked
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._revoked)
+
+
+download_deny_list = DownloadDenyList(refresh_seconds=settings.DOWNLOAD_DENY_LIST_REFRESH_SECONDS)
@@ -0,0 +1,270 @@
+import os
+import secrets
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from typing import BinaryIO, Callable, List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# More ranges than this in one request is treated as abuse and served in full
+MAX_RANGES = 16
+
+ByteRange = Tuple[int, int]  # inclusive start and end offsets
+
+
+def read_at(file: BinaryIO, size: int, offset: int) -> bytes:
+    """Read up to size bytes at offset, with pread when the file has a descriptor."""
+    try:
+        fd = file.fileno()
+    except OSError:
+        file.seek(offset)
+        return file.read(size)
+    return os.pread(fd, size, offset)
+
+
+def is_byte_offset(value: str) -> bool:
+    # RFC 9110 allows only ASCII digits: no signs, underscores or whitespace
+    return value.isascii() and value.isdigit()
+
+
+def parse_range_header(value: str, file_size: int) -> Optional[List[ByteRange]]:
+    """Parse a "bytes=" Range header into sorted, coalesced byte ranges.
+
+    Returns None when the header is malformed (and must be ignored) and an
+    empty list when none of the ranges can be satisfied, which is always
+    the case for an empty representation.
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(","):
+        first, dash, last = part.strip().partition("-")
+        if not dash:
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            if not is_byte_offset(last):
+                return None
+            suffix = int(last)
+            if suffix > 0 and file_size > 0:
+                ranges.append((max(file_size - suffix, 0), file_size - 1))
+            continue
+        if not is_byte_offset(first) or (last and not is_byte_offset(last)):
+            return None
+        start = int(first)
+        end = int(last) if last else None
+        if end is not None and end < start:
+            return None
+        if end is None:
+            end = file_size - 1
+        if start < file_size:
+            ranges.append((start, min(end, file_size - 1)))
+    ranges.sort()
+    merged: List[ByteRange] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return formatdate(value.timestamp(), usegmt=True)
+
+
+def parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    # If-None-Match uses weak comparison, so ignore W/ prefixes
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+def content_disposition(filename: str) -> str:
+    quoted_filename = quote(filename)
+    if quoted_filename != filename:
+        return f"attachment; filename*=utf-8''{quoted_filename}"
+    return f'attachment; filename="{filename}"'
+
+
+class FileRangeResponse(Response):
+    """Send a whole file or some byte ranges of it.
+
+    Uses the ASGI zero-copy send extension when the server offers it, so the
+    body goes from the page cache to the socket with os.sendfile; otherwise
+    the file is read in chunks in a worker thread. Content that isn't a
+    local file (path is None) is read from the file object opener returns.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: Optional[str],
+        file_size: int,
+        ranges: Optional[List[ByteRange]],
+        headers: dict,
+        media_type: str,
+        background: Optional[BackgroundTask] = None,
+        opener: Optional[Callable[[], BinaryIO]] = None,
+    ) -> None:
+        self.path = path
+        self.opener = opener or (lambda: open(path, "rb"))
+        self.file_size = file_size
+        self.ranges = ranges
+        self.media_type = media_type
+        self.background = background
+        self.boundary = None
+        self.parts: List[Tuple[bytes, int, int]] = []
+        if ranges is None:
+            self.status_code = 200
+            content_length = file_size
+        elif len(ranges) == 1:
+            self.status_code = 206
+            start, end = ranges[0]
+            headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+            content_length = end - start + 1
+        else:
+            self.status_code = 206
+            self.boundary = secrets.token_hex(16)
+            content_length = 0
+            for start, end in ranges:
+                part_header = (
+                    f"--{self.boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+                ).encode("latin-1")
+                self.parts.append((part_header, start, end - start + 1))
+                content_length += len(part_header) + end - start + 1 + 2
+            content_length += len(self.closing_boundary)
+            self.media_type = f"multipart/byteranges; boundary={self.boundary}"
+        headers["content-length"] = str(content_length)
+        self.init_headers(headers)
+
+    @property
+    def closing_boundary(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # The zero-copy extensions need a local file
+        extensions = (scope.get("extensions") or {}) if self.path is not None else {}
+        zerocopy = "http.response.zerocopysend" in extensions
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if self.ranges is None and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+        else:
+            await self.send_body(send, zerocopy)
+        if self.background is not None:
+            await self.background()
+
+    async def send_body(self, send: Send, zerocopy: bool) -> None:
+        file = await anyio.to_thread.run_sync(self.opener)
+        try:
+            if self.ranges is None:
+                await self.send_span(send, file, 0, self.file_size, False, zerocopy)
+            elif self.boundary is None:
+                start, end = self.ranges[0]
+                await self.send_span(send, file, start, end - start + 1, False, zerocopy)
+            else:
+                for part_header, start, length in self.parts:
+                    await send({"type": "http.response.body", "body": part_header, "more_body": True})
+                    await self.send_span(send, file, start, length, True, zerocopy)
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+                await send({"type": "http.response.body", "body": self.closing_boundary, "more_body": False})
+        finally:
+            await anyio.to_thread.run_sync(file.close)
+
+    async def send_span(self, send: Send, file, offset: int, count: int, more_after: bool, zerocopy: bool) -> None:
+        if zerocopy:
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": file,
+                "offset": offset,
+                "count": count,
+                "more_body": more_after,
+            })
+            return
+        remaining = count
+        while True:
+            chunk = await anyio.to_thread.run_sync(read_at, file, min(self.chunk_size, remaining), offset)
+            offset += len(chunk)
+            remaining -= len(chunk)
+            done = remaining <= 0 or not chunk
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_after or not done})
+            if done:
+                return
+
+
+def conditional_file_response(
+    request: Request,
+    path: Optional[str],
+    file_size: int,
+    filename: str,
+    etag: str,
+    last_modified: datetime,
+    media_type: str = "application/octet-stream",
+    background: Optional[BackgroundTask] = None,
+    opener: Optional[Callable[[], BinaryIO]] = None,
+) -> Response:
+    """Serve a file honouring conditional and Range request headers.
+
+    Handles If-None-Match / If-Modified-Since (304), If-Range, and single or
+    multiple byte ranges (206, or 416 when none can be satisfied). The
+    background task runs after any response other than a 416. Pass opener
+    instead of path for content that isn't a local file.
+    """
+    last_modified_header = http_date(last_modified)
+    headers = {
+        "etag": etag,
+        "last-modified": last_modified_header,
+        "accept-ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers, background=background)
+    else:
+        if_modified_since = parse_http_date(request.headers.get("if-modified-since", ""))
+        if if_modified_since is not None and parse_http_date(last_modified_header) <= if_modified_since:
+            return Response(status_code=304, headers=headers, background=background)
+
+    ranges = None
+    range_header = request.headers.get("range")
+    if range_header is not None:
+        if_range = request.headers.get("if-range")
+        if if_range is None:
+            range_applies = True
+        elif if_range.startswith('"') or if_range.startswith("W/"):
+            # If-Range needs a strong match; anything else means the client's copy is stale
+            range_applies = if_range == etag
+        else:
+            range_applies = if_range == last_modified_header
+        if range_applies:
+            ranges = parse_range_header(range_header, file_size)
+            if ranges == []:
+                headers["content-range"] = f"bytes */{file_size}"
+                return Response(status_code=416, headers=headers)
+
+    headers["content-disposition"] = content_disposition(filename)
+    return FileRangeResponse(path, file_size, ranges, headers, media_type, background, opener)
@@ -0,0 +1,169 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import secrets
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple
+
+from fastapi import Request
+from starlette.responses import Response
+
+from app.core.config import settings
+from app.core.file_responses import etag_matches
+
+
+class CatalogVersion:
+    """A catalog version number shared by every worker on the host.
+
+    Kept in a small file that each process maps into memory, so reading it
+    is a memory load and bumping it takes a file lock. The file also holds
+    a random epoch chosen when it is created; it is part of every ETag, so
+    versions counted again after the file is lost (e.g. on reboot) can't
+    match validators handed out before.
+    """
+
+    _layout = struct.Struct("<QQ")  # epoch, version
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def _mapped(self) -> mmap.mmap:
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    try:
+                        if os.fstat(fd).st_size < self._layout.size:
+                            os.pwrite(fd, self._layout.pack(secrets.randbits(32), 0), 0)
+                    finally:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                    self._fd = fd
+                    self._map = mmap.mmap(fd, self._layout.size)
+        return self._map
+
+    def get(self) -> Tuple[int, int]:
+        return self._layout.unpack_from(self._mapped())
+
+    def bump(self) -> int:
+        """Advance the version; call after committing a change to the catalog."""
+        mapped = self._mapped()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            epoch, version = self._layout.unpack_from(mapped)
+            self._layout.pack_into(mapped, 0, epoch, version + 1)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return version + 1
+
+
+@dataclass
+class CachedPage:
+    version: int
+    body: bytes
+    headers: dict
+
+
+class ListingCache:
+    """Rendered listing pages of this worker, valid for one catalog version.
+
+    Pages are keyed by endpoint, the user when the page depends on who asks,
+    and the query parameters; an entry from an older catalog version is
+    never served. Least recently used entries are evicted past max_entries.
+    """
+
+    def __init__(self, version: CatalogVersion, max_entries: int):
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries: "OrderedDict[tuple, CachedPage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, version: int) -> Optional[CachedPage]:
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None or page.version != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key: tuple, page: CachedPage) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current.version > page.version:
+                return
+            self._entries[key] = page
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        _, version = self.version.get()
+        with self._lock:
+            return {
+                "catalog_version": version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+            }
+
+    async def page(self, request: Request, key: tuple, build: Callable[[], Awaitable[Response]]) -> Response:
+        """Answer a listing request from the cache, with an ETag.
+
+        Returns 304 when the client's ETag still matches and a cached page
+        when there is one; neither touches the database. Otherwise build()
+        renders the page, which is cached under the version read before it
+        ran, so a change committed meanwhile can't be hidden by it.
+        """
+        epoch, version = self.version.get()
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+        opaque_tag = f'"{epoch:x}.{version}-{digest}"'
+        # Weak, since the compression middleware may re-encode the body
+        headers = {"etag": f"W/{opaque_tag}", "cache-control": "private, no-cache"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and etag_matches(if_none_match, opaque_tag):
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        cached = self.get(key, version)
+        if cached is not None:
+            return Response(cached.body, headers={**cached.headers, **headers})
+
+        response = await build()
+        if response.status_code == 200:
+            response.headers.update(headers)
+            self.put(key, CachedPage(version, response.body, dict(response.headers)))
+        return response
+
+
+def default_version_path() -> str:
+    # One counter per database, shared by the workers on this host
+    digest = hashlib.sha256(settings.DATABASE_URL.encode()).hexdigest()[:16]
+    return str(Path(tempfile.gettempdir()) / f"secure-files-catalog-{digest}")
+
+
+catalog_version = CatalogVersion(settings.CATALOG_VERSION_FILE or default_version_path())
+listing_cache = ListingCache(catalog_version, settings.LISTING_CACHE_MAX_ENTRIES)
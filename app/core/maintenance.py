@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import ArchivedDownload, DownloadRecord, RevokedDownloadToken
+
+logger = logging.getLogger(__name__)
+
+_ARCHIVED_COLUMNS = ["id", "user_id", "file_id", "downloaded_at", "expires_at", "is_used"]
+
+
+def archive_expired_downloads(db: Session, before: datetime, batch_size: int, max_batches: int) -> int:
+    """Move download records that expired before `before` into the archive.
+
+    Each batch is copied and deleted in its own transaction, oldest expiry
+    first, so the hot table shrinks steadily without long locks. Returns the
+    number of records moved.
+    """
+    moved = 0
+    for _ in range(max_batches):
+        ids = db.scalars(
+            select(DownloadRecord.id)
+            .where(DownloadRecord.expires_at < before)
+            .order_by(DownloadRecord.expires_at)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        db.execute(insert(ArchivedDownload).from_select(
+            _ARCHIVED_COLUMNS,
+            select(*[getattr(DownloadRecord, name) for name in _ARCHIVED_COLUMNS])
+            .where(DownloadRecord.id.in_(ids))
+        ))
+        db.execute(
+            delete(DownloadRecord)
+            .where(DownloadRecord.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+    return moved
+
+
+def delete_archived_downloads(db: Session, before: datetime, batch_size: int, max_batches: int) -> int:
+    """Delete archived records that expired before `before`, in batches."""
+    deleted = 0
+    for _ in range(max_batches):
+        ids = db.scalars(
+            select(ArchivedDownload.id)
+            .where(ArchivedDownload.expires_at < before)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        db.execute(
+            delete(ArchivedDownload)
+            .where(ArchivedDownload.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def run_download_archival(db: Session) -> int:
+    now = datetime.utcnow()
+    moved = archive_expired_downloads(
+        db,
+        before=now - timedelta(hours=settings.DOWNLOAD_ARCHIVE_AFTER_HOURS),
+        batch_size=settings.DOWNLOAD_ARCHIVE_BATCH_SIZE,
+        max_batches=settings.DOWNLOAD_ARCHIVE_MAX_BATCHES
+    )
+    if settings.DOWNLOAD_ARCHIVE_RETENTION_DAYS is not None:
+        moved += delete_archived_downloads(
+            db,
+            before=now - timedelta(days=settings.DOWNLOAD_ARCHIVE_RETENTION_DAYS),
+            batch_size=settings.DOWNLOAD_ARCHIVE_BATCH_SIZE,
+            max_batches=settings.DOWNLOAD_ARCHIVE_MAX_BATCHES
+        )
+    return moved
+
+
+def delete_expired_revocations(db: Session) -> int:
+    """Delete revoked signed-token ids whose tokens have expired anyway."""
+    result = db.execute(
+        delete(RevokedDownloadToken)
+        .where(RevokedDownloadToken.expires_at < datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+@dataclass
+class _Job:
+    name: str
+    function: Callable[[Session], int]
+    interval: float
+    next_run: float = 0.0
+    runs: int = 0
+    rows: int = 0
+    errors: int = 0
+    last_seconds: float = 0.0
+    last_error: Optional[str] = None
+
+
+class MaintenanceScheduler:
+    """Run periodic database maintenance jobs on a background thread.
+
+    Each job gets its own session and returns the number of rows it
+    touched. Jobs are written to be safe when several worker processes run
+    them at once: a batch that loses a race is rolled back and picked up
+    again on the next run.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session]):
+        self.session_factory = session_factory
+        self.jobs: List[_Job] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_job(self, name: str, function: Callable[[Session], int], interval: float) -> None:
+        self.jobs.append(_Job(name, function, interval))
+
+    def run_pending(self, force: bool = False) -> Dict[str, int]:
+        """Run the jobs that are due, or all of them when force is set."""
+        results = {}
+        for job in self.jobs:
+            now = time.monotonic()
+            if not force and now < job.next_run:
+                continue
+            job.next_run = now + job.interval
+            started = time.perf_counter()
+            try:
+                with self.session_factory() as db:
+                    rows = job.function(db)
+                error = None
+            except Exception as exc:
+                logger.warning("Maintenance job %s failed: %s", job.name, exc)
+                rows, error = 0, exc
+            with self._lock:
+                job.runs += 1
+                job.rows += rows
+                job.last_seconds = time.perf_counter() - started
+                if error is not None:
+                    job.errors += 1
+                    job.last_error = str(error)
+            results[job.name] = rows
+        return results
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.run_pending()
+            next_run = min((job.next_run for job in self.jobs), default=time.monotonic() + 60)
+            self._stop.wait(max(next_run - time.monotonic(), 1))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "jobs": {
+                    job.name: {
+                        "interval_seconds": job.interval,
+                        "runs": job.runs,
+                        "rows": job.rows,
+                        "errors": job.errors,
+                        "last_seconds": job.last_seconds,
+                        "last_error": job.last_error,
+                    }
+                    for job in self.jobs
+                },
+            }
+
+
+maintenance_scheduler = MaintenanceScheduler(SessionLocal)
+maintenance_scheduler.add_job("download_archival", run_download_archival, settings.MAINTENANCE_INTERVAL_SECONDS)
+maintenance_scheduler.add_job("revoked_tokens", delete_expired_revocations, settings.MAINTENANCE_INTERVAL_SECONDS)
@@ -0,0 +1,465 @@
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds; the same buckets for request and query latencies
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], object] = {}
+
+    def samples(self) -> list:
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set_total(self, *labels: str, value: float) -> None:
+        """For collectors that mirror a running total kept elsewhere."""
+        with self.registry.lock:
+            self.values[labels] = value
+
+
+class Gauge(_Metric):
+    """A gauge; across workers the values of live processes are summed."""
+
+    type = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        with self.registry.lock:
+            self.values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def track(self, *labels: str) -> "_Tracked":
+        return _Tracked(self, labels)
+
+
+class _Tracked:
+    def __init__(self, gauge: Gauge, labels: Tuple[str, ...]):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(*self.labels)
+
+    def __exit__(self, *exc_info):
+        self.gauge.dec(*self.labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels: str, value: float) -> None:
+        # Per-bucket (not cumulative) counts plus sum and count
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> list:
+        return [[list(labels), [list(counts), total, count]] for labels, (counts, total, count) in self.values.items()]
+
+
+class MetricsRegistry:
+    """Metrics of this process, rendered in the Prometheus text format.
+
+    With a directory, each worker process writes a snapshot of its metrics
+    there every flush_interval seconds (and whenever it serves a scrape),
+    and a scrape merges every snapshot: counters and histograms are summed
+    over all processes that ever wrote one, gauges over the live ones. Use
+    a directory per deployment and empty it before the workers start.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, _Metric] = {}
+        self.collectors: List[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _add(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self, name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(self, name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(self, name, help, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Register a callback that refreshes gauges right before a snapshot."""
+        self.collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as exc:
+                logger.warning("Metrics collector failed: %s", exc)
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "metrics": {
+                    name: {
+                        "type": metric.type,
+                        "help": metric.help,
+                        "labelnames": list(metric.labelnames),
+                        "buckets": list(getattr(metric, "buckets", [])),
+                        "samples": metric.samples(),
+                    }
+                    for name, metric in self.metrics.items()
+                },
+            }
+
+    # Multi-process aggregation
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    def write_snapshot(self) -> None:
+        if not self.directory:
+            return
+        snapshot = self.snapshot()
+        path = self._snapshot_path(snapshot["pid"])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(snapshot, file)
+        os.replace(temp_path, path)
+
+    def read_snapshots(self) -> List[dict]:
+        if not self.directory:
+            return [self.snapshot()]
+        os.makedirs(self.directory, exist_ok=True)
+        self.write_snapshot()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def start(self) -> None:
+        if not self.directory:
+            return
+        with self.lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self.lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+            self.write_snapshot()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.write_snapshot()
+            except OSError as exc:
+                logger.warning("Could not write metrics snapshot: %s", exc)
+
+    # Rendering
+
+    def render(self) -> str:
+        return render_snapshots(self.read_snapshots())
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge_snapshots(snapshots: List[dict]) -> Dict[str, dict]:
+    merged: Dict[str, dict] = {}
+    for snapshot in snapshots:
+        alive = _process_alive(snapshot["pid"])
+        for name, metric in snapshot["metrics"].items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                if metric["type"] == "histogram":
+                    counts, total, count = value
+                    current = target["samples"].get(key)
+                    if current is None:
+                        target["samples"][key] = [list(counts), total, count]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], counts)]
+                        current[1] += total
+                        current[2] += count
+                else:
+                    target["samples"][key] = target["samples"].get(key, 0) + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_snapshots(snapshots: List[dict]) -> str:
+    lines = []
+    for name, metric in sorted(merge_snapshots(snapshots).items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labelnames"]
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["type"] == "histogram":
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(metric["buckets"]) + [math.inf], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels(names, labels, ('le', _number(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(names, labels)} {count}")
+            else:
+                lines.append(f"{name}{_labels(names, labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Per-request database accounting
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+
+class AppMetrics:
+    """The metrics the service records, in one registry."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests by route and status code", ["method", "route", "status"]
+        )
+        self.request_duration = registry.histogram(
+            "http_request_duration_seconds", "Time until the last byte of the response was sent", ["method", "route"]
+        )
+        self.requests_in_progress = registry.gauge(
+            "http_requests_in_progress", "Requests being handled"
+        )
+        self.request_bytes = registry.counter(
+            "http_request_body_bytes_total", "Request body bytes received", ["route"]
+        )
+        self.response_bytes = registry.counter(
+            "http_response_body_bytes_total", "Response body bytes sent", ["route"]
+        )
+        self.request_queries = registry.histogram(
+            "http_request_db_queries", "Database queries per request", ["route"], buckets=COUNT_BUCKETS
+        )
+        self.request_db_time = registry.histogram(
+            "http_request_db_seconds", "Time spent in database queries per request", ["route"]
+        )
+        self.queries = registry.counter(
+            "db_queries_total", "Database statements executed", ["engine"]
+        )
+        self.query_duration = registry.histogram(
+            "db_query_duration_seconds", "Database statement execution time", ["engine"]
+        )
+        self.uploads_in_progress = registry.gauge(
+            "uploads_in_progress", "Uploads currently streaming in"
+        )
+        self.event_streams = registry.gauge(
+            "catalog_event_streams", "Clients connected to the catalog event stream"
+        )
+        self.pool_connections = registry.gauge(
+            "db_pool_connections", "Connections in the request pool by state", ["state"]
+        )
+        self.pool_checkouts = registry.counter(
+            "db_pool_checkouts_total", "Connections handed out by the request pool"
+        )
+        self.pool_wait = registry.counter(
+            "db_pool_wait_seconds_total", "Time requests waited for a pooled connection"
+        )
+
+    def collect_pool(self, pool_stats: Callable[[], dict]) -> None:
+        """Mirror the request pool's occupancy and wait totals at each snapshot."""
+        def collect() -> None:
+            stats = pool_stats()
+            for state, key in (("checked_out", "checkedout"), ("idle", "checkedin"), ("overflow", "overflow")):
+                if key in stats:
+                    self.pool_connections.set(state, value=stats[key])
+            self.pool_checkouts.set_total(value=stats["checkouts"])
+            self.pool_wait.set_total(value=stats["wait_seconds_total"])
+        self.registry.add_collector(collect)
+
+    def instrument_engine(self, engine, label: str) -> None:
+        """Time every statement run on a (sync) SQLAlchemy engine."""
+        from sqlalchemy import event
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            context._metrics_started = time.perf_counter()
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context._metrics_started
+            self.queries.inc(label)
+            self.query_duration.observe(label, value=elapsed)
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.queries += 1
+                stats.db_seconds += elapsed
+
+        event.listen(engine, "before_cursor_execute", before)
+        event.listen(engine, "after_cursor_execute", after)
+
+
+class MetricsMiddleware:
+    """Record latency, status, body sizes and database use per route.
+
+    Routes are labelled with their path template ("/api/files/{file_id}"),
+    so label cardinality stays fixed; requests that match no route are
+    labelled "unmatched". Latency runs to the last byte of the response,
+    not including background tasks that run after it.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: AppMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        state = {"status": 500, "received": 0, "sent": 0, "finished": None, "length": 0}
+
+        async def counting_receive() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: Message) -> None:
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                state["status"] = message["status"]
+                state["length"] = int(Headers(raw=message["headers"]).get("content-length") or 0)
+            elif message_type == "http.response.body":
+                state["sent"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    state["finished"] = time.perf_counter()
+            elif message_type == "http.response.zerocopysend":
+                state["sent"] += message.get("count") or 0
+                if not message.get("more_body", False):
+                    state["finished"] = time.perf_counter()
+            elif message_type == "http.response.pathsend":
+                state["sent"] += state["length"]
+                state["finished"] = time.perf_counter()
+            await send(message)
+
+        metrics.requests_in_progress.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            metrics.requests_in_progress.dec()
+            _request_stats.reset(token)
+            route = scope.get("route")
+            label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            finished = state["finished"] or time.perf_counter()
+            metrics.requests.inc(method, label, str(state["status"]))
+            metrics.request_duration.observe(method, label, value=finished - started)
+            if state["received"]:
+                metrics.request_bytes.inc(label, amount=state["received"])
+            if state["sent"]:
+                metrics.response_bytes.inc(label, amount=state["sent"])
+            metrics.request_queries.observe(label, value=stats.queries)
+            metrics.request_db_time.observe(label, value=stats.db_seconds)
+
+
+registry = MetricsRegistry(settings.METRICS_DIR, flush_interval=settings.METRICS_FLUSH_INTERVAL_SECONDS)
+app_metrics = AppMetrics(registry)
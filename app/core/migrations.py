@@ -0,0 +1,57 @@
+import fcntl
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+
+from app.core.config import settings
+from app.models import SEARCH_TABLE
+
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+
+
+def alembic_config(url: Optional[str] = None) -> Config:
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("script_location", str(ALEMBIC_INI.parent / "alembic"))
+    config.attributes["url"] = url or settings.DATABASE_URL
+    # Leave the application's logging configuration alone
+    config.attributes["configure_logging"] = False
+    return config
+
+
+def include_object_for(dialect_name: str):
+    """Autogenerate filter that skips indexes meant for other databases.
+
+    Such indexes list their databases in info["dialects"] (next to ddl_if,
+    which create_all follows but autogenerate doesn't). The search index
+    and, on SQLite, the FTS5 tables behind it aren't models either.
+    """
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == "table" and (name == SEARCH_TABLE or name.startswith(f"{SEARCH_TABLE}_")):
+            return False
+        if type_ != "index":
+            return True
+        model_index = compare_to if reflected else object
+        dialects = model_index.info.get("dialects") if model_index is not None else None
+        return dialects is None or dialect_name in dialects
+    return include_object
+
+
+def upgrade_database(url: Optional[str] = None, revision: str = "head") -> None:
+    """Apply migrations up to revision; the same as `alembic upgrade head`.
+
+    Worker processes starting together take turns, so only the first one
+    changes the schema and the rest find it up to date.
+    """
+    url = url or settings.DATABASE_URL
+    digest = hashlib.sha256(url.encode()).hexdigest()[:16]
+    lock_path = Path(tempfile.gettempdir()) / f"secure-files-migrations-{digest}.lock"
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            command.upgrade(alembic_config(url), revision)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,430 @@
+"""
+Reading and checking Office Open XML packages (.docx, .pptx, .xlsx).
+
+Standard library only: the preview and upload validation pools import
+this module in fresh processes, which should start in milliseconds rather
+than load the app.
+"""
+import os
+import posixpath
+import re
+import struct
+import zipfile
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from xml.etree import ElementTree
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+S = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+RELS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+DC = "{http://purl.org/dc/elements/1.1/}"
+CT = "{http://schemas.openxmlformats.org/package/2006/content-types}"
+THUMBNAIL_RELATIONSHIP = "http://schemas.openxmlformats.org/package/2006/relationships/metadata/thumbnail"
+THUMBNAIL_TYPES = {".jpeg": "image/jpeg", ".jpg": "image/jpeg", ".png": "image/png", ".gif": "image/gif"}
+
+# The main part of each kind of package, the content type [Content_Types].xml
+# gives it, and its root element. Macro-enabled and template packages declare
+# other types, so a .docm renamed to .docx doesn't pass for one.
+MAIN_CONTENT = {
+    "docx": (
+        "word/document.xml",
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml",
+        "document",
+    ),
+    "pptx": (
+        "ppt/presentation.xml",
+        "application/vnd.openxmlformats-officedocument.presentationml.presentation.main+xml",
+        "presentation",
+    ),
+    "xlsx": (
+        "xl/workbook.xml",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml",
+        "workbook",
+    ),
+}
+MAIN_PARTS = {part: file_type for file_type, (part, _, _) in MAIN_CONTENT.items()}
+
+MAX_COLUMNS = 50
+MAX_CELL_CHARS = 200
+
+
+def package_type(archive: zipfile.ZipFile) -> Optional[str]:
+    names = set(archive.namelist())
+    return next((file_type for part, file_type in MAIN_PARTS.items() if part in names), None)
+
+
+def elements(archive: zipfile.ZipFile, name: str, clear: frozenset = frozenset()) -> Iterator[ElementTree.Element]:
+    """Elements of a part as each one ends.
+
+    Elements with a tag in clear are emptied once the caller moves on, so
+    a large part can be read in constant memory; their children are still
+    there when the caller sees them.
+    """
+    with archive.open(name) as part:
+        for _, element in ElementTree.iterparse(part):
+            yield element
+            if element.tag in clear:
+                element.clear()
+
+
+def relationships(archive: zipfile.ZipFile, part: str) -> Dict[str, Tuple[str, str]]:
+    """Relationship id -> (type, target part name) for a part ("" for the package)."""
+    folder, name = posixpath.split(part)
+    rels_name = posixpath.join(folder, "_rels", f"{name}.rels")
+    if rels_name not in archive.namelist():
+        return {}
+    found = {}
+    for element in elements(archive, rels_name, frozenset({RELS + "Relationship"})):
+        if element.tag == RELS + "Relationship" and element.get("TargetMode") != "External":
+            target = element.get("Target", "")
+            target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(folder, target))
+            found[element.get("Id")] = (element.get("Type", ""), target)
+    return found
+
+
+def title(archive: zipfile.ZipFile) -> Optional[str]:
+    if "docProps/core.xml" not in archive.namelist():
+        return None
+    for element in elements(archive, "docProps/core.xml"):
+        if element.tag == DC + "title" and element.text:
+            return element.text.strip()[:MAX_CELL_CHARS]
+    return None
+
+
+def thumbnail(archive: zipfile.ZipFile, max_bytes: int) -> Optional[Tuple[bytes, str]]:
+    """The package's embedded thumbnail image and its content type, when there is one."""
+    for kind, target in relationships(archive, "").values():
+        # Only formats browsers show; Windows versions of Office often embed .wmf/.emf metafiles
+        content_type = THUMBNAIL_TYPES.get(posixpath.splitext(target)[1].lower())
+        if kind == THUMBNAIL_RELATIONSHIP and content_type and target in archive.namelist():
+            if archive.getinfo(target).file_size <= max_bytes:
+                return archive.read(target), content_type
+    return None
+
+
+def paragraph_text(archive: zipfile.ZipFile, name: str, text_tag: str, paragraph_tag: str,
+                   max_chars: int, page_break: bool = False) -> str:
+    """Text of a part with one line per paragraph, up to max_chars.
+
+    With page_break, stops at the first page break in a Word document.
+    """
+    pieces: List[str] = []
+    length = 0
+    for element in elements(archive, name, frozenset({paragraph_tag})):
+        if element.tag == text_tag and element.text:
+            pieces.append(element.text)
+            length += len(element.text)
+        elif element.tag == paragraph_tag:
+            pieces.append("\n")
+        elif page_break and length and (
+            element.tag == W + "lastRenderedPageBreak"
+            or (element.tag == W + "br" and element.get(W + "type") == "page")
+        ):
+            break
+        if length >= max_chars:
+            break
+    return "".join(pieces).strip()[:max_chars]
+
+
+def column_index(reference: str) -> int:
+    # "C7" -> 2
+    index = 0
+    for letter in re.match(r"[A-Z]*", reference).group():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def sheet_rows(archive: zipfile.ZipFile, name: str, max_rows: int) -> Tuple[List[list], Dict[int, List[Tuple[int, int]]]]:
+    """The first max_rows rows of a worksheet.
+
+    Cells holding shared strings are left as None and listed by string
+    index, to be filled in once the strings they need are read.
+    """
+    rows: List[list] = []
+    shared: Dict[int, List[Tuple[int, int]]] = {}
+    cells: Dict[int, tuple] = {}
+    for element in elements(archive, name, frozenset({S + "row"})):
+        if element.tag == S + "c":
+            column = column_index(element.get("r", "")) if element.get("r") else len(cells)
+            if column < MAX_COLUMNS:
+                value = element.find(S + "v")
+                if element.get("t") == "inlineStr":
+                    cells[column] = ("text", "".join(node.text or "" for node in element.iter(S + "t")))
+                elif value is not None and value.text is not None:
+                    cells[column] = ("shared" if element.get("t") == "s" else "text", value.text)
+        elif element.tag == S + "row":
+            row = [None] * (max(cells) + 1 if cells else 0)
+            for column, (kind, value) in cells.items():
+                if kind == "shared" and value.isdigit():
+                    shared.setdefault(int(value), []).append((len(rows), column))
+                else:
+                    row[column] = value[:MAX_CELL_CHARS]
+            rows.append(row)
+            cells = {}
+            if len(rows) >= max_rows:
+                break
+    return rows, shared
+
+
+def fill_shared_strings(archive: zipfile.ZipFile, rows: List[list], shared: Dict[int, List[Tuple[int, int]]]) -> None:
+    # Read only as far into the shared strings as the last one the rows use
+    if not shared or "xl/sharedStrings.xml" not in archive.namelist():
+        return
+    last = max(shared)
+    index = 0
+    for element in elements(archive, "xl/sharedStrings.xml", frozenset({S + "si"})):
+        if element.tag == S + "si":
+            text = "".join(node.text or "" for node in element.iter(S + "t"))[:MAX_CELL_CHARS]
+            for row, column in shared.get(index, ()):
+                rows[row][column] = text
+            index += 1
+            if index > last:
+                return
+
+
+def preview_document(archive: zipfile.ZipFile, max_chars: int) -> dict:
+    return {"text": paragraph_text(archive, "word/document.xml", W + "t", W + "p", max_chars, page_break=True)}
+
+
+def preview_presentation(archive: zipfile.ZipFile, max_chars: int) -> dict:
+    slides = relationships(archive, "ppt/presentation.xml")
+    order = [
+        slides[element.get(R + "id")][1]
+        for element in elements(archive, "ppt/presentation.xml")
+        if element.tag == P + "sldId" and element.get(R + "id") in slides
+    ]
+    first = order[0] if order and order[0] in archive.namelist() else None
+    return {
+        "slides": len(order),
+        "text": paragraph_text(archive, first, A + "t", A + "p", max_chars) if first else "",
+    }
+
+
+def preview_workbook(archive: zipfile.ZipFile, max_rows: int) -> dict:
+    parts = relationships(archive, "xl/workbook.xml")
+    sheets = [
+        (element.get("name", ""), parts.get(element.get(R + "id"), ("", ""))[1])
+        for element in elements(archive, "xl/workbook.xml")
+        if element.tag == S + "sheet"
+    ]
+    rows: List[list] = []
+    if sheets and sheets[0][1] in archive.namelist():
+        rows, shared = sheet_rows(archive, sheets[0][1], max_rows)
+        fill_shared_strings(archive, rows, shared)
+    return {"sheets": [name for name, _ in sheets], "rows": rows}
+
+
+def read_preview(path: str, max_chars: int, max_rows: int, max_thumbnail_bytes: int) -> dict:
+    """A lightweight preview of the package at path.
+
+    The beginning of a document up to its first page break, the slide
+    count and first slide's text of a presentation, or the sheet names and
+    first rows of a workbook's first sheet, plus the title and the
+    thumbnail image Office embeds when saving (under "thumbnail" as bytes
+    and "thumbnail_type"). Returns {"type": None} for files that aren't
+    readable packages; parts are streamed, so memory stays small.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            file_type = package_type(archive)
+            if file_type is None:
+                return {"type": None, "error": "Not an Office Open XML package"}
+            if file_type == "docx":
+                preview = preview_document(archive, max_chars)
+            elif file_type == "pptx":
+                preview = preview_presentation(archive, max_chars)
+            else:
+                preview = preview_workbook(archive, max_rows)
+            preview = {"type": file_type, "title": title(archive), **preview}
+            embedded = thumbnail(archive, max_thumbnail_bytes)
+            if embedded:
+                preview["thumbnail"], preview["thumbnail_type"] = embedded
+            return preview
+    except (zipfile.BadZipFile, ElementTree.ParseError, KeyError, EOFError, NotImplementedError,
+            zlib.error, UnicodeDecodeError) as exc:
+        return {"type": None, "error": f"{type(exc).__name__}: {exc}"[:200]}
+
+
+# Package checks for uploads
+#
+# check_structure reads only the first bytes and the central directory at
+# the end of the file. Declared sizes can be trusted: zipfile never inflates
+# a part past the size its entry declares, and fails on a CRC mismatch.
+# check_contents inflates [Content_Types].xml and the start of the main part.
+
+ZIP_MAGIC = b"PK\x03\x04"
+END_OF_DIRECTORY = struct.Struct("<4s4H2LH")
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_END_OF_DIRECTORY = struct.Struct("<4sQ2H2L4Q")
+DIRECTORY_ENTRY = struct.Struct("<4s6H3L5H2L")
+LOCAL_HEADER_SIZE = 30
+MAX_COMMENT_SIZE = 0xFFFF
+# Small parts may compress as well as they like; XML often does
+RATIO_GRACE_SIZE = 100 * 1024
+
+
+class InvalidPackage(ValueError):
+    """A file that isn't the Office Open XML package it claims to be."""
+
+
+class DirectoryEntry(NamedTuple):
+    name: str
+    flags: int
+    method: int
+    compressed_size: int
+    file_size: int
+    offset: int
+
+
+def zip64_values(extra: bytes, file_size: int, compressed_size: int, offset: int) -> Tuple[int, int, int]:
+    # The ZIP64 extra field holds, in order, each value its entry set to 0xFFFFFFFF
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<2H", extra, position)
+        if header_id == 0x0001:
+            values = extra[position + 4:position + 4 + size]
+            fields = [file_size, compressed_size, offset]
+            index = 0
+            for field, value in enumerate(fields):
+                if value == 0xFFFFFFFF:
+                    if index + 8 > len(values):
+                        raise InvalidPackage("Corrupt ZIP64 extra field")
+                    fields[field] = struct.unpack_from("<Q", values, index)[0]
+                    index += 8
+            return fields[0], fields[1], fields[2]
+        position += 4 + size
+    raise InvalidPackage("Missing ZIP64 extra field")
+
+
+def central_directory(path: str, max_entries: int) -> Tuple[List[DirectoryEntry], int]:
+    """The entries of a ZIP file's central directory, and the directory's offset.
+
+    Reads the end of the file to find the directory, then the directory
+    itself; the parts are never read.
+    """
+    with open(path, "rb") as source:
+        size = source.seek(0, os.SEEK_END)
+        tail_start = max(0, size - END_OF_DIRECTORY.size - MAX_COMMENT_SIZE)
+        source.seek(tail_start)
+        tail = source.read()
+        # A comment may contain the signature too; the real record's comment ends the file
+        end = tail.rfind(b"PK\x05\x06", 0, len(tail) - END_OF_DIRECTORY.size + 4)
+        while end >= 0:
+            record = END_OF_DIRECTORY.unpack_from(tail, end)
+            if end + END_OF_DIRECTORY.size + record[7] == len(tail):
+                break
+            end = tail.rfind(b"PK\x05\x06", 0, end + 3)
+        if end < 0:
+            raise InvalidPackage("No ZIP central directory")
+        _, disk, directory_disk, _, count, directory_size, directory_offset, _ = record
+        directory_end = tail_start + end
+        if disk or directory_disk:
+            raise InvalidPackage("Split ZIP archives aren't supported")
+        if 0xFFFF == count or 0xFFFFFFFF in (directory_size, directory_offset):
+            locator = end - ZIP64_LOCATOR.size
+            if locator < 0 or tail[locator:locator + 4] != b"PK\x06\x07":
+                raise InvalidPackage("No ZIP64 central directory")
+            directory_end = ZIP64_LOCATOR.unpack_from(tail, locator)[2]
+            source.seek(directory_end)
+            data = source.read(ZIP64_END_OF_DIRECTORY.size)
+            if len(data) < ZIP64_END_OF_DIRECTORY.size or data[:4] != b"PK\x06\x06":
+                raise InvalidPackage("No ZIP64 central directory")
+            count, directory_size, directory_offset = ZIP64_END_OF_DIRECTORY.unpack(data)[7:]
+        if count > max_entries:
+            raise InvalidPackage(f"More than {max_entries} parts")
+        if directory_offset + directory_size > directory_end:
+            raise InvalidPackage("ZIP central directory out of bounds")
+        source.seek(directory_offset)
+        directory = source.read(directory_size)
+
+    entries: List[DirectoryEntry] = []
+    position = 0
+    for _ in range(count):
+        if directory[position:position + 4] != b"PK\x01\x02" or position + DIRECTORY_ENTRY.size > len(directory):
+            raise InvalidPackage("Corrupt ZIP central directory")
+        fields = DIRECTORY_ENTRY.unpack_from(directory, position)
+        flags, method, compressed_size, file_size = fields[3], fields[4], fields[8], fields[9]
+        name_size, extra_size, comment_size, offset = fields[10], fields[11], fields[12], fields[16]
+        position += DIRECTORY_ENTRY.size
+        try:
+            name = directory[position:position + name_size].decode("utf-8" if flags & 0x800 else "cp437")
+        except UnicodeDecodeError as exc:
+            raise InvalidPackage("Corrupt ZIP central directory") from exc
+        extra = directory[position + name_size:position + name_size + extra_size]
+        position += name_size + extra_size + comment_size
+        if position > len(directory):
+            raise InvalidPackage("Corrupt ZIP central directory")
+        if 0xFFFFFFFF in (file_size, compressed_size, offset):
+            file_size, compressed_size, offset = zip64_values(extra, file_size, compressed_size, offset)
+        entries.append(DirectoryEntry(name, flags, method, compressed_size, file_size, offset))
+    return entries, directory_offset
+
+
+def check_structure(path: str, file_type: str, max_entries: int, max_uncompressed_size: int,
+                    max_ratio: int) -> None:
+    """Raise InvalidPackage unless the file's ZIP directory fits a package of file_type.
+
+    Checks the magic bytes, that the parts don't overlap (as in zip bombs
+    that reuse one compressed stream for many entries), are neither
+    encrypted nor compressed with anything but deflate, and don't expand
+    too far, and that [Content_Types].xml and the main part are there.
+    """
+    with open(path, "rb") as source:
+        if source.read(len(ZIP_MAGIC)) != ZIP_MAGIC:
+            raise InvalidPackage("Not a ZIP archive")
+    entries, directory_offset = central_directory(path, max_entries)
+    names = set()
+    total_size = 0
+    data_end = 0
+    for entry in sorted(entries, key=lambda entry: entry.offset):
+        if entry.name in names:
+            raise InvalidPackage(f"Duplicate part {entry.name}")
+        names.add(entry.name)
+        if entry.flags & 0x1:
+            raise InvalidPackage(f"Encrypted part {entry.name}")
+        if entry.method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise InvalidPackage(f"Unsupported compression in {entry.name}")
+        if entry.offset < data_end:
+            raise InvalidPackage(f"Part {entry.name} overlaps another")
+        data_end = entry.offset + LOCAL_HEADER_SIZE + entry.compressed_size
+        if entry.file_size > RATIO_GRACE_SIZE and entry.file_size > entry.compressed_size * max_ratio:
+            raise InvalidPackage(f"Part {entry.name} expands more than {max_ratio} times")
+        total_size += entry.file_size
+    if data_end > directory_offset:
+        raise InvalidPackage("Parts overlap the ZIP central directory")
+    if total_size > max_uncompressed_size:
+        raise InvalidPackage(f"Parts expand to more than {max_uncompressed_size} bytes")
+    for required in ("[Content_Types].xml", MAIN_CONTENT[file_type][0]):
+        if required not in names:
+            raise InvalidPackage(f"Missing {required}")
+
+
+def check_contents(path: str, file_type: str) -> None:
+    """Raise InvalidPackage unless [Content_Types].xml and the main part are those of file_type.
+
+    Run after check_structure, which bounds what is inflated here.
+    """
+    main_part, content_type, root = MAIN_CONTENT[file_type]
+    try:
+        with zipfile.ZipFile(path) as archive:
+            defaults: Dict[str, str] = {}
+            overrides: Dict[str, str] = {}
+            for element in elements(archive, "[Content_Types].xml", frozenset({CT + "Default", CT + "Override"})):
+                if element.tag == CT + "Default":
+                    defaults[element.get("Extension", "").lower()] = element.get("ContentType", "")
+                elif element.tag == CT + "Override":
+                    overrides[element.get("PartName", "").lower()] = element.get("ContentType", "")
+            # Part names compare case-insensitively
+            declared = overrides.get(f"/{main_part}") or defaults.get(posixpath.splitext(main_part)[1][1:])
+            if declared != content_type:
+                raise InvalidPackage(f"{main_part} is {declared or 'undeclared'}, not a {file_type} main part")
+            with archive.open(main_part) as part:
+                _, element = next(ElementTree.iterparse(part, events=("start",)))
+            if element.tag.rsplit("}", 1)[-1] != root:
+                raise InvalidPackage(f"{main_part} isn't a {file_type} main part")
+    except (zipfile.BadZipFile, ElementTree.ParseError, KeyError, EOFError, StopIteration,
+            zlib.error, UnicodeDecodeError) as exc:
+        raise InvalidPackage(f"{type(exc).__name__}: {exc}"[:200]) from exc
@@ -0,0 +1,77 @@
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, expected_length: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        values = None
+    if not isinstance(values, list) or len(values) != expected_length:
+        raise invalid_cursor_error()
+    return values
+
+
+def invalid_cursor_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid pagination cursor"
+    )
+
+
+def matches_key(value: Any, key) -> bool:
+    """Whether a decoded cursor value has the Python type of key's column."""
+    # bool is an int subclass, but never a sort key value
+    return isinstance(value, key.type.python_type) and not isinstance(value, bool)
+
+
+async def keyset_page(
+    db: AsyncSession,
+    statement: Select,
+    keys: list,
+    descending: bool,
+    cursor: Optional[str],
+    limit: int,
+) -> Tuple[List[Any], Optional[str]]:
+    """Fetch one page of statement ordered by keys, continuing after cursor.
+
+    keys are the mapped attributes that make up a unique sort key of the
+    queried entity, most significant first, all sorted in the same direction.
+    Seeking from the last row seen keeps every page an index range scan
+    instead of an ever-growing OFFSET.
+    """
+    if cursor:
+        after = decode_cursor(cursor, len(keys))
+        if not all(matches_key(value, key) for value, key in zip(after, keys)):
+            raise invalid_cursor_error()
+        conditions = []
+        for position, key in enumerate(keys):
+            prefix = [keys[i] == after[i] for i in range(position)]
+            beyond = key < after[position] if descending else key > after[position]
+            conditions.append(and_(*prefix, beyond))
+        statement = statement.where(or_(*conditions))
+    ordering = [key.desc() if descending else key.asc() for key in keys]
+    result = await db.scalars(statement.order_by(*ordering).limit(limit + 1))
+    rows = result.unique().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+    return rows, next_cursor
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
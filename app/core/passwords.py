@@ -0,0 +1,86 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Optional, Tuple, Union
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.security import get_pwd_context
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool.
+
+    bcrypt releases the GIL while it works, so hashing on these threads keeps
+    the event loop free to serve other requests. At most max_pending calls
+    may be running or queued; beyond that callers get a 503 straight away
+    instead of waiting behind a login storm. context may be a function
+    returning the CryptContext, called on first use.
+    """
+
+    def __init__(self, context: Union["CryptContext", Callable[[], "CryptContext"]], max_workers: int, max_pending: int):
+        self._context = context
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.completed = 0
+        self.rejected = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+
+    @property
+    def context(self) -> "CryptContext":
+        if callable(self._context):
+            self._context = self._context()
+        return self._context
+
+    async def run(self, function: Callable, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many sign-ins in progress, please retry shortly",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+        future = self._executor.submit(function, *args)
+        # Release the slot when the work finishes, even if the caller gave up waiting
+        future.add_done_callback(self._finished)
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Check a password, returning a replacement hash when the stored one
+        was made with different settings (e.g. an older bcrypt cost)."""
+        return await self.run(self.context.verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+            }
+
+
+password_hasher = PasswordHasher(
+    get_pwd_context,
+    max_workers=settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
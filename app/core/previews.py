@@ -0,0 +1,258 @@
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Callable, List, Optional, Set, Tuple
+
+import orjson
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.maintenance import maintenance_scheduler
+from app.core.ooxml import read_preview
+from app.core.storage import StorageBackend, object_key, storage
+from app.database import SessionLocal
+from app.models import FilePreview, StoredBlob
+
+logger = logging.getLogger(__name__)
+
+# Bump when the preview format changes; older rows are then made again
+PREVIEW_VERSION = 1
+THUMBNAIL_EXTENSIONS = {"image/jpeg": ".jpeg", "image/png": ".png", "image/gif": ".gif"}
+
+_STOP = object()
+
+
+def thumbnail_key(sha256: str, content_type: str) -> str:
+    # Named by content and version, so every run of a job writes the same object
+    return object_key(f"{sha256}-preview{PREVIEW_VERSION}{THUMBNAIL_EXTENSIONS[content_type]}")
+
+
+class PreviewGenerator:
+    """Makes previews of stored documents in a pool of processes.
+
+    Uploads queue their content digest after committing. `workers` threads
+    in each worker process take digests off a bounded queue and run one job
+    each at a time in a pool of as many processes, so at most that many
+    documents are parsed at once and parsing never holds the GIL of the
+    process serving requests. A queue that is full drops the digest; the
+    previews maintenance job queues it again later, along with files stored
+    before previews existed and failed jobs (up to max_attempts).
+
+    A job is keyed by digest and PREVIEW_VERSION and skips content that
+    already has a preview, so running it again after a crash, a retry, or
+    in two workers at once writes the same row and thumbnail.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], store: StorageBackend, workers: int,
+                 max_queued: int, max_attempts: int, backfill_size: int, limits: dict):
+        self.session_factory = session_factory
+        self.storage = store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backfill_size = backfill_size
+        self.limits = limits
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_job_seconds = 0.0
+        self._queue: "queue.Queue" = queue.Queue(max_queued)
+        self._queued: Set[str] = set()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def add(self, sha256: Optional[str], storage_key: str) -> bool:
+        """Queue a preview for stored content; False when it wasn't queued."""
+        if not sha256 or self.workers <= 0:
+            return False
+        with self._lock:
+            if sha256 in self._queued:
+                return True
+            if not self._threads:
+                self._threads = [
+                    threading.Thread(target=self._run, name=f"previews-{number}", daemon=True)
+                    for number in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+            try:
+                self._queue.put_nowait((sha256, storage_key))
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._queued.add(sha256)
+        return True
+
+    def flush(self) -> None:
+        """Wait until every queued preview is made."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Finish the queued previews and stop the threads and the pool."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Spawned rather than forked: forking a process that runs threads can
+                # copy a lock mid-use. The jobs only import the standard library, so
+                # a new process starts quickly; recycling them bounds any leaks.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    max_tasks_per_child=100,
+                )
+            return self._pool
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                sha256, storage_key = item
+                try:
+                    self.process(sha256, storage_key)
+                except Exception as exc:
+                    logger.warning("Preview of %s failed: %s", sha256, exc)
+                finally:
+                    with self._lock:
+                        self._queued.discard(sha256)
+            finally:
+                self._queue.task_done()
+
+    def _read(self, storage_key: str) -> dict:
+        path = self.storage.local_path(storage_key)
+        if path is not None:
+            return self.pool().submit(read_preview, path, **self.limits).result()
+        # The pool reads a local file; copy other backends' objects to one first
+        fd, temp_path = tempfile.mkstemp(suffix=".preview", dir=settings.UPLOAD_DIR)
+        try:
+            with os.fdopen(fd, "wb") as temp, self.storage.open(storage_key) as source:
+                while chunk := source.read(1024 * 1024):
+                    temp.write(chunk)
+            return self.pool().submit(read_preview, temp_path, **self.limits).result()
+        finally:
+            os.unlink(temp_path)
+
+    def process(self, sha256: str, storage_key: str) -> str:
+        """Make the preview for stored content unless it has one; returns its status."""
+        started = time.perf_counter()
+        with self.session_factory() as db:
+            existing = db.get(FilePreview, sha256)
+            if existing is not None and existing.version == PREVIEW_VERSION and existing.status != "failed":
+                with self._lock:
+                    self.skipped += 1
+                return existing.status
+            attempts = existing.attempts if existing is not None and existing.version == PREVIEW_VERSION else 0
+        # No connection is held while the document is parsed
+        try:
+            preview = self._read(storage_key)
+            error = None
+        except BrokenProcessPool as exc:
+            # A pool process died (killed, or out of memory); start a new pool for the next job
+            with self._lock:
+                pool, self._pool = self._pool, None
+            if pool is not None:
+                pool.shutdown(wait=False)
+            preview, error = None, exc
+        except Exception as exc:
+            preview, error = None, exc
+
+        row = FilePreview(sha256=sha256, version=PREVIEW_VERSION, attempts=attempts + 1, updated_at=datetime.utcnow())
+        if error is not None:
+            row.status, row.error = "failed", f"{type(error).__name__}: {error}"[:200]
+        elif preview.pop("type") is None:
+            row.status, row.error = "unavailable", preview.pop("error")
+        else:
+            row.status = "ready"
+            thumbnail = preview.pop("thumbnail", None)
+            content_type = preview.pop("thumbnail_type", None)
+            if thumbnail is not None:
+                row.thumbnail_key, row.thumbnail_type = thumbnail_key(sha256, content_type), content_type
+                self.storage.put_stream(io.BytesIO(thumbnail), row.thumbnail_key)
+            row.content = orjson.dumps(preview).decode()
+        self.save(row)
+        with self._lock:
+            if row.status == "failed":
+                self.failed += 1
+            else:
+                self.completed += 1
+            self.last_job_seconds = time.perf_counter() - started
+        return row.status
+
+    def save(self, row: FilePreview) -> None:
+        with self.session_factory() as db:
+            # The content may have been deleted while its preview was made
+            if db.get(StoredBlob, row.sha256) is None:
+                if row.thumbnail_key:
+                    self.storage.delete(row.thumbnail_key)
+                return
+            db.merge(row)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker wrote the same preview first
+                db.rollback()
+
+    def queue_missing(self, db: Session) -> int:
+        """Maintenance job: queue content without a current preview, and failed jobs to retry."""
+        missing: List[Tuple[str, str]] = db.execute(
+            select(StoredBlob.sha256, StoredBlob.storage_key)
+            .outerjoin(FilePreview, FilePreview.sha256 == StoredBlob.sha256)
+            .where(or_(
+                FilePreview.sha256.is_(None),
+                FilePreview.version < PREVIEW_VERSION,
+                and_(FilePreview.status == "failed", FilePreview.attempts < self.max_attempts),
+            ))
+            .limit(self.backfill_size)
+        ).all()
+        return sum(self.add(sha256, storage_key) for sha256, storage_key in missing)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "completed": self.completed,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "last_job_seconds": self.last_job_seconds,
+            }
+
+
+preview_generator = PreviewGenerator(
+    SessionLocal,
+    storage,
+    workers=settings.PREVIEW_WORKERS,
+    max_queued=settings.PREVIEW_MAX_QUEUED,
+    max_attempts=settings.PREVIEW_MAX_ATTEMPTS,
+    backfill_size=settings.PREVIEW_BACKFILL_BATCH_SIZE,
+    limits={
+        "max_chars": settings.PREVIEW_MAX_CHARS,
+        "max_rows": settings.PREVIEW_MAX_ROWS,
+        "max_thumbnail_bytes": settings.PREVIEW_MAX_THUMBNAIL_BYTES,
+    },
+)
+maintenance_scheduler.add_job("previews", preview_generator.queue_missing, settings.MAINTENANCE_INTERVAL_SECONDS)
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Immutable snapshot of the authenticated user.
+
+    Handed to route handlers instead of the ORM row so it can be cached and
+    shared between requests.
+    """
+    id: int
+    email: str
+    user_type: str
+    is_verified: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            user_type=user.user_type,
+            is_verified=user.is_verified,
+            created_at=user.created_at
+        )
+
+
+class PrincipalCache:
+    """Bounded LRU cache of principals keyed by access token.
+
+    Entries live for at most ttl_seconds and never past the token's own
+    expiry. Changes to a user made in this process invalidate its entries
+    immediately; other worker processes pick them up when their entries
+    expire, so the TTL bounds how stale another worker can be.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, Tuple[float, Principal]]" = OrderedDict()
+        self._tokens_by_email: Dict[str, Set[str]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._discard(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self, email: str) -> int:
+        with self._lock:
+            return self._generations.get(email, 0)
+
+    def put(self, token: str, principal: Principal, token_expires_at: float, generation: int) -> None:
+        """Cache a principal loaded while the user was at generation.
+
+        A snapshot read before a concurrent invalidation is dropped rather
+        than cached. token_expires_at is a Unix timestamp.
+        """
+        lifetime = min(self.ttl_seconds, token_expires_at - time.time())
+        if lifetime <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            if self._generations.get(principal.email, 0) != generation:
+                return
+            self._discard(token)
+            self._entries[token] = (time.monotonic() + lifetime, principal)
+            self._tokens_by_email.setdefault(principal.email, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_email(self, email: str) -> None:
+        with self._lock:
+            self._generations[email] = self._generations.get(email, 0) + 1
+            for token in list(self._tokens_by_email.get(email, ())):
+                self._discard(token)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_email.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    def _discard(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        email = entry[1].email
+        tokens = self._tokens_by_email.get(email)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_email[email]
+
+
+principal_cache = PrincipalCache(
+    max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import anyio
+from fastapi import HTTPException
+from sqlalchemy import select
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.principal_cache import principal_cache
+from app.core.security import decode_access_token
+from app.database import SessionLocal
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+STDLIB = os.path.dirname(os.__file__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    if "site-packages" + os.sep in path:
+        path = path.rsplit("site-packages" + os.sep, 1)[1]
+    else:
+        for prefix in (os.getcwd(), STDLIB):
+            if path.startswith(prefix + os.sep):
+                path = path[len(prefix) + 1:]
+                break
+    # ";" separates frames in the collapsed format
+    return f"{code.co_qualname} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _awaited_object_frame(obj):
+    return getattr(obj, "cr_frame", None) or getattr(obj, "gi_frame", None) or getattr(obj, "ag_frame", None)
+
+
+class Sampler:
+    """Wall-clock sampler for the request running in one asyncio task.
+
+    A thread wakes every interval and records the task's stack below the
+    frame that started it. While the task runs, that is the event-loop
+    thread's stack; while it is suspended, it is the chain of coroutines the
+    task is awaiting, ending in a "<await ...>" leaf for what it waits on
+    (a database driver, the thread pool, the network). Work the task hands
+    to other tasks or threads shows up as that wait.
+    """
+
+    def __init__(self, root_frame, task, interval: float):
+        self.root_frame = root_frame
+        self.task = task
+        self.interval = interval
+        self.loop_thread_id = threading.get_ident()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            stack = self._running_stack()
+            if stack is None:
+                stack = self._suspended_stack()
+            if stack:
+                self.stacks[";".join(stack)] += 1
+                self.samples += 1
+
+    def _running_stack(self) -> Optional[List[str]]:
+        frame = sys._current_frames().get(self.loop_thread_id)
+        frames = []
+        while frame is not None and frame is not self.root_frame:
+            frames.append(frame)
+            frame = frame.f_back
+        if frame is None:
+            # Another task is on the loop
+            return None
+        return [_frame_label(frame) for frame in reversed(frames)]
+
+    def _suspended_stack(self) -> List[str]:
+        awaited = self.task.get_coro()
+        labels = []
+        below_root = False
+        while awaited is not None:
+            frame = _awaited_object_frame(awaited)
+            if frame is None:
+                break
+            if below_root:
+                labels.append(_frame_label(frame))
+            elif frame is self.root_frame:
+                below_root = True
+            awaited = (
+                getattr(awaited, "cr_await", None)
+                or getattr(awaited, "gi_yieldfrom", None)
+                or getattr(awaited, "ag_await", None)
+            )
+        if not below_root:
+            return []
+        labels.append(f"<await {type(awaited).__name__}>" if awaited is not None else "<await>")
+        return labels
+
+
+class ProfileStore:
+    """Collapsed-stack profiles on disk, one file per profiled request.
+
+    Each profile is written as "{id}.folded", one "frame;frame;frame count"
+    line per distinct stack, which flamegraph.pl, speedscope and inferno
+    read as is, next to a "{id}.json" with what was profiled. Only the
+    newest max_files profiles are kept.
+    """
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+
+    def path(self, profile_id: str) -> Optional[Path]:
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = Path(self.directory) / f"{profile_id}.folded"
+        return path if path.exists() else None
+
+    def save(self, profile_id: str, stacks: Counter, info: dict) -> None:
+        directory = Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        folded = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        (directory / f"{profile_id}.folded").write_text(folded)
+        (directory / f"{profile_id}.json").write_text(json.dumps({"id": profile_id, **info}))
+        self.prune()
+
+    def list(self) -> List[dict]:
+        profiles = []
+        for path in Path(self.directory).glob("*.json"):
+            try:
+                profiles.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        profiles.sort(key=lambda profile: profile["created_at"], reverse=True)
+        return profiles
+
+    def prune(self) -> None:
+        for profile in self.list()[self.max_files:]:
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(Path(self.directory) / f"{profile['id']}{suffix}")
+                except FileNotFoundError:
+                    pass
+
+
+class Profiler:
+    """Decides which requests to profile and keeps the results.
+
+    A request is profiled when an ops user sends the trigger header or when
+    it is picked by the sample rate, and at most max_concurrent requests
+    are profiled at a time.
+    """
+
+    def __init__(self, store: ProfileStore, session_factory: Callable = SessionLocal):
+        self.store = store
+        self.session_factory = session_factory
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self._active >= settings.PROFILING_MAX_CONCURRENT:
+                return False
+            self._active += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._active -= 1
+
+    def _user_type(self, email: str) -> Optional[str]:
+        db = self.session_factory()
+        try:
+            return db.scalar(select(User.user_type).where(User.email == email))
+        finally:
+            db.close()
+
+    async def is_ops_request(self, headers: Headers) -> bool:
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+        try:
+            email = decode_access_token(token)["sub"]
+        except HTTPException:
+            return False
+        principal = principal_cache.get(token)
+        if principal is not None:
+            return principal.user_type == "ops"
+        return await anyio.to_thread.run_sync(self._user_type, email) == "ops"
+
+
+class ProfilingMiddleware:
+    """Profile requests on demand and return the profile id in a header.
+
+    Wraps routing, dependency resolution (get_current_user, get_db) and the
+    handler, up to the last byte of the response. Requests that are not
+    profiled only pay for a header lookup and, with a sample rate, a random
+    draw; with profiling disabled the middleware isn't installed at all.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = None
+        headers = Headers(scope=scope)
+        if settings.PROFILING_HEADER in headers:
+            if await self.profiler.is_ops_request(headers):
+                trigger = "header"
+        elif settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            trigger = "sample"
+        if trigger is None or not self.profiler.acquire():
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self._profile(scope, receive, send, trigger)
+        finally:
+            self.profiler.release()
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send, trigger: str) -> None:
+        profile_id = uuid.uuid4().hex
+        state = {"status": 500}
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+            await send(message)
+
+        sampler = Sampler(sys._getframe(), asyncio.current_task(), settings.PROFILING_INTERVAL_MS / 1000)
+        created_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            duration = time.perf_counter() - started
+            stacks = await anyio.to_thread.run_sync(sampler.stop)
+            route = scope.get("route")
+            info = {
+                "created_at": created_at.isoformat(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "status": state["status"],
+                "trigger": trigger,
+                "duration_ms": round(duration * 1000, 3),
+                "interval_ms": settings.PROFILING_INTERVAL_MS,
+                "samples": sampler.samples,
+            }
+            try:
+                await anyio.to_thread.run_sync(self.profiler.store.save, profile_id, stacks, info)
+            except OSError as exc:
+                logger.warning("Could not save profile %s: %s", profile_id, exc)
+
+
+profiler = Profiler(ProfileStore(settings.PROFILE_DIR, settings.PROFILING_MAX_FILES))
@@ -0,0 +1,181 @@
+"""Move stored files into the fan-out key layout and between backends.
+
+    python -m app.core.rehome                      # re-layout the configured backend
+    python -m app.core.rehome --to s3 --workers 16 # copy everything to S3 as well
+
+Every object whose key isn't in the fan-out layout yet (files stored in the
+flat UPLOAD_DIR before storage keys existed) gets its new key in the source
+backend, and a copy under that key in the target backend when that is a
+different one. Rows are switched to the new key in one transaction per
+batch, after their objects are in place, so the app keeps serving files
+while this runs. Old keys are deleted from the source afterwards when
+moving within one backend, or with --delete-source.
+
+To move to another backend: run with --to, point STORAGE_BACKEND at the
+new backend, then run again with --from the old one to copy anything
+uploaded in between (objects already copied are skipped).
+"""
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from app.core.storage import StorageBackend, create_storage, object_key
+from app.database import SessionLocal
+from app.models import FileRecord, StoredBlob
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RehomeStats:
+    moved: int = 0
+    skipped: int = 0
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+    bytes: int = 0
+
+
+def _object_present(backend: StorageBackend, key: str, size: Optional[int]) -> bool:
+    try:
+        stored = backend.stat(key)
+    except FileNotFoundError:
+        return False
+    return size is None or stored.size == size
+
+
+def _transfer(source: StorageBackend, target: StorageBackend, key: str, new_key: str) -> int:
+    """Make the object under key available as new_key in both backends."""
+    size = source.stat(key).size
+    if new_key != key:
+        source.copy(key, new_key)
+    if target is not source and not _object_present(target, new_key, size):
+        with source.open(key) as content:
+            target.put_stream(content, new_key)
+    return size
+
+
+def _rows(db, batch_size: int):
+    """Blobs, then files from before content addressing, as (model, id, key)."""
+    for model, primary_key, legacy_only in (
+        (StoredBlob, StoredBlob.sha256, False),
+        (FileRecord, FileRecord.id, True),
+    ):
+        last = None
+        while True:
+            statement = select(primary_key, model.storage_key).order_by(primary_key).limit(batch_size)
+            if legacy_only:
+                statement = statement.where(FileRecord.sha256.is_(None))
+            if last is not None:
+                statement = statement.where(primary_key > last)
+            rows = db.execute(statement).all()
+            if not rows:
+                break
+            yield [(model, row_id, key) for row_id, key in rows]
+            last = rows[-1][0]
+
+
+def rehome(
+    source: StorageBackend,
+    target: StorageBackend,
+    session_factory: Callable = SessionLocal,
+    workers: int = 8,
+    batch_size: int = 500,
+    delete_source: bool = False,
+    dry_run: bool = False,
+) -> RehomeStats:
+    stats = RehomeStats()
+    delete_old = delete_source or target is source
+    db = session_factory()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in _rows(db, batch_size):
+                pending = []
+                for model, row_id, key in batch:
+                    new_key = object_key(key.rsplit("/", 1)[-1])
+                    if new_key == key and target is source:
+                        stats.skipped += 1
+                        continue
+                    pending.append((model, row_id, key, new_key))
+                if dry_run:
+                    stats.moved += len(pending)
+                    continue
+
+                futures = [executor.submit(_transfer, source, target, key, new_key) for _, _, key, new_key in pending]
+                done = []
+                for (model, row_id, key, new_key), future in zip(pending, futures):
+                    try:
+                        stats.bytes += future.result()
+                    except Exception as exc:
+                        logger.warning("Could not rehome %s: %s", key, exc)
+                        stats.failed.append((key, str(exc)))
+                        continue
+                    done.append((model, row_id, key, new_key))
+
+                # Switch the rows, including files that share a blob's object
+                for model, row_id, key, new_key in done:
+                    primary_key = StoredBlob.sha256 if model is StoredBlob else FileRecord.id
+                    db.execute(
+                        update(model)
+                        .where(primary_key == row_id, model.storage_key == key)
+                        .values(storage_key=new_key)
+                    )
+                    if model is StoredBlob:
+                        db.execute(
+                            update(FileRecord)
+                            .where(FileRecord.sha256 == row_id, FileRecord.storage_key == key)
+                            .values(storage_key=new_key)
+                        )
+                db.commit()
+                stats.moved += len(done)
+
+                if delete_old:
+                    for _, _, key, new_key in done:
+                        if key != new_key:
+                            source.delete(key)
+                        if target is not source:
+                            source.delete(new_key)
+    finally:
+        db.close()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="source", choices=["local", "s3"], help="defaults to STORAGE_BACKEND")
+    parser.add_argument("--to", dest="target", choices=["local", "s3"], help="defaults to the source")
+    parser.add_argument("--workers", type=int, default=8, help="objects copied in parallel")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows switched per transaction")
+    parser.add_argument("--delete-source", action="store_true", help="delete objects from the source backend")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would move")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    source = create_storage(args.source)
+    target = create_storage(args.target) if args.target and args.target != source.name else source
+    started = time.perf_counter()
+    stats = rehome(
+        source,
+        target,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        delete_source=args.delete_source,
+        dry_run=args.dry_run,
+    )
+    elapsed = time.perf_counter() - started
+    print(
+        f"{'would move' if args.dry_run else 'moved'} {stats.moved} objects "
+        f"({stats.bytes / (1024 * 1024):.1f} MiB) from {source.name} to {target.name} in {elapsed:.1f}s; "
+        f"{stats.skipped} already in place, {len(stats.failed)} failed"
+    )
+    for key, error in stats.failed:
+        print(f"  {key}: {error}")
+    if stats.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+from typing import Any, List, Optional
+
+import orjson
+from starlette.responses import JSONResponse
+
+from app.core.pagination import set_next_cursor
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson.
+
+    Returning one from a handler also bypasses FastAPI's response_model
+    validation and encoding, so only pass plain data built from trusted rows
+    (dicts, lists, strings, numbers, datetimes). The output matches what the
+    response models would produce, including "Z" for UTC datetimes.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def page_response(rows: List[dict], next_cursor: Optional[str]) -> FastJSONResponse:
+    response = FastJSONResponse(rows)
+    set_next_cursor(response, next_cursor)
+    return response
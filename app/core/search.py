@@ -0,0 +1,322 @@
+import logging
+import queue
+import re
+import threading
+import time
+import zipfile
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.maintenance import maintenance_scheduler
+from app.core.ooxml import A, S, W
+from app.core.storage import StorageBackend, storage
+from app.database import SessionLocal
+from app.models import FileRecord
+
+logger = logging.getLogger(__name__)
+
+# Text runs and the elements that end a line of text, per document type
+OOXML_TEXT = {
+    "docx": (
+        re.compile(r"word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml"),
+        {W + "t"},
+        {W + "p", W + "tab", W + "br"},
+    ),
+    "pptx": (
+        re.compile(r"ppt/(slides/slide|notesSlides/notesSlide)\d+\.xml"),
+        {A + "t"},
+        {A + "p", A + "br"},
+    ),
+    "xlsx": (
+        re.compile(r"xl/(sharedStrings|worksheets/sheet\d+)\.xml"),
+        {S + "t"},
+        {S + "si", S + "is"},
+    ),
+}
+
+
+def extract_text(source: BinaryIO, file_type: str, max_chars: int) -> str:
+    """The text of an OOXML document, up to max_chars.
+
+    Parts are parsed as a stream and dropped element by element, so memory
+    stays flat however large the document; a part is never inflated past
+    the size its ZIP entry declares. Raises zipfile.BadZipFile or
+    ElementTree.ParseError for files that aren't valid documents.
+    """
+    pattern, text_tags, break_tags = OOXML_TEXT[file_type]
+    pieces: List[str] = []
+    length = 0
+    with zipfile.ZipFile(source) as archive:
+        for name in sorted(name for name in archive.namelist() if pattern.fullmatch(name)):
+            with archive.open(name) as part:
+                for _, element in ElementTree.iterparse(part):
+                    if element.tag in text_tags and element.text:
+                        pieces.append(element.text)
+                        length += len(element.text)
+                    elif element.tag in break_tags:
+                        pieces.append("\n")
+                    element.clear()
+                    if length >= max_chars:
+                        return "".join(pieces)[:max_chars]
+            pieces.append("\n")
+    return "".join(pieces)
+
+
+def search_terms(query: str, max_terms: int = 16) -> List[str]:
+    # Words only: whatever else the user typed can't reach the query syntax
+    return re.findall(r"\w+", query.lower())[:max_terms]
+
+
+class SqliteSearchIndex:
+    """The index as an FTS5 virtual table; the rowid is the file id."""
+
+    def match(self, terms: List[str]) -> str:
+        # All terms, the last one as a prefix so results follow the user's typing
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    # File names count ten times as much as document text
+    search = (
+        "SELECT file_id FROM (SELECT file_search.rowid AS file_id, bm25(file_search, 10.0, 1.0) AS score "
+        "FROM file_search{join} WHERE file_search MATCH :match{where} "
+        "ORDER BY file_search.rowid DESC LIMIT :ranked) "
+        "ORDER BY score, file_id LIMIT :limit OFFSET :offset"
+    )
+    join = " JOIN files ON files.id = file_search.rowid"
+    upsert = [
+        "DELETE FROM file_search WHERE rowid = :file_id",
+        # Skips files deleted since they were queued
+        "INSERT INTO file_search (rowid, original_filename, content) "
+        "SELECT id, original_filename, :content FROM files WHERE id = :file_id",
+    ]
+    delete = "DELETE FROM file_search WHERE rowid = :file_id"
+    missing = (
+        "SELECT files.id FROM files WHERE NOT EXISTS "
+        "(SELECT 1 FROM file_search WHERE file_search.rowid = files.id) ORDER BY files.id LIMIT :limit"
+    )
+    shared_content = (
+        "SELECT file_search.content FROM files JOIN file_search ON file_search.rowid = files.id "
+        "WHERE files.sha256 = :sha256 LIMIT 1"
+    )
+
+
+class PostgresSearchIndex:
+    """The index as a table with a weighted tsvector column and a GIN index."""
+
+    def match(self, terms: List[str]) -> str:
+        return " & ".join(terms) + ":*"
+
+    # Names are weighted A and document text B, so name matches rank first
+    search = (
+        "SELECT file_id FROM (SELECT file_search.file_id, "
+        "ts_rank(document, to_tsquery('simple', :match)) AS score "
+        "FROM file_search{join} WHERE document @@ to_tsquery('simple', :match){where} "
+        "ORDER BY file_search.file_id DESC LIMIT :ranked) AS matches "
+        "ORDER BY score DESC, file_id LIMIT :limit OFFSET :offset"
+    )
+    join = " JOIN files ON files.id = file_search.file_id"
+    upsert = [
+        "INSERT INTO file_search (file_id, original_filename, content) "
+        "SELECT id, original_filename, :content FROM files WHERE id = :file_id "
+        "ON CONFLICT (file_id) DO UPDATE SET "
+        "original_filename = excluded.original_filename, content = excluded.content",
+    ]
+    delete = "DELETE FROM file_search WHERE file_id = :file_id"
+    missing = (
+        "SELECT files.id FROM files WHERE NOT EXISTS "
+        "(SELECT 1 FROM file_search WHERE file_search.file_id = files.id) ORDER BY files.id LIMIT :limit"
+    )
+    shared_content = (
+        "SELECT file_search.content FROM files JOIN file_search ON file_search.file_id = files.id "
+        "WHERE files.sha256 = :sha256 LIMIT 1"
+    )
+
+
+SEARCH_INDEXES = {"sqlite": SqliteSearchIndex(), "postgresql": PostgresSearchIndex()}
+
+
+def search_index_for(db) -> "SqliteSearchIndex | PostgresSearchIndex":
+    """The index implementation for the database behind a session (sync or async)."""
+    return SEARCH_INDEXES[db.bind.dialect.name]
+
+
+def search_statement(db, terms: List[str], file_type: Optional[str], limit: int, offset: int,
+                     ranked: Optional[int] = None):
+    """Ids of the files matching every term, best match first.
+
+    Scoring a match costs far more than finding it, so only the newest
+    `ranked` matches are scored: a word found in more files than that
+    ranks among the newest of them. Rare words, which say the most about a
+    file, are always ranked in full, and the time per query stays flat as
+    the catalog grows.
+    """
+    index = search_index_for(db)
+    where = " AND files.file_type = :file_type" if file_type else ""
+    statement = text(index.search.format(join=index.join if file_type else "", where=where))
+    params = {
+        "match": index.match(terms),
+        "ranked": ranked or settings.SEARCH_MAX_RANKED,
+        "limit": limit,
+        "offset": offset,
+    }
+    if file_type:
+        params["file_type"] = file_type
+    return statement.bindparams(**params)
+
+
+def delete_statement(db, file_id: int):
+    """Removes a file from the index; run it in the transaction that deletes the file."""
+    return text(search_index_for(db).delete).bindparams(file_id=file_id)
+
+
+_STOP = object()
+
+
+class SearchIndexer:
+    """Adds uploaded files to the search index in the background.
+
+    Uploads queue their file id after committing. One thread per worker
+    takes the queue in batches, reads each document from storage, pulls out
+    its text and writes the batch in one transaction, so a request never
+    waits on text extraction. Files with the same content reuse the text
+    already indexed for it. The search_index maintenance job indexes any
+    file the queue missed: files from before the index existed, or queued
+    in a worker that stopped first.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], store: StorageBackend,
+                 batch_size: int, backfill_size: int, max_chars: int):
+        self.session_factory = session_factory
+        self.storage = store
+        self.batch_size = batch_size
+        self.backfill_size = backfill_size
+        self.max_chars = max_chars
+        self.indexed = 0
+        self.unreadable = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_seconds = 0.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, file_id: int) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="search-indexer", daemon=True)
+                self._thread.start()
+        self._queue.put(file_id)
+
+    def flush(self) -> None:
+        """Wait until every queued file is indexed."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Index everything still queued and stop the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            file_ids = [file_id for file_id in batch if file_id is not _STOP]
+            try:
+                if file_ids:
+                    with self.session_factory() as db:
+                        self.index_files(db, file_ids)
+            except Exception as exc:
+                # Left to the maintenance job, which retries them
+                logger.warning("Indexing %d files failed: %s", len(file_ids), exc)
+                with self._lock:
+                    self.failed += len(file_ids)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is _STOP:
+                return
+
+    def document_text(self, file_record: FileRecord) -> str:
+        try:
+            with self.storage.open(file_record.storage_key) as source:
+                return extract_text(source, file_record.file_type, self.max_chars)
+        except Exception as exc:
+            # Still searchable by name; retrying wouldn't read it any better
+            logger.info("No text indexed for file %s: %s", file_record.id, exc)
+            with self._lock:
+                self.unreadable += 1
+            return ""
+
+    def index_files(self, db: Session, file_ids: List[int]) -> int:
+        """Index the given files (again), in one transaction. Returns how many were written."""
+        started = time.perf_counter()
+        index = search_index_for(db)
+        files = db.scalars(select(FileRecord).where(FileRecord.id.in_(file_ids))).all()
+        contents: Dict[Optional[str], str] = {}
+        rows: List[Tuple[int, str]] = []
+        for file_record in files:
+            sha256 = file_record.sha256
+            if sha256 and sha256 not in contents:
+                shared = db.scalar(text(index.shared_content).bindparams(sha256=sha256))
+                if shared is not None:
+                    contents[sha256] = shared
+            if sha256 and sha256 in contents:
+                content = contents[sha256]
+            else:
+                content = self.document_text(file_record) if file_record.file_type in OOXML_TEXT else ""
+                if sha256:
+                    contents[sha256] = content
+            rows.append((file_record.id, content))
+        for file_id, content in rows:
+            for statement in index.upsert:
+                db.execute(text(statement), {"file_id": file_id, "content": content})
+        db.commit()
+        with self._lock:
+            self.indexed += len(rows)
+            self.batches += 1
+            self.last_batch_seconds = time.perf_counter() - started
+        return len(rows)
+
+    def index_missing(self, db: Session) -> int:
+        """Maintenance job: index a batch of the files that aren't in the index yet."""
+        index = search_index_for(db)
+        file_ids = db.scalars(text(index.missing).bindparams(limit=self.backfill_size)).all()
+        if not file_ids:
+            return 0
+        written = 0
+        for start in range(0, len(file_ids), self.batch_size):
+            written += self.index_files(db, file_ids[start:start + self.batch_size])
+        return written
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "indexed": self.indexed,
+                "unreadable": self.unreadable,
+                "failed": self.failed,
+                "batches": self.batches,
+                "last_batch_seconds": self.last_batch_seconds,
+            }
+
+
+search_indexer = SearchIndexer(
+    SessionLocal,
+    storage,
+    batch_size=settings.SEARCH_INDEX_BATCH_SIZE,
+    backfill_size=settings.SEARCH_BACKFILL_BATCH_SIZE,
+    max_chars=settings.SEARCH_MAX_TEXT_CHARS,
+)
+maintenance_scheduler.add_job("search_index", search_indexer.index_missing, settings.MAINTENANCE_INTERVAL_SECONDS)
@@ -1,15 +1,21 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status
-from cryptography.fernet import Fernet
 import secrets
 import base64
 from app.core.config import settings
 
+# The password and URL encryption contexts are built on first use, so
+# importing the app doesn't pay for passlib or derive keys
+
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with a different cost are flagged for an upgrade on the next login
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 # Encryption for URLs
 def get_fernet_key():
@@ -21,13 +27,16 @@ def get_fernet_key():
         key = key[:32]
     return base64.urlsafe_b64encode(key)
 
-fernet = Fernet(get_fernet_key())
+@lru_cache(maxsize=None)
+def get_fernet():
+    from cryptography.fernet import Fernet
+    return Fernet(get_fernet_key())
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -39,21 +48,23 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str):
+def decode_access_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials"
-            )
-        return email
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials"
         )
+    if payload.get("sub") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials"
+        )
+    return payload
+
+def verify_token(token: str):
+    return decode_access_token(token)["sub"]
 
 def generate_verification_token() -> str:
     return secrets.token_urlsafe(32)
@@ -62,13 +73,13 @@ def generate_download_token() -> str:
     return secrets.token_urlsafe(64)
 
 def encrypt_url(url: str) -> str:
-    encrypted = fernet.encrypt(url.encode())
+    encrypted = get_fernet().encrypt(url.encode())
     return base64.urlsafe_b64encode(encrypted).decode()
 
 def decrypt_url(encrypted_url: str) -> str:
     try:
         encrypted_data = base64.urlsafe_b64decode(encrypted_url.encode())
-        decrypted = fernet.decrypt(encrypted_data)
+        decrypted = get_fernet().decrypt(encrypted_data)
         return decrypted.decode()
     except Exception:
         raise HTTPException(
@@ -0,0 +1,38 @@
+"""Setup that runs before serving, kept out of import time.
+
+Importing app.main only builds the app; nothing touches the database or
+the disk. Each worker finishes setting up in the lifespan startup with
+prepare_worker. Launchers that start several workers (run.py, the gunicorn
+config) call prepare_host first, in the parent process, so the schema is
+migrated once instead of by every worker at the same moment.
+"""
+import os
+from pathlib import Path
+
+from app.core.config import settings
+
+
+def prepare_host() -> None:
+    """Bring the schema up to date before any worker starts."""
+    # alembic is only needed here, so it isn't imported with the app
+    from app.core.migrations import upgrade_database
+    upgrade_database()
+    # Workers forked or spawned from this process needn't check again
+    settings.MIGRATE_ON_STARTUP = False
+    os.environ["MIGRATE_ON_STARTUP"] = "false"
+
+
+def prepare_worker() -> None:
+    """Blocking setup for one worker; run from the lifespan startup."""
+    Path(settings.UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
+    if settings.MIGRATE_ON_STARTUP:
+        from app.core.migrations import upgrade_database
+        upgrade_database()
+
+
+def after_fork() -> None:
+    """Drop what a forked worker must not share with its parent."""
+    from app.database import async_engine, engine
+    # Connections opened before the fork belong to the parent
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
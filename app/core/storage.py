@@ -0,0 +1,258 @@
+import hashlib
+import io
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from app.core.config import settings
+
+
+@dataclass
+class ObjectInfo:
+    size: int
+    modified: datetime
+
+
+def object_key(name: str, depth: Optional[int] = None) -> str:
+    """Backend-relative key for a stored object named name.
+
+    Objects are spread over depth levels of directories (or key prefixes)
+    named by two hex digits of a hash of the name, so no single directory
+    grows past a few thousand entries: "3f/a2/<name>" at the default depth.
+    """
+    depth = settings.STORAGE_FAN_OUT_DEPTH if depth is None else depth
+    digest = hashlib.sha256(name.encode("utf-8")).hexdigest()
+    return "/".join([digest[2 * level:2 * level + 2] for level in range(depth)] + [name])
+
+
+class StorageBackend(ABC):
+    """Where file contents live, addressed by backend-relative keys.
+
+    Methods block and are called from worker threads. Missing objects raise
+    FileNotFoundError.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def put_file(self, source: Path, key: str) -> None:
+        """Store a local file under key; the local file is consumed."""
+
+    @abstractmethod
+    def put_stream(self, source: BinaryIO, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def stat(self, key: str) -> ObjectInfo:
+        ...
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """A seekable binary file object for reading the object."""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """The object's path on this machine, when it has one.
+
+        Lets downloads be sent with sendfile instead of being read in chunks.
+        """
+        return None
+
+    @abstractmethod
+    def copy(self, key: str, new_key: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Delete an object; deleting a missing object is not an error."""
+
+
+class LocalStorage(StorageBackend):
+    """Objects as files under a root directory, keys as relative paths."""
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        parts = key.split("/")
+        if key.startswith("/") or any(part in ("", ".", "..") for part in parts):
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return self.root.joinpath(*parts)
+
+    def put_file(self, source: Path, key: str) -> None:
+        destination = self.path(key)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # Staged uploads live under the root, so this is an atomic rename
+        os.replace(source, destination)
+
+    def put_stream(self, source: BinaryIO, key: str) -> None:
+        destination = self.path(key)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = destination.parent / f".{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, "wb") as out:
+                shutil.copyfileobj(source, out, settings.UPLOAD_CHUNK_SIZE)
+            os.replace(temp_path, destination)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    def stat(self, key: str) -> ObjectInfo:
+        stat_result = os.stat(self.path(key))
+        return ObjectInfo(size=stat_result.st_size, modified=datetime.utcfromtimestamp(stat_result.st_mtime))
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def local_path(self, key: str) -> Optional[str]:
+        return str(self.path(key))
+
+    def copy(self, key: str, new_key: str) -> None:
+        destination = self.path(new_key)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # Stored objects never change, so both keys can share the inode
+            os.link(self.path(key), destination)
+        except FileExistsError:
+            pass
+        except OSError:
+            with self.open(key) as source:
+                self.put_stream(source, new_key)
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+
+def _missing(exc: Exception) -> bool:
+    # botocore's ClientError carries the parsed error; other exceptions may not
+    response = getattr(exc, "response", None)
+    error = response.get("Error") if isinstance(response, dict) else None
+    code = error.get("Code") if isinstance(error, dict) else None
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+class _S3RangeReader(io.RawIOBase):
+    """Seekable reads of one S3 object, one ranged GET per buffer fill."""
+
+    def __init__(self, storage: "S3Storage", key: str, size: int):
+        self.storage = storage
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(base + offset, 0)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        end = self.position + length - 1
+        response = self.storage.client.get_object(
+            Bucket=self.storage.bucket,
+            Key=self.storage.object_name(self.key),
+            Range=f"bytes={self.position}-{end}"
+        )
+        data = response["Body"].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class S3Storage(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS, MinIO, Ceph, ...).
+
+    client is a boto3 S3 client or anything with the same methods; one is
+    created from the S3_* settings and the usual AWS credential sources on
+    first use when it isn't given. Reads are ranged GETs of read_buffer_size
+    bytes.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket: str, client=None, prefix: str = "", read_buffer_size: int = 4 * 1024 * 1024):
+        self._client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.read_buffer_size = read_buffer_size
+
+    @property
+    def client(self):
+        # boto3 is slow to import and to set up a client, so wait for the first request
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("STORAGE_BACKEND=s3 needs the boto3 package")
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=settings.S3_ENDPOINT_URL,
+                region_name=settings.S3_REGION
+            )
+        return self._client
+
+    def object_name(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put_file(self, source: Path, key: str) -> None:
+        self.client.upload_file(str(source), self.bucket, self.object_name(key))
+        os.unlink(source)
+
+    def put_stream(self, source: BinaryIO, key: str) -> None:
+        self.client.upload_fileobj(source, self.bucket, self.object_name(key))
+
+    def stat(self, key: str) -> ObjectInfo:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_name(key))
+        except Exception as exc:
+            if _missing(exc):
+                raise FileNotFoundError(key)
+            raise
+        modified = head["LastModified"]
+        if modified.tzinfo is not None:
+            modified = modified.astimezone(timezone.utc).replace(tzinfo=None)
+        return ObjectInfo(size=head["ContentLength"], modified=modified)
+
+    def open(self, key: str) -> BinaryIO:
+        reader = _S3RangeReader(self, key, self.stat(key).size)
+        return io.BufferedReader(reader, buffer_size=self.read_buffer_size)
+
+    def copy(self, key: str, new_key: str) -> None:
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=self.object_name(new_key),
+            CopySource={"Bucket": self.bucket, "Key": self.object_name(key)}
+        )
+
+    def delete(self, key: str) -> None:
+        # S3 deletes are idempotent
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_name(key))
+
+
+def create_storage(backend: Optional[str] = None) -> StorageBackend:
+    backend = backend or settings.STORAGE_BACKEND
+    if backend == "s3":
+        if not settings.S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        return S3Storage(settings.S3_BUCKET, prefix=settings.S3_PREFIX)
+    return LocalStorage(settings.UPLOAD_DIR)
+
+
+storage = create_storage()
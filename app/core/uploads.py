@@ -0,0 +1,273 @@
+import fcntl
+import hashlib
+import os
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Tuple
+
+import aiofiles
+import anyio
+from fastapi import HTTPException, Request, status
+from starlette.requests import ClientDisconnect
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.config import settings
+
+
+@dataclass
+class StreamedUpload:
+    filename: str
+    temp_path: Path
+    size: int
+    sha256: str
+
+
+def file_too_large_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"File too large. Maximum size is {settings.MAX_FILE_SIZE / (1024*1024)}MB"
+    )
+
+
+def new_temp_path(directory: Path) -> Path:
+    # Temp files live under the local storage root so storing them is a rename
+    return directory / f".{uuid.uuid4().hex}.part"
+
+
+def remove_quietly(path: Path) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def exclusive_writer(path: Path) -> Iterator[None]:
+    """Hold the only write lock on an existing file, or raise a 409.
+
+    flock locks belong to the open file, so requests in one worker exclude
+    each other as well as requests in other workers on the host. Raises
+    FileNotFoundError if the file is gone.
+    """
+    with open(path, "rb") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Another chunk is being written to this upload session"
+            )
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class _MultipartFileSink:
+    """Synchronous multipart callbacks that write one file field to disk.
+
+    Runs inside a worker thread; see receive_multipart_file.
+    """
+
+    def __init__(self, boundary: bytes, field_name: str, directory: Path,
+                 check_filename: Callable[[str], None],
+                 check_start: Optional[Callable[[bytes], None]] = None, start_size: int = 0):
+        self.field_name = field_name
+        self.directory = directory
+        self.check_filename = check_filename
+        self.check_start = check_start
+        self.start_size = start_size
+        self._start: Optional[bytearray] = None
+        self.filename: Optional[str] = None
+        self.temp_path: Optional[Path] = None
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self._out = None
+        self._writing = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        })
+
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+        self._writing = False
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name != self.field_name or b"filename" not in options or self._out is not None:
+            return
+        self.filename = options[b"filename"].decode("utf-8", "replace")
+        self.check_filename(self.filename)
+        self.temp_path = new_temp_path(self.directory)
+        self._out = open(self.temp_path, "wb")
+        self._writing = True
+        if self.check_start is not None:
+            self._start = bytearray()
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._writing:
+            return
+        self.size += end - start
+        if self.size > settings.MAX_FILE_SIZE:
+            raise file_too_large_error()
+        chunk = data[start:end]
+        if self._start is not None:
+            self._start += chunk[:self.start_size - len(self._start)]
+            if len(self._start) >= self.start_size:
+                self._checked_start()
+        self.digest.update(chunk)
+        self._out.write(chunk)
+
+    def _checked_start(self) -> None:
+        start, self._start = bytes(self._start), None
+        self.check_start(start)
+
+    def on_part_end(self) -> None:
+        if self._writing:
+            if self._start is not None:
+                # Shorter than start_size
+                self._checked_start()
+            self._out.close()
+            self._writing = False
+
+    def feed(self, data: bytes) -> None:
+        self.parser.write(data)
+
+    def abort(self) -> None:
+        if self._out is not None:
+            self._out.close()
+        if self.temp_path is not None:
+            remove_quietly(self.temp_path)
+
+
+async def receive_multipart_file(
+    request: Request,
+    directory: Path,
+    check_filename: Callable[[str], None],
+    field_name: str = "file",
+    check_start: Optional[Callable[[bytes], None]] = None,
+    start_size: int = 0,
+) -> StreamedUpload:
+    """Stream one file field of a multipart request body into a temp file.
+
+    The body is read in chunks as it arrives; parsing and disk writes are
+    batched into a worker thread so the event loop stays free, and the SHA-256
+    digest is computed in the same pass. The size limit
+    is enforced as bytes arrive, so an oversized upload is aborted without
+    reading the rest of the body. check_start, when given, is called with
+    the first start_size bytes of the file as soon as they arrive (fewer if
+    the file is shorter), so content of the wrong kind is refused just as
+    early. The caller hands the temp file to the storage backend.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.MAX_FILE_SIZE + 64 * 1024:
+        raise file_too_large_error()
+
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Expected a multipart/form-data request body"
+        )
+
+    directory.mkdir(parents=True, exist_ok=True)
+    sink = _MultipartFileSink(boundary, field_name, directory, check_filename, check_start, start_size)
+    pending = bytearray()
+    try:
+        async for chunk in request.stream():
+            pending += chunk
+            if len(pending) >= settings.UPLOAD_CHUNK_SIZE:
+                await anyio.to_thread.run_sync(sink.feed, bytes(pending))
+                pending.clear()
+        if pending:
+            await anyio.to_thread.run_sync(sink.feed, bytes(pending))
+    except BaseException:
+        sink.abort()
+        raise
+
+    if sink._writing:
+        sink.abort()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incomplete multipart upload"
+        )
+    if sink.temp_path is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Missing '{field_name}' file field"
+        )
+    return StreamedUpload(
+        filename=sink.filename,
+        temp_path=sink.temp_path,
+        size=sink.size,
+        sha256=sink.digest.hexdigest()
+    )
+
+
+def sha256_of_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def write_request_body_at(request: Request, path: Path, offset: int, limit: int) -> Tuple[int, bool]:
+    """Write a raw request body into an existing file starting at offset.
+
+    Anything past offset is discarded first, so bytes left over from an
+    interrupted earlier attempt are overwritten. The body may not carry the
+    file past limit bytes. Returns the number of bytes written and whether
+    the body arrived completely; when the client disconnects midway the
+    bytes received so far are kept so the upload can resume from them.
+    """
+    written = 0
+    complete = True
+    pending = bytearray()
+    async with aiofiles.open(path, "r+b") as out:
+        await out.truncate(offset)
+        await out.seek(offset)
+        try:
+            async for chunk in request.stream():
+                if offset + written + len(pending) + len(chunk) > limit:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Chunk extends past the declared file size"
+                    )
+                pending += chunk
+                if len(pending) >= settings.UPLOAD_CHUNK_SIZE:
+                    await out.write(bytes(pending))
+                    written += len(pending)
+                    pending.clear()
+        except ClientDisconnect:
+            complete = False
+        if pending:
+            await out.write(bytes(pending))
+            written += len(pending)
+        await out.flush()
+    return written, complete
@@ -0,0 +1,145 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional
+
+import anyio
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.ooxml import ZIP_MAGIC, InvalidPackage, check_contents, check_structure
+
+
+def invalid_package_error(file_type: str, reason: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"File is not a valid .{file_type} document: {reason}"
+    )
+
+
+def check_zip_start(start: bytes) -> None:
+    """For receive_multipart_file: refuse an upload by its first bytes."""
+    if start != ZIP_MAGIC:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File is not a valid Office document: not a ZIP archive"
+        )
+
+
+class PackageValidator:
+    """Checks that uploads are the Office documents their names claim.
+
+    Uploads are refused by their first bytes while streaming in
+    (check_zip_start). Once a file is complete, the structure check reads
+    its ZIP directory from the end of the file on a thread, which costs
+    the same for any size of file and catches renamed files and zip
+    bombs. Only files that pass have [Content_Types].xml and the start of
+    the main part parsed, in a pool of processes, so inflating and parsing
+    untrusted XML never holds the GIL of the process serving requests. At
+    most max_pending checks may be running or queued; beyond that uploads
+    get a 503 straight away, like PasswordHasher.
+    """
+
+    def __init__(self, workers: int, max_pending: int, max_parts: int,
+                 max_uncompressed_size: int, max_ratio: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_parts = max_parts
+        self.max_uncompressed_size = max_uncompressed_size
+        self.max_ratio = max_ratio
+        self.accepted = 0
+        self.rejected = 0
+        self.overloaded = 0
+        self.last_check_seconds = 0.0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Spawned like the preview pool: the checks only import the standard library
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    max_tasks_per_child=1000,
+                )
+            return self._pool
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _reset_pool(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    async def check(self, path: Path, file_type: str) -> None:
+        """Raise a 400 unless the file at path is a package of file_type."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.overloaded += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many uploads being checked, please retry shortly",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            await anyio.to_thread.run_sync(
+                check_structure, str(path), file_type,
+                self.max_parts, self.max_uncompressed_size, self.max_ratio
+            )
+            if self.workers > 0:
+                await asyncio.wrap_future(self.pool().submit(check_contents, str(path), file_type))
+            else:
+                await anyio.to_thread.run_sync(check_contents, str(path), file_type)
+        except InvalidPackage as exc:
+            with self._lock:
+                self.rejected += 1
+            raise invalid_package_error(file_type, str(exc))
+        except BrokenProcessPool:
+            # A pool process died (killed, or out of memory); the next check starts a new pool.
+            # The file isn't parsed here instead: it may be what brought the process down.
+            self._reset_pool()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The upload could not be checked, please retry shortly",
+                headers={"Retry-After": "1"}
+            )
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.last_check_seconds = time.perf_counter() - started
+        with self._lock:
+            self.accepted += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "overloaded": self.overloaded,
+                "last_check_seconds": self.last_check_seconds,
+            }
+
+
+package_validator = PackageValidator(
+    workers=settings.UPLOAD_VALIDATION_WORKERS,
+    max_pending=settings.UPLOAD_VALIDATION_MAX_PENDING,
+    max_parts=settings.UPLOAD_MAX_PARTS,
+    max_uncompressed_size=settings.UPLOAD_MAX_UNCOMPRESSED_SIZE,
+    max_ratio=settings.UPLOAD_MAX_COMPRESSION_RATIO,
+)
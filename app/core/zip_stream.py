@@ -0,0 +1,166 @@
+import struct
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Callable, List, Optional, Tuple
+
+import anyio
+
+# Sizes and offsets at or above this need ZIP64 fields
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_MAX_ENTRIES = 0xFFFF
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_OF_CENTRAL_DIRECTORY = struct.Struct("<IHHHHIIH")
+_ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<IIQI")
+
+# Data descriptor follows each entry; names are UTF-8
+_FLAGS = 0x08 | 0x800
+_STORED = 0
+_VERSION_ZIP32 = 20
+_VERSION_ZIP64 = 45
+_MADE_BY_UNIX = 3 << 8
+_FILE_ATTRIBUTES = 0o100644 << 16
+
+
+@dataclass
+class ZipEntry:
+    name: str
+    path: Optional[str]
+    size: int
+    modified: datetime
+    opener: Optional[Callable[[], BinaryIO]] = None  # for content that isn't a local file
+
+    def open(self) -> BinaryIO:
+        return self.opener() if self.opener is not None else open(self.path, "rb")
+
+
+def _dos_time(value: datetime) -> Tuple[int, int]:
+    year = min(max(value.year, 1980), 2107)
+    date = ((year - 1980) << 9) | (value.month << 5) | value.day
+    time = (value.hour << 11) | (value.minute << 5) | (value.second // 2)
+    return time, date
+
+
+class ZipStream:
+    """Generate a store-only ZIP archive of files on the fly.
+
+    Entries are not compressed (OOXML documents are ZIP files already), so
+    the archive's exact length is known up front and can be sent as
+    Content-Length. Each file is read in chunks while its CRC-32 is computed
+    and the CRC follows in a data descriptor, so memory use is constant and
+    nothing is written to disk. ZIP64 records are used for entries, offsets
+    and counts that don't fit the classic format.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, entries: List[ZipEntry], force_zip64: bool = False):
+        self.entries = entries
+        self.force_zip64 = force_zip64
+        self._names = [entry.name.encode("utf-8") for entry in entries]
+        self._offsets = []
+        offset = 0
+        for entry, name in zip(entries, self._names):
+            self._offsets.append(offset)
+            zip64 = self._zip64(entry, offset)
+            offset += len(self._local_header(entry, name, offset)) + entry.size
+            offset += len(self._descriptor(entry, 0, zip64))
+        self._central_directory_offset = offset
+
+    def _zip64(self, entry: ZipEntry, offset: int) -> bool:
+        return self.force_zip64 or entry.size >= ZIP32_LIMIT or offset >= ZIP32_LIMIT
+
+    def _local_header(self, entry: ZipEntry, name: bytes, offset: int) -> bytes:
+        time, date = _dos_time(entry.modified)
+        if self._zip64(entry, offset):
+            # Real sizes follow in the ZIP64 data descriptor
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+            version, size = _VERSION_ZIP64, ZIP32_LIMIT
+        else:
+            extra = b""
+            version, size = _VERSION_ZIP32, 0
+        return _LOCAL_HEADER.pack(
+            0x04034B50, version, _FLAGS, _STORED, time, date, 0, size, size, len(name), len(extra)
+        ) + name + extra
+
+    @staticmethod
+    def _descriptor(entry: ZipEntry, crc: int, zip64: bool) -> bytes:
+        if zip64:
+            return struct.pack("<IIQQ", 0x08074B50, crc, entry.size, entry.size)
+        return struct.pack("<IIII", 0x08074B50, crc, entry.size, entry.size)
+
+    def _central_header(self, entry: ZipEntry, name: bytes, offset: int, crc: int) -> bytes:
+        time, date = _dos_time(entry.modified)
+        zip64_fields = []
+        size = entry.size
+        if self.force_zip64 or entry.size >= ZIP32_LIMIT:
+            zip64_fields += [entry.size, entry.size]
+            size = ZIP32_LIMIT
+        header_offset = offset
+        if self.force_zip64 or offset >= ZIP32_LIMIT:
+            zip64_fields.append(offset)
+            header_offset = ZIP32_LIMIT
+        extra = b""
+        if zip64_fields:
+            extra = struct.pack(f"<HH{len(zip64_fields)}Q", 0x0001, 8 * len(zip64_fields), *zip64_fields)
+        version = _VERSION_ZIP64 if self._zip64(entry, offset) else _VERSION_ZIP32
+        return _CENTRAL_HEADER.pack(
+            0x02014B50, _MADE_BY_UNIX | version, version, _FLAGS, _STORED, time, date,
+            crc, size, size, len(name), len(extra), 0, 0, 0, _FILE_ATTRIBUTES, header_offset
+        ) + name + extra
+
+    def _end_records(self, central_directory_size: int) -> bytes:
+        count = len(self.entries)
+        start = self._central_directory_offset
+        records = b""
+        if (self.force_zip64 or count >= ZIP32_MAX_ENTRIES
+                or start >= ZIP32_LIMIT or central_directory_size >= ZIP32_LIMIT):
+            zip64_end_offset = start + central_directory_size
+            records += _ZIP64_END_OF_CENTRAL_DIRECTORY.pack(
+                0x06064B50, 44, _MADE_BY_UNIX | _VERSION_ZIP64, _VERSION_ZIP64, 0, 0,
+                count, count, central_directory_size, start
+            )
+            records += _ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_end_offset, 1)
+            count = min(count, ZIP32_MAX_ENTRIES)
+            central_directory_size = min(central_directory_size, ZIP32_LIMIT)
+            start = min(start, ZIP32_LIMIT)
+        records += _END_OF_CENTRAL_DIRECTORY.pack(
+            0x06054B50, 0, 0, count, count, central_directory_size, start, 0
+        )
+        return records
+
+    def _central_directory(self, crcs: List[int]) -> bytes:
+        return b"".join(
+            self._central_header(entry, name, offset, crc)
+            for entry, name, offset, crc in zip(self.entries, self._names, self._offsets, crcs)
+        )
+
+    def content_length(self) -> int:
+        central_directory = self._central_directory([0] * len(self.entries))
+        return self._central_directory_offset + len(central_directory) + len(self._end_records(len(central_directory)))
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        crcs = []
+        for entry, name, offset in zip(self.entries, self._names, self._offsets):
+            yield self._local_header(entry, name, offset)
+            crc = 0
+            file = await anyio.to_thread.run_sync(entry.open)
+            try:
+                position = 0
+                while position < entry.size:
+                    chunk = await anyio.to_thread.run_sync(file.read, min(self.chunk_size, entry.size - position))
+                    if not chunk:
+                        raise OSError(f"{entry.name} is shorter than {entry.size} bytes")
+                    crc = zlib.crc32(chunk, crc)
+                    position += len(chunk)
+                    yield chunk
+            finally:
+                await anyio.to_thread.run_sync(file.close)
+            crcs.append(crc)
+            yield self._descriptor(entry, crc, self._zip64(entry, offset))
+        central_directory = self._central_directory(crcs)
+        yield central_directory
+        yield self._end_records(len(central_directory))
@@ -1,24 +1,101 @@
+import threading
+import time
+
 from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
 
-# Create SQLAlchemy engine
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def async_database_url(url: str) -> str:
+    scheme, separator, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+class PoolWaitStats:
+    """Time spent waiting for a pooled connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, waited: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_seconds_total": self.total_wait,
+                "wait_seconds_max": self.max_wait,
+                "wait_seconds_avg": self.total_wait / self.checkouts if self.checkouts else 0.0,
+            }
+
+pool_wait_stats = PoolWaitStats()
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait_stats.record(time.perf_counter() - started)
+
+def pool_options(url: str) -> dict:
+    if ":memory:" in url:
+        # In-memory SQLite keeps its own single-connection pool
+        return {}
+    return {
+        "poolclass": TimedAsyncQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+connect_args = {"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+
+# Synchronous engine for schema setup, scripts and background jobs
 engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+    connect_args=connect_args
 )
 
-# Create SessionLocal class
+# Async engine used by the request handlers
+async_engine = create_async_engine(
+    async_database_url(settings.DATABASE_URL),
+    connect_args=connect_args,
+    **pool_options(settings.DATABASE_URL)
+)
+
+# Create session classes
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Create Base class
 Base = declarative_base()
 
 # Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+def get_pool_stats() -> dict:
+    pool = async_engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    for name in ("size", "checkedout", "checkedin", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    stats.update(pool_wait_stats.snapshot())
+    return stats
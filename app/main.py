@@ -1,27 +1,54 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, status
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
 import uvicorn
+import anyio
+from contextlib import asynccontextmanager
 import os
-from pathlib import Path
 
-from app.database import engine, get_db
-from app.models import Base
-from app.routers import auth, files, users
+from app.database import get_db, get_pool_stats, engine, async_engine
+from app.routers import auth, files, profiles, users
 from app.core.config import settings
+from app.core.admission import AdmissionMiddleware, admission
+from app.core.compression import CompressionMiddleware
+from app.core.audit import audit_writer
+from app.core.catalog_events import catalog_feed
+from app.core.maintenance import maintenance_scheduler
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, app_metrics, registry
+from app.core.previews import preview_generator
+from app.core.profiling import ProfilingMiddleware, profiler
+from app.core.search import search_indexer
+from app.core.startup import prepare_worker
+from app.core.validation import package_validator
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Upload directory and schema; blocking, so off the event loop
+    await anyio.to_thread.run_sync(prepare_worker)
+    maintenance_scheduler.start()
+    registry.start()
+    yield
+    await anyio.to_thread.run_sync(maintenance_scheduler.stop)
+    await anyio.to_thread.run_sync(registry.stop)
+    await anyio.to_thread.run_sync(catalog_feed.stop)
+    await anyio.to_thread.run_sync(search_indexer.close)
+    await anyio.to_thread.run_sync(preview_generator.close)
+    await anyio.to_thread.run_sync(package_validator.close)
+    # Write queued download records before the worker exits
+    await anyio.to_thread.run_sync(audit_writer.close)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Secure File Sharing System",
     description="A secure file sharing system with role-based access control",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Rate limits and in-flight caps; inside CORS so rejections carry its headers
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -29,19 +56,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
+)
+
+# Compress JSON and text responses for clients that accept it
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.GZIP_COMPRESSION_LEVEL,
+    brotli_quality=settings.BROTLI_QUALITY,
 )
 
-# Create upload directory
-upload_dir = Path("uploads")
-upload_dir.mkdir(exist_ok=True)
+# Profile requests on demand; inside the metrics so profiled requests are still timed
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
 
-# Mount static files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Record request metrics; added last so it also times the middleware above
+if settings.METRICS_ENABLED:
+    app_metrics.instrument_engine(engine, "sync")
+    app_metrics.instrument_engine(async_engine.sync_engine, "async")
+    app_metrics.collect_pool(get_pool_stats)
+    app.add_middleware(MetricsMiddleware, metrics=app_metrics)
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(files.router, prefix="/api/files", tags=["Files"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
+app.include_router(profiles.router, prefix="/api/profiles", tags=["Profiles"])
 
 @app.get("/")
 async def root():
@@ -51,6 +92,27 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "API is running"}
 
+@app.get("/health/db")
+async def database_health():
+    # Connection pool occupancy and how long requests waited for a connection
+    return {"status": "healthy", "pool": get_pool_stats()}
+
+@app.get("/health/admission")
+async def admission_health():
+    # Uploads and downloads in flight and queued across the host, and this worker's rejections
+    return {"status": "healthy", "admission": admission.stats()}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    # Check the scrape token when one is configured
+    if settings.METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    # Reading other workers' snapshots touches the disk, so keep it off the loop
+    body = await anyio.to_thread.run_sync(registry.render)
+    return Response(body, media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
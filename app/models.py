@@ -1,50 +1,174 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, LargeBinary
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, LargeBinary, Index, DDL, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_user_type_id", "user_type", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     user_type = Column(String, nullable=False)  # 'ops' or 'client'
     is_verified = Column(Boolean, default=False)
-    verification_token = Column(String, nullable=True)
+    verification_token = Column(String, nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationship
     uploaded_files = relationship("FileRecord", back_populates="uploader")
     downloads = relationship("DownloadRecord", back_populates="user")
+    upload_sessions = relationship("UploadSession", back_populates="user")
 
 class FileRecord(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        # Keyset listings: every sort order, with and without a file type filter
+        Index("ix_files_uploaded_by_id", "uploaded_by", "id"),
+        Index("ix_files_uploaded_by_original_filename_id", "uploaded_by", "original_filename", "id"),
+        Index("ix_files_file_type_id", "file_type", "id"),
+        Index("ix_files_original_filename_id", "original_filename", "id"),
+        Index("ix_files_file_type_original_filename_id", "file_type", "original_filename", "id"),
+    )
+    # Read uploaded_at back from the INSERT, so new records can be published without a refresh
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
     original_filename = Column(String, nullable=False)
-    file_path = Column(String, nullable=False)
+    storage_key = Column(String, nullable=False)  # relative to the storage backend
     file_type = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)
     uploaded_by = Column(Integer, ForeignKey("users.id"))
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationship
     uploader = relationship("User", back_populates="uploaded_files")
     downloads = relationship("DownloadRecord", back_populates="file")
+    blob = relationship("StoredBlob", back_populates="files")
+
+# Full-text index over file names and document text (app/core/search.py).
+# It isn't a mapped table: SQLite keeps it in an FTS5 virtual table keyed
+# by file id, PostgreSQL in a weighted tsvector column with a GIN index.
+# Created with the files table here and by migration 0004.
+SEARCH_TABLE = "file_search"
+SEARCH_INDEX_DDL = {
+    "sqlite": [
+        # Prefix indexes keep as-you-type queries ("qua*") from merging every matching term
+        "CREATE VIRTUAL TABLE file_search USING fts5("
+        "original_filename, content, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    ],
+    "postgresql": [
+        "CREATE TABLE file_search ("
+        "file_id INTEGER PRIMARY KEY REFERENCES files (id) ON DELETE CASCADE, "
+        "original_filename TEXT NOT NULL, "
+        "content TEXT NOT NULL, "
+        "document tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', original_filename), 'A') || "
+        "setweight(to_tsvector('simple', content), 'B')) STORED)",
+        "CREATE INDEX ix_file_search_document ON file_search USING GIN (document)",
+    ],
+}
+
+for _dialect, _statements in SEARCH_INDEX_DDL.items():
+    for _statement in _statements:
+        event.listen(FileRecord.__table__, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+event.listen(FileRecord.__table__, "before_drop", DDL("DROP TABLE IF EXISTS file_search"))
+
+class StoredBlob(Base):
+    __tablename__ = "blobs"
+    
+    # One row per distinct file content; FileRecords share it by digest
+    sha256 = Column(String(64), primary_key=True)
+    storage_key = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationship
+    files = relationship("FileRecord", back_populates="blob")
+
+class FilePreview(Base):
+    __tablename__ = "previews"
+    
+    # Made from the content, so one row serves every file with that digest;
+    # the thumbnail image is a stored object next to the blobs
+    sha256 = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False)  # rows from an older preview format are made again
+    status = Column(String, nullable=False)  # 'ready', 'unavailable' (not a readable package) or 'failed'
+    content = Column(Text, nullable=True)  # the preview as JSON
+    thumbnail_key = Column(String, nullable=True)
+    thumbnail_type = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class DownloadRecord(Base):
     __tablename__ = "downloads"
+    __table_args__ = (
+        # Download history, newest first
+        Index("ix_downloads_user_id_id", "user_id", "id"),
+        # Lets PostgreSQL answer the secure-download lookup from the index
+        # alone; SQLite has no INCLUDE and uses the unique token index
+        Index(
+            "ix_downloads_token_lookup",
+            "download_token",
+            postgresql_include=["user_id", "file_id", "expires_at"],
+            info={"dialects": ["postgresql"]},
+        ).ddl_if(dialect="postgresql"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    file_id = Column(Integer, ForeignKey("files.id"))
+    file_id = Column(Integer, ForeignKey("files.id"), index=True)
     download_token = Column(String, unique=True, nullable=False)
     downloaded_at = Column(DateTime(timezone=True), server_default=func.now())
-    expires_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
     is_used = Column(Boolean, default=False)
     
     # Relationships
     user = relationship("User", back_populates="downloads")
-    file = relationship("FileRecord", back_populates="downloads")
\ No newline at end of file
+    file = relationship("FileRecord", back_populates="downloads")
+
+class ArchivedDownload(Base):
+    __tablename__ = "download_archive"
+    __table_args__ = (
+        Index("ix_download_archive_user_id_id", "user_id", "id"),
+    )
+    
+    # Expired download records moved out of "downloads", keeping their ids;
+    # the token is dropped since the link can no longer be used
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    file_id = Column(Integer, ForeignKey("files.id"), index=True)
+    downloaded_at = Column(DateTime(timezone=True))
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    is_used = Column(Boolean, default=False)
+    
+    # Relationships
+    file = relationship("FileRecord")
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    original_filename = Column(String, nullable=False)
+    total_size = Column(Integer, nullable=False)
+    committed_size = Column(Integer, nullable=False, default=0)
+    sha256 = Column(String(64), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    
+    # Relationships
+    user = relationship("User", back_populates="upload_sessions")
+
+class RevokedDownloadToken(Base):
+    __tablename__ = "revoked_download_tokens"
+    
+    # Id embedded in a signed download token; rows can go once the token expires
+    token_id = Column(String(16), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
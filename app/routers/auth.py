@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 import smtplib
 from email.mime.text import MIMEText
@@ -10,24 +11,26 @@ from app.database import get_db
 from app.models import User
 from app.schemas import UserCreate, UserLogin, Token, EmailVerificationResponse, VerifyEmailRequest
 from app.core.security import (
-    verify_password, 
-    get_password_hash, 
     create_access_token, 
-    verify_token,
+    decode_access_token,
     generate_verification_token,
     encrypt_url
 )
 from app.core.config import settings
+from app.core.principal_cache import Principal, principal_cache
+from app.core.passwords import password_hasher
 
 router = APIRouter()
 security = HTTPBearer()
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(User).where(User.email == email))
 
-def create_user(db: Session, user: UserCreate):
+async def create_user(db: AsyncSession, user: UserCreate):
     verification_token = generate_verification_token()
-    hashed_password = get_password_hash(user.password)
+    # Don't hold a pooled connection while the password is hashed
+    await db.rollback()
+    hashed_password = await password_hasher.hash(user.password)
     db_user = User(
         email=user.email,
         hashed_password=hashed_password,
@@ -36,35 +39,61 @@ def create_user(db: Session, user: UserCreate):
         is_verified=False
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     return db_user, verification_token
 
-def authenticate_user(db: Session, email: str, password: str, user_type: str):
-    user = get_user_by_email(db, email)
+async def authenticate_user(db: AsyncSession, email: str, password: str, user_type: str):
+    user = await get_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    principal = Principal.from_user(user)
+    hashed_password = user.hashed_password
+    
+    # Don't hold a pooled connection while bcrypt runs
+    await db.rollback()
+    verified, new_hash = await password_hasher.verify_and_update(password, hashed_password)
+    if not verified:
         return False
-    if user.user_type != user_type:
+    if new_hash:
+        # The stored hash uses an outdated cost; upgrade it now that we know the password.
+        # Skipped if the password was changed concurrently.
+        await db.execute(
+            update(User)
+            .where(User.id == principal.id, User.hashed_password == hashed_password)
+            .values(hashed_password=new_hash)
+        )
+        await db.commit()
+    if principal.user_type != user_type:
         return False
-    return user
+    return principal
+
+def invalidate_user(email: str) -> None:
+    # Call after any change to a user row so cached principals are refreshed
+    principal_cache.invalidate_email(email)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_db)) -> Principal:
     token = credentials.credentials
-    email = verify_token(token)
-    user = get_user_by_email(db, email)
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    
+    payload = decode_access_token(token)
+    email = payload["sub"]
+    generation = principal_cache.generation(email)
+    user = await get_user_by_email(db, email)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.put(token, principal, payload["exp"], generation)
+    return principal
 
 @router.post("/signup", response_model=EmailVerificationResponse)
-async def signup(user: UserCreate, db: Session = Depends(get_db)):
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if user already exists
-    db_user = get_user_by_email(db, user.email)
+    db_user = await get_user_by_email(db, user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -72,7 +101,7 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create user
-    new_user, verification_token = create_user(db, user)
+    new_user, verification_token = await create_user(db, user)
     
     # Generate encrypted verification URL
     verification_url = f"http://localhost:8000/api/auth/verify-email?token={verification_token}"
@@ -87,8 +116,8 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
     )
 
 @router.post("/verify-email")
-async def verify_email(request: VerifyEmailRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.verification_token == request.token).first()
+async def verify_email(request: VerifyEmailRequest, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.verification_token == request.token))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -97,13 +126,14 @@ async def verify_email(request: VerifyEmailRequest, db: Session = Depends(get_db
     
     user.is_verified = True
     user.verification_token = None
-    db.commit()
+    await db.commit()
+    invalidate_user(user.email)
     
     return {"message": "Email verified successfully"}
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
-    user = authenticate_user(db, user_credentials.email, user_credentials.password, user_credentials.user_type)
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, user_credentials.email, user_credentials.password, user_credentials.user_type)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -134,11 +164,31 @@ async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     }
 
 @router.get("/me")
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: Principal = Depends(get_current_user)):
     return {
         "id": current_user.id,
         "email": current_user.email,
         "user_type": current_user.user_type,
         "is_verified": current_user.is_verified,
         "created_at": current_user.created_at
-    }
\ No newline at end of file
+    }
+
+@router.get("/principal-cache")
+async def get_principal_cache_stats(current_user: Principal = Depends(get_current_user)):
+    # Only ops users can inspect the cache
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view cache statistics"
+        )
+    return principal_cache.stats()
+
+@router.get("/password-hashing")
+async def get_password_hashing_stats(current_user: Principal = Depends(get_current_user)):
+    # Only ops users can inspect the hashing pool
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view hashing statistics"
+        )
+    return password_hasher.stats()
@@ -1,29 +1,80 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, contains_eager
+from typing import List, Optional, Literal
+from functools import partial
 import os
-import shutil
+import re
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
 import uuid
+import anyio
+import orjson
 
 from app.database import get_db
-from app.models import User, FileRecord, DownloadRecord
-from app.schemas import FileUploadResponse, FileInfo, DownloadResponse, DownloadHistoryItem
+from app.models import (
+    FileRecord,
+    DownloadRecord,
+    ArchivedDownload,
+    UploadSession,
+    StoredBlob,
+    RevokedDownloadToken,
+    FilePreview
+)
+from app.schemas import (
+    FileUploadResponse,
+    FileInfo,
+    DownloadResponse,
+    DownloadHistoryItem,
+    ArchivedDownloadItem,
+    UploadSessionCreate,
+    UploadSessionInfo,
+    BulkDownloadRequest,
+    BulkDownloadLink,
+    BulkDownloadResponse,
+    ArchiveRequest
+)
 from app.routers.auth import get_current_user
+from app.core.principal_cache import Principal
 from app.core.security import generate_download_token
+from app.core.audit import PendingLink, audit_writer
+from app.core.maintenance import maintenance_scheduler
+from app.core.metrics import app_metrics
+from app.core.download_tokens import (
+    DownloadClaims,
+    create_signed_download_token,
+    verify_signed_download_token,
+    is_signed_download_token,
+    download_deny_list
+)
 from app.core.config import settings
+from app.core.file_responses import conditional_file_response, content_disposition, etag_matches
+from app.core.storage import ObjectInfo, object_key, storage
+from app.core.listing_cache import catalog_version, listing_cache
+from app.core.catalog_events import catalog_feed
+from app.core.ooxml import ZIP_MAGIC
+from app.core.previews import PREVIEW_VERSION, preview_generator
+from app.core.search import delete_statement, search_indexer, search_statement, search_terms
+from app.core.zip_stream import ZipEntry, ZipStream
+from app.core.pagination import decode_cursor, encode_cursor, keyset_page
+from app.core.responses import FastJSONResponse, page_response
+from app.core.uploads import (
+    receive_multipart_file,
+    write_request_body_at,
+    exclusive_writer,
+    remove_quietly,
+    sha256_of_file,
+    file_too_large_error
+)
+from app.core.validation import check_zip_start, package_validator
 
 router = APIRouter()
 
-def save_upload_file(upload_file: UploadFile, destination: Path) -> None:
-    try:
-        with destination.open("wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
-    finally:
-        upload_file.file.close()
-
 def is_allowed_file(filename: str) -> bool:
     return any(filename.lower().endswith(ext) for ext in settings.ALLOWED_EXTENSIONS)
 
@@ -33,11 +84,34 @@ def get_file_type(filename: str) -> str:
             return ext[1:]  # Remove the dot
     return "unknown"
 
-@router.post("/upload", response_model=FileUploadResponse)
+def check_allowed_file(filename: str) -> None:
+    if not is_allowed_file(filename):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File type not allowed. Only {', '.join(settings.ALLOWED_EXTENSIONS)} files are permitted"
+        )
+
+# The body is parsed by hand so it can be streamed to disk; describe it for the docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+@router.post("/upload", response_model=FileUploadResponse, openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_file(
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if user is ops
     if current_user.user_type != "ops":
@@ -46,53 +120,461 @@ async def upload_file(
             detail="Only operations users can upload files"
         )
     
-    # Validate file type
-    if not is_allowed_file(file.filename):
+    # End the read transaction so no pooled connection is held while the body streams in
+    uploader_id = current_user.id
+    await db.rollback()
+    
+    # Stream to a temp file, validating the file type from the part headers
+    # and the first bytes, and enforcing the size limit as bytes arrive
+    upload_dir = Path(settings.UPLOAD_DIR)
+    with app_metrics.uploads_in_progress.track():
+        upload = await receive_multipart_file(
+            request, upload_dir, check_allowed_file, check_start=check_zip_start, start_size=len(ZIP_MAGIC)
+        )
+    filename = upload.filename
+    file_size = upload.size
+    try:
+        await package_validator.check(upload.temp_path, get_file_type(filename))
+        db_file = await store_uploaded_file(db, upload.temp_path, filename, file_size, upload.sha256, uploader_id)
+    except BaseException:
+        # Storing consumes the temp file; until then nothing else removes it
+        remove_quietly(upload.temp_path)
+        raise
+    
+    response = FileUploadResponse(
+        id=db_file.id,
+        filename=filename,
+        file_type=db_file.file_type,
+        file_size=file_size,
+        sha256=db_file.sha256,
+        message="File uploaded successfully"
+    )
+    await db.commit()
+    file_added(db_file, current_user.email)
+    
+    return response
+
+# Content-addressed storage
+#
+# File contents are stored once per SHA-256 digest as a StoredBlob that any
+# number of FileRecords point at. The blob's ref_count tracks those records;
+# the blob and its object are removed when the last record goes away. Rows
+# hold a key relative to the storage backend, never a path.
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+async def acquire_blob(db: AsyncSession, sha256: str, file_size: int, temp_path: Optional[Path] = None) -> StoredBlob:
+    """Take a reference on the blob for a digest.
+
+    If the content is already stored the temp file is discarded; otherwise
+    temp_path becomes the new blob. The caller commits the session.
+    """
+    linked = await db.execute(
+        update(StoredBlob)
+        .where(StoredBlob.sha256 == sha256)
+        .values(ref_count=StoredBlob.ref_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if linked.rowcount:
+        if temp_path is not None:
+            remove_quietly(temp_path)
+        return (await db.scalars(select(StoredBlob).where(StoredBlob.sha256 == sha256))).one()
+    if temp_path is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File type not allowed. Only {', '.join(settings.ALLOWED_EXTENSIONS)} files are permitted"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="File content is no longer stored; upload the file again"
         )
     
-    # Check file size
-    if file.size > settings.MAX_FILE_SIZE:
+    # Each blob row owns a uniquely named object, so deleting a released blob
+    # can never remove the object of a blob re-created for the same digest
+    storage_key = object_key(f"{sha256}-{uuid.uuid4().hex[:8]}")
+    await anyio.to_thread.run_sync(storage.put_file, temp_path, storage_key)
+    blob = StoredBlob(sha256=sha256, storage_key=storage_key, file_size=file_size, ref_count=1)
+    db.add(blob)
+    try:
+        await db.flush()
+    except IntegrityError:
+        # A concurrent upload stored the same content first. Nothing else is
+        # pending in the session yet, so roll back and link to that blob.
+        await db.rollback()
+        await anyio.to_thread.run_sync(storage.delete, storage_key)
+        return await acquire_blob(db, sha256, file_size)
+    return blob
+
+async def release_blob(db: AsyncSession, sha256: str) -> List[str]:
+    """Drop a reference on a blob, deleting the row when it was the last one.
+
+    Returns the keys of the objects to delete once the caller has committed:
+    the blob's and its preview thumbnail's, or none while other files still
+    use the content.
+    """
+    storage_key = await db.scalar(select(StoredBlob.storage_key).where(StoredBlob.sha256 == sha256))
+    await db.execute(
+        update(StoredBlob)
+        .where(StoredBlob.sha256 == sha256)
+        .values(ref_count=StoredBlob.ref_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = await db.execute(
+        delete(StoredBlob)
+        .where(StoredBlob.sha256 == sha256, StoredBlob.ref_count <= 0)
+        .execution_options(synchronize_session=False)
+    )
+    if not deleted.rowcount:
+        return []
+    thumbnail_key = await db.scalar(select(FilePreview.thumbnail_key).where(FilePreview.sha256 == sha256))
+    await db.execute(
+        delete(FilePreview)
+        .where(FilePreview.sha256 == sha256)
+        .execution_options(synchronize_session=False)
+    )
+    return [key for key in (storage_key, thumbnail_key) if key]
+
+async def store_uploaded_file(
+    db: AsyncSession,
+    temp_path: Optional[Path],
+    filename: str,
+    file_size: int,
+    sha256: str,
+    uploader_id: int
+) -> FileRecord:
+    """Store a fully received upload and add its FileRecord.
+
+    temp_path may be None when the content is known to be stored already.
+    The caller commits the session.
+    """
+    blob = await acquire_blob(db, sha256, file_size, temp_path)
+    db_file = FileRecord(
+        filename=blob.storage_key.rsplit("/", 1)[-1],
+        original_filename=filename,
+        storage_key=blob.storage_key,
+        file_type=get_file_type(filename),
+        file_size=file_size,
+        sha256=sha256,
+        uploaded_by=uploader_id
+    )
+    db.add(db_file)
+    await db.flush()
+    return db_file
+
+# Resumable upload sessions
+#
+# A session is created with the file name and size, the bytes are PUT in one
+# or more chunks at the offset the server has committed so far, and the
+# session is then completed into a regular FileRecord. Progress is stored in
+# the database next to a partial file, so a session survives worker restarts.
+
+_last_session_purge = 0.0
+
+def session_part_path(session_id: str) -> Path:
+    return Path(settings.UPLOAD_DIR) / ".sessions" / f"{session_id}.part"
+
+def session_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+def session_info(upload_session: UploadSession) -> UploadSessionInfo:
+    return UploadSessionInfo(
+        id=upload_session.id,
+        filename=upload_session.original_filename,
+        file_size=upload_session.total_size,
+        offset=upload_session.committed_size,
+        expires_at=upload_session.expires_at
+    )
+
+async def purge_expired_upload_sessions(db: AsyncSession, batch_size: int = 500) -> int:
+    """Delete abandoned upload sessions and their partial files."""
+    expired = (await db.scalars(
+        select(UploadSession).where(
+            UploadSession.expires_at < datetime.utcnow()
+        ).limit(batch_size)
+    )).all()
+    for upload_session in expired:
+        remove_quietly(session_part_path(upload_session.id))
+        await db.delete(upload_session)
+    await db.commit()
+    return len(expired)
+
+async def maybe_purge_expired_upload_sessions(db: AsyncSession) -> None:
+    global _last_session_purge
+    now = time.monotonic()
+    if now - _last_session_purge >= settings.UPLOAD_SESSION_PURGE_INTERVAL_SECONDS:
+        _last_session_purge = now
+        await purge_expired_upload_sessions(db)
+
+def require_ops_uploader(current_user: Principal) -> None:
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can upload files"
+        )
+
+async def get_owned_upload_session(db: AsyncSession, session_id: str, current_user: Principal) -> UploadSession:
+    upload_session = await db.scalar(select(UploadSession).where(
+        UploadSession.id == session_id,
+        UploadSession.user_id == current_user.id
+    ))
+    if not upload_session or upload_session.expires_at < datetime.utcnow():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found or expired"
+        )
+    return upload_session
+
+@router.post("/upload-sessions", response_model=UploadSessionInfo)
+async def create_upload_session(
+    session_request: UploadSessionCreate,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    require_ops_uploader(current_user)
+    check_allowed_file(session_request.filename)
+    if session_request.file_size < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File size must not be negative"
+        )
+    if session_request.file_size > settings.MAX_FILE_SIZE:
+        raise file_too_large_error()
+    sha256 = session_request.sha256.lower() if session_request.sha256 else None
+    if sha256 is not None and not SHA256_PATTERN.match(sha256):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File too large. Maximum size is {settings.MAX_FILE_SIZE / (1024*1024)}MB"
+            detail="sha256 must be a hex-encoded SHA-256 digest"
         )
     
-    # Generate unique filename
-    file_extension = Path(file.filename).suffix
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = Path(settings.UPLOAD_DIR) / unique_filename
+    await maybe_purge_expired_upload_sessions(db)
     
-    # Save file
-    save_upload_file(file, file_path)
+    # When the declared content is already stored there is nothing to send;
+    # the session starts out complete and only needs to be finalized
+    already_stored = sha256 is not None and await db.scalar(select(StoredBlob.sha256).where(
+        StoredBlob.sha256 == sha256,
+        StoredBlob.file_size == session_request.file_size
+    )) is not None
     
-    # Save to database
-    db_file = FileRecord(
-        filename=unique_filename,
-        original_filename=file.filename,
-        file_path=str(file_path),
-        file_type=get_file_type(file.filename),
-        file_size=file.size,
-        uploaded_by=current_user.id
+    upload_session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        original_filename=session_request.filename,
+        total_size=session_request.file_size,
+        committed_size=session_request.file_size if already_stored else 0,
+        sha256=sha256,
+        expires_at=session_expiry()
     )
-    db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
+    part_path = session_part_path(upload_session.id)
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    if not already_stored:
+        part_path.touch()
+    db.add(upload_session)
+    await db.commit()
+    
+    return session_info(upload_session)
+
+@router.get("/upload-sessions/{session_id}", response_model=UploadSessionInfo)
+async def get_upload_session(
+    session_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    require_ops_uploader(current_user)
+    return session_info(await get_owned_upload_session(db, session_id, current_user))
+
+@router.put("/upload-sessions/{session_id}", response_model=UploadSessionInfo)
+async def upload_session_chunk(
+    session_id: str,
+    offset: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    require_ops_uploader(current_user)
+    upload_session = await get_owned_upload_session(db, session_id, current_user)
+    total_size = upload_session.total_size
+    part_path = session_part_path(session_id)
+    try:
+        # One writer per session: two PUTs at the same offset would interleave their bytes
+        with exclusive_writer(part_path):
+            # Re-read under the lock, the previous writer may have just moved the offset on
+            await db.refresh(upload_session)
+            committed = upload_session.committed_size
+            if offset != committed:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Offset mismatch; resume from byte {committed}",
+                    headers={"Upload-Offset": str(committed)}
+                )
+            
+            # Don't hold a pooled connection while the chunk streams in
+            await db.rollback()
+            with app_metrics.uploads_in_progress.track():
+                written, complete = await write_request_body_at(request, part_path, offset, total_size)
+            
+            # Only advance from the offset we started at, in case the part file was replaced meanwhile
+            updated = await db.execute(
+                update(UploadSession)
+                .where(
+                    UploadSession.id == session_id,
+                    UploadSession.committed_size == offset
+                )
+                .values(committed_size=offset + written, expires_at=session_expiry())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Upload session data is no longer available"
+        )
+    if not updated.rowcount:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload session was modified concurrently"
+        )
+    if not complete:
+        # The bytes that did arrive are kept; tell the client where to resume
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chunk body ended early; resume from byte {offset + written}",
+            headers={"Upload-Offset": str(offset + written)}
+        )
+    
+    return session_info(await get_owned_upload_session(db, session_id, current_user))
+
+@router.post("/upload-sessions/{session_id}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(
+    session_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    require_ops_uploader(current_user)
+    upload_session = await get_owned_upload_session(db, session_id, current_user)
+    part_path = session_part_path(session_id)
+    if upload_session.committed_size != upload_session.total_size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload incomplete; {upload_session.committed_size} of {upload_session.total_size} bytes received",
+            headers={"Upload-Offset": str(upload_session.committed_size)}
+        )
+    
+    filename = upload_session.original_filename
+    file_size = upload_session.total_size
+    declared_sha256 = upload_session.sha256
+    uploader_id = current_user.id
+    if part_path.exists():
+        if part_path.stat().st_size < file_size:
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Upload session data is no longer available"
+            )
+        # Drop any bytes past the committed size left by an interrupted chunk
+        os.truncate(part_path, file_size)
+        # Don't hold a pooled connection while the file is checked and hashed
+        await db.rollback()
+        try:
+            await package_validator.check(part_path, get_file_type(filename))
+        except Exception as exc:
+            if not isinstance(exc, HTTPException) or exc.status_code == status.HTTP_400_BAD_REQUEST:
+                # Every byte is in, so resuming can't fix the content
+                remove_quietly(part_path)
+                await db.execute(
+                    delete(UploadSession)
+                    .where(UploadSession.id == session_id)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            raise
+        sha256 = await anyio.to_thread.run_sync(sha256_of_file, part_path)
+        if declared_sha256 and sha256 != declared_sha256:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Uploaded content does not match the declared sha256"
+            )
+        temp_path = part_path
+    elif declared_sha256:
+        # Completed by digest at creation; link to the stored content
+        sha256 = declared_sha256
+        temp_path = None
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Upload session data is no longer available"
+        )
     
-    return FileUploadResponse(
+    db_file = await store_uploaded_file(db, temp_path, filename, file_size, sha256, uploader_id)
+    response = FileUploadResponse(
         id=db_file.id,
-        filename=file.filename,
+        filename=filename,
         file_type=db_file.file_type,
-        file_size=file.size,
+        file_size=file_size,
+        sha256=sha256,
         message="File uploaded successfully"
     )
+    await db.execute(
+        delete(UploadSession)
+        .where(UploadSession.id == session_id)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    file_added(db_file, current_user.email)
+    
+    return response
+
+@router.delete("/upload-sessions/{session_id}")
+async def abort_upload_session(
+    session_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    require_ops_uploader(current_user)
+    upload_session = await get_owned_upload_session(db, session_id, current_user)
+    remove_quietly(session_part_path(session_id))
+    await db.delete(upload_session)
+    await db.commit()
+    
+    return {"message": "Upload session aborted"}
+
+# Listing pages and sort orders. Ids are assigned in upload order, so they
+# double as the upload-time sort key and keep every sort key unique.
+PAGE_SIZE = Query(100, ge=1, le=500)
+FileSort = Literal["-uploaded_at", "uploaded_at", "filename", "-filename"]
+FILE_SORT_KEYS = {
+    "-uploaded_at": ([FileRecord.id], True),
+    "uploaded_at": ([FileRecord.id], False),
+    "filename": ([FileRecord.original_filename, FileRecord.id], False),
+    "-filename": ([FileRecord.original_filename, FileRecord.id], True),
+}
+
+def file_info(file: FileRecord, uploaded_by: str) -> dict:
+    # A FileInfo row built straight from the database; listings skip re-validating it
+    return {
+        "id": file.id,
+        "filename": file.original_filename,
+        "original_filename": file.original_filename,
+        "file_type": file.file_type,
+        "file_size": file.file_size,
+        "uploaded_by": uploaded_by,
+        "uploaded_at": file.uploaded_at,
+    }
+
+def publish_catalog_change(event: dict) -> None:
+    # Call after committing: moves listing ETags on and pushes the change to event streams
+    event["version"] = catalog_version.bump()
+    catalog_feed.publish(event)
+
+def file_added(db_file: FileRecord, uploaded_by: str) -> None:
+    # Call after committing: announces the file and queues its search indexing and preview
+    publish_catalog_change({"type": "file.added", "file": file_info(db_file, uploaded_by)})
+    search_indexer.add(db_file.id)
+    preview_generator.add(db_file.sha256, db_file.storage_key)
 
 @router.get("/list", response_model=List[FileInfo])
 async def list_files(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    limit: int = PAGE_SIZE,
+    cursor: Optional[str] = None,
+    file_type: Optional[str] = None,
+    sort: FileSort = "-uploaded_at",
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     # Only client users can list files
     if current_user.user_type != "client":
@@ -101,126 +583,509 @@ async def list_files(
             detail="Only client users can list files"
         )
     
-    files = db.query(FileRecord).all()
-    file_list = []
-    
-    for file in files:
-        uploader = db.query(User).filter(User.id == file.uploaded_by).first()
-        file_list.append(FileInfo(
-            id=file.id,
-            filename=file.original_filename,
-            original_filename=file.original_filename,
-            file_type=file.file_type,
-            file_size=file.file_size,
-            uploaded_by=uploader.email if uploader else "Unknown",
-            uploaded_at=file.uploaded_at
-        ))
+    async def build():
+        statement = select(FileRecord).options(joinedload(FileRecord.uploader))
+        if file_type:
+            statement = statement.where(FileRecord.file_type == file_type)
+        keys, descending = FILE_SORT_KEYS[sort]
+        files, next_cursor = await keyset_page(db, statement, keys, descending, cursor, limit)
+        return page_response([
+            file_info(file, file.uploader.email if file.uploader else "Unknown")
+            for file in files
+        ], next_cursor)
     
-    return file_list
+    # Every client sees the same catalog, so the pages are shared between them
+    return await listing_cache.page(request, ("list", limit, cursor, file_type, sort), build)
 
-@router.get("/download-file/{file_id}", response_model=DownloadResponse)
-async def generate_download_link(
-    file_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.get("/search", response_model=List[FileInfo])
+async def search_files(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    file_type: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    # Only client users can download files
+    # Only client users can search files, as only they can list them
     if current_user.user_type != "client":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only client users can download files"
+            detail="Only client users can search files"
         )
     
-    # Check if file exists
-    file_record = db.query(FileRecord).filter(FileRecord.id == file_id).first()
-    if not file_record:
+    terms = search_terms(q)
+    if not terms:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Search for at least one word"
+        )
+    # Ranked results have no unique sort key to seek from; the cursor is an offset
+    offset = decode_cursor(cursor, 1)[0] if cursor else 0
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
         )
     
+    file_ids = (await db.scalars(search_statement(db, terms, file_type, limit + 1, offset))).all()
+    next_cursor = encode_cursor([offset + limit]) if len(file_ids) > limit else None
+    file_ids = file_ids[:limit]
+    files = {
+        file.id: file
+        for file in await db.scalars(
+            select(FileRecord).options(joinedload(FileRecord.uploader)).where(FileRecord.id.in_(file_ids))
+        )
+    }
+    return page_response([
+        file_info(files[file_id], files[file_id].uploader.email if files[file_id].uploader else "Unknown")
+        for file_id in file_ids if file_id in files
+    ], next_cursor)
+
+@router.get("/search-index")
+async def get_search_index_stats(current_user: Principal = Depends(get_current_user)):
+    # Only ops users can inspect the search indexer
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view search index statistics"
+        )
+    return search_indexer.stats()
+
+def download_link(download_token: str) -> str:
+    return f"http://localhost:8000/api/files/secure-download/{download_token}"
+
+def issue_download_token(file_id: int, user_id: int, expires_at: datetime) -> str:
+    """Create a download token for the configured mode.
+
+    In database mode the DownloadRecord is queued on the audit writer.
+    """
+    if settings.DOWNLOAD_TOKEN_MODE == "signed":
+        # Self-contained token; nothing is written until the file is downloaded
+        return create_signed_download_token(file_id, user_id, expires_at)
+    
     # Generate download token
     download_token = generate_download_token()
-    expires_at = datetime.utcnow() + timedelta(hours=24)  # 24 hour expiry
     
     # Save download record
-    download_record = DownloadRecord(
-        user_id=current_user.id,
+    audit_writer.add_link(PendingLink(
+        token=download_token,
+        user_id=user_id,
         file_id=file_id,
-        download_token=download_token,
         expires_at=expires_at
-    )
-    db.add(download_record)
-    db.commit()
+    ))
+    return download_token
+
+async def wait_for_audit_writes(db: AsyncSession) -> None:
+    # Don't hold a pooled connection while queued download records are written
+    await db.rollback()
+    await audit_writer.wait_durable()
+
+def require_client_downloader(current_user: Principal) -> None:
+    if current_user.user_type != "client":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only client users can download files"
+        )
+
+def unique_file_ids(file_ids: List[int]) -> List[int]:
+    # Keep the caller's order but drop repeats
+    file_ids = list(dict.fromkeys(file_ids))
+    if not file_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No file ids given"
+        )
+    if len(file_ids) > settings.BULK_DOWNLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.BULK_DOWNLOAD_MAX_FILES} files can be requested at once"
+        )
+    return file_ids
+
+@router.get("/download-file/{file_id}", response_model=DownloadResponse)
+async def generate_download_link(
+    file_id: int,
+    durable: bool = False,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Only client users can download files
+    require_client_downloader(current_user)
     
-    download_link = f"http://localhost:8000/api/files/secure-download/{download_token}"
+    # Check if file exists
+    file_id_found = await db.scalar(select(FileRecord.id).where(FileRecord.id == file_id))
+    if file_id_found is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    
+    expires_at = datetime.utcnow() + timedelta(hours=settings.DOWNLOAD_LINK_TTL_HOURS)
+    download_token = issue_download_token(file_id, current_user.id, expires_at)
+    if durable:
+        await wait_for_audit_writes(db)
     
     return DownloadResponse(
-        download_link=download_link,
+        download_link=download_link(download_token),
         message="Secure download link generated successfully"
     )
 
-@router.get("/secure-download/{token}")
-async def secure_download(
-    token: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.post("/download-links", response_model=BulkDownloadResponse)
+async def generate_download_links(
+    bulk_request: BulkDownloadRequest,
+    durable: bool = False,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    # Only client users can access download links
-    if current_user.user_type != "client":
+    # Only client users can download files
+    require_client_downloader(current_user)
+    file_ids = unique_file_ids(bulk_request.file_ids)
+    
+    found = set((await db.scalars(select(FileRecord.id).where(FileRecord.id.in_(file_ids)))).all())
+    expires_at = datetime.utcnow() + timedelta(hours=settings.DOWNLOAD_LINK_TTL_HOURS)
+    links = [
+        BulkDownloadLink(
+            file_id=file_id,
+            download_link=download_link(issue_download_token(file_id, current_user.id, expires_at))
+        )
+        for file_id in file_ids if file_id in found
+    ]
+    if durable:
+        await wait_for_audit_writes(db)
+    
+    return BulkDownloadResponse(
+        links=links,
+        missing_file_ids=[file_id for file_id in file_ids if file_id not in found],
+        message=f"Generated {len(links)} secure download links"
+    )
+
+def safe_filename(filename: str) -> str:
+    # Drop any directories, or extracting an archive could escape the target folder
+    return filename.replace("\\", "/").rsplit("/", 1)[-1].lstrip(".") or "file"
+
+def archive_entry_name(filename: str, taken: set) -> str:
+    # Unique, case-insensitively, within one archive
+    name = safe_filename(filename)
+    stem, dot, suffix = name.rpartition(".")
+    if not dot:
+        stem, suffix = name, ""
+    candidate, copy = name, 1
+    while candidate.lower() in taken:
+        copy += 1
+        candidate = f"{stem} ({copy}){dot}{suffix}"
+    taken.add(candidate.lower())
+    return candidate
+
+async def record_archive_download(file_ids: List[int], user_id: int) -> None:
+    """Queue download history entries for the files sent in an archive.
+
+    Runs after the archive has been sent.
+    """
+    expires_at = datetime.utcnow() + timedelta(hours=settings.DOWNLOAD_LINK_TTL_HOURS)
+    for file_id in file_ids:
+        audit_writer.add_link(PendingLink(
+            token=generate_download_token(),
+            user_id=user_id,
+            file_id=file_id,
+            expires_at=expires_at,
+            is_used=True
+        ))
+
+@router.post("/archive")
+async def download_archive(
+    archive_request: ArchiveRequest,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Only client users can download files
+    require_client_downloader(current_user)
+    file_ids = unique_file_ids(archive_request.file_ids)
+    
+    file_records = {
+        file_record.id: file_record
+        for file_record in (await db.scalars(select(FileRecord).where(FileRecord.id.in_(file_ids)))).all()
+    }
+    missing = [file_id for file_id in file_ids if file_id not in file_records]
+    if missing:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied. Only client users can download files"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Files not found: {', '.join(map(str, missing))}"
         )
     
-    # Find download record
-    download_record = db.query(DownloadRecord).filter(
-        DownloadRecord.download_token == token,
-        DownloadRecord.user_id == current_user.id
-    ).first()
+    entries = []
+    taken = set()
+    for file_id in file_ids:
+        file_record = file_records[file_id]
+        try:
+            stored = await stat_stored_object(file_record.storage_key)
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"File not found on server: {file_record.original_filename}"
+            )
+        entries.append(ZipEntry(
+            name=archive_entry_name(file_record.original_filename, taken),
+            path=storage.local_path(file_record.storage_key),
+            size=stored.size,
+            modified=file_record.uploaded_at or stored.modified,
+            opener=partial(storage.open, file_record.storage_key)
+        ))
+    
+    # Don't hold a pooled connection while the archive streams
+    await db.rollback()
     
-    if not download_record:
+    archive = ZipStream(entries)
+    archive_name = safe_filename(archive_request.filename or "files.zip")
+    if not archive_name.lower().endswith(".zip"):
+        archive_name += ".zip"
+    return StreamingResponse(
+        archive,
+        media_type="application/zip",
+        headers={
+            "content-length": str(archive.content_length()),
+            "content-disposition": content_disposition(archive_name)
+        },
+        background=BackgroundTask(record_archive_download, file_ids, current_user.id)
+    )
+
+async def stat_stored_object(storage_key: str) -> ObjectInfo:
+    # Local files are stat'ed on the loop as before; remote stores are a network call
+    if storage.local_path(storage_key) is not None:
+        return storage.stat(storage_key)
+    return await anyio.to_thread.run_sync(storage.stat, storage_key)
+
+def file_etag(file_record: FileRecord) -> str:
+    # Stored content never changes, so the digest is a strong validator
+    if file_record.sha256:
+        return f'"{file_record.sha256}"'
+    return f'"{file_record.id}-{file_record.file_size}"'
+
+async def refresh_download_deny_list(db: AsyncSession) -> None:
+    """Reload the revoked signed-token ids when the local copy is stale."""
+    if not download_deny_list.needs_refresh():
+        return
+    # Expired ids are deleted by the "revoked_tokens" maintenance job; just skip them here
+    rows = await db.execute(
+        select(RevokedDownloadToken.token_id, RevokedDownloadToken.expires_at)
+        .where(RevokedDownloadToken.expires_at >= datetime.utcnow())
+    )
+    download_deny_list.replace(rows.all())
+
+async def check_signed_download_token(db: AsyncSession, token: str, current_user: Principal) -> DownloadClaims:
+    claims = verify_signed_download_token(token)
+    if claims.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Invalid download link or access denied"
         )
-    
-    # Check if expired
-    if download_record.expires_at < datetime.utcnow():
+    if claims.expires_at < datetime.utcnow():
         raise HTTPException(
             status_code=status.HTTP_410_GONE,
             detail="Download link has expired"
         )
+    await refresh_download_deny_list(db)
+    if download_deny_list.is_revoked(claims.token_id):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Download link has been revoked"
+        )
+    return claims
+
+async def record_signed_download(token: str, claims: DownloadClaims) -> None:
+    """Queue the download history entry for a signed link.
+
+    Runs after the response has been sent. The audit writer records a link
+    once, however many requests (e.g. ranges) it serves.
+    """
+    audit_writer.add_link(PendingLink(
+        token=token,
+        user_id=claims.user_id,
+        file_id=claims.file_id,
+        expires_at=claims.expires_at,
+        is_used=True
+    ))
+
+@router.get("/secure-download/{token}")
+async def secure_download(
+    token: str,
+    request: Request,
+    durable: bool = False,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Only client users can access download links
+    if current_user.user_type != "client":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied. Only client users can download files"
+        )
+    
+    download_record = None
+    background = None
+    if is_signed_download_token(token):
+        claims = await check_signed_download_token(db, token, current_user)
+        file_id = claims.file_id
+        background = BackgroundTask(record_signed_download, token, claims)
+    else:
+        # Find download record, including one still waiting to be written.
+        # The queue is checked first: a link leaves it only once its row is
+        # committed, so checking the table first could miss it in between.
+        pending = audit_writer.pending_link(token)
+        if pending is not None:
+            download_record = pending if pending.user_id == current_user.id else None
+        else:
+            # Only columns in the token lookup index are read
+            download_record = (await db.execute(select(
+                DownloadRecord.file_id,
+                DownloadRecord.expires_at
+            ).where(
+                DownloadRecord.download_token == token,
+                DownloadRecord.user_id == current_user.id
+            ))).first()
+        
+        if not download_record:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Invalid download link or access denied"
+            )
+        
+        # Check if expired
+        if download_record.expires_at < datetime.utcnow():
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Download link has expired"
+            )
+        file_id = download_record.file_id
     
     # Get file record
-    file_record = db.query(FileRecord).filter(FileRecord.id == download_record.file_id).first()
+    file_record = await db.scalar(select(FileRecord).where(FileRecord.id == file_id))
     if not file_record:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found"
         )
     
-    # Check if file exists on disk
-    if not os.path.exists(file_record.file_path):
+    # Check if the file is still in storage
+    try:
+        stored = await stat_stored_object(file_record.storage_key)
+    except FileNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found on server"
         )
     
-    # Mark as used
-    download_record.is_used = True
-    db.commit()
-    
-    return FileResponse(
-        path=file_record.file_path,
+    response = conditional_file_response(
+        request,
+        path=storage.local_path(file_record.storage_key),
+        file_size=stored.size,
         filename=file_record.original_filename,
-        media_type='application/octet-stream'
+        etag=file_etag(file_record),
+        last_modified=file_record.uploaded_at or stored.modified,
+        background=background,
+        opener=partial(storage.open, file_record.storage_key)
     )
+    
+    # Don't hold a pooled connection while the file streams
+    await db.rollback()
+    
+    if download_record is not None:
+        # Mark as used
+        audit_writer.mark_used(token)
+    if durable:
+        await audit_writer.wait_durable()
+    
+    return response
+
+@router.delete("/download-links/{token}")
+async def revoke_download_link(
+    token: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Only the client a link was issued to can revoke it
+    if current_user.user_type != "client":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only client users can revoke download links"
+        )
+    
+    if is_signed_download_token(token):
+        claims = verify_signed_download_token(token)
+        if claims.user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Invalid download link or access denied"
+            )
+        if claims.expires_at > datetime.utcnow():
+            if await db.get(RevokedDownloadToken, claims.token_id) is None:
+                db.add(RevokedDownloadToken(token_id=claims.token_id, expires_at=claims.expires_at))
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    # A concurrent request revoked it first
+                    await db.rollback()
+            download_deny_list.add(claims.token_id, claims.expires_at)
+    else:
+        # Links still waiting in the audit queue must be written before they can be revoked
+        await wait_for_audit_writes(db)
+        revoked = await db.execute(
+            update(DownloadRecord)
+            .where(
+                DownloadRecord.download_token == token,
+                DownloadRecord.user_id == current_user.id
+            )
+            .values(expires_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if not revoked.rowcount:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Invalid download link or access denied"
+            )
+    
+    return {"message": "Download link revoked"}
+
+async def pending_download_history(db: AsyncSession, user_id: int, now: datetime) -> List[dict]:
+    """History entries for this user's downloads still queued in this process.
+
+    They are newer than anything written, so they head the first page, on
+    top of its limit, without an id yet. Signed links are queued again on
+    every download; one that is already written is listed from the table.
+    """
+    pending = audit_writer.pending_links_for(user_id)
+    if not pending:
+        return []
+    written = set(await db.scalars(
+        select(DownloadRecord.download_token)
+        .where(DownloadRecord.download_token.in_([link.token for link in pending]))
+    ))
+    files = {
+        row.id: row
+        for row in await db.execute(
+            select(FileRecord.id, FileRecord.original_filename, FileRecord.file_type)
+            .where(FileRecord.id.in_({link.file_id for link in pending}))
+        )
+    }
+    return [
+        {
+            "id": None,
+            "filename": files[link.file_id].original_filename,
+            "file_type": files[link.file_id].file_type,
+            "downloaded_at": link.downloaded_at,
+            "download_url": download_link(link.token),
+            "status": "expired" if link.expires_at < now else "completed",
+        }
+        for link in pending
+        if link.token not in written and link.file_id in files
+    ]
 
 @router.get("/download-history", response_model=List[DownloadHistoryItem])
 async def get_download_history(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = PAGE_SIZE,
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     # Only client users can view download history
     if current_user.user_type != "client":
@@ -229,30 +1094,71 @@ async def get_download_history(
             detail="Only client users can view download history"
         )
     
-    downloads = db.query(DownloadRecord).filter(
-        DownloadRecord.user_id == current_user.id
-    ).order_by(DownloadRecord.downloaded_at.desc()).all()
+    # Newest first; ids are assigned in download order. The inner join skips
+    # downloads whose file has since been deleted.
+    statement = select(DownloadRecord).join(DownloadRecord.file).options(
+        contains_eager(DownloadRecord.file)
+    ).where(DownloadRecord.user_id == current_user.id)
+    downloads, next_cursor = await keyset_page(db, statement, [DownloadRecord.id], True, cursor, limit)
     
-    history = []
-    for download in downloads:
-        file_record = db.query(FileRecord).filter(FileRecord.id == download.file_id).first()
-        if file_record:
-            status_text = "expired" if download.expires_at < datetime.utcnow() else "completed"
-            history.append(DownloadHistoryItem(
-                id=download.id,
-                filename=file_record.original_filename,
-                file_type=file_record.file_type,
-                downloaded_at=download.downloaded_at,
-                download_url=f"http://localhost:8000/api/files/secure-download/{download.download_token}",
-                status=status_text
-            ))
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id": download.id,
+            "filename": download.file.original_filename,
+            "file_type": download.file.file_type,
+            "downloaded_at": download.downloaded_at,
+            "download_url": download_link(download.download_token),
+            "status": "expired" if download.expires_at < now else "completed",
+        }
+        for download in downloads
+    ]
+    if not cursor:
+        rows[:0] = await pending_download_history(db, current_user.id, now)
+    return page_response(rows, next_cursor)
+
+@router.get("/download-history/archive", response_model=List[ArchivedDownloadItem])
+async def get_archived_download_history(
+    limit: int = PAGE_SIZE,
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Only client users can view download history
+    if current_user.user_type != "client":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only client users can view download history"
+        )
     
-    return history
+    # Downloads whose links expired and were moved out of the live table,
+    # newest first; they carry the ids they had there
+    statement = select(ArchivedDownload).join(ArchivedDownload.file).options(
+        contains_eager(ArchivedDownload.file)
+    ).where(ArchivedDownload.user_id == current_user.id)
+    downloads, next_cursor = await keyset_page(db, statement, [ArchivedDownload.id], True, cursor, limit)
+    
+    return page_response([
+        {
+            "id": download.id,
+            "filename": download.file.original_filename,
+            "file_type": download.file.file_type,
+            "downloaded_at": download.downloaded_at,
+            "expires_at": download.expires_at,
+            "is_used": bool(download.is_used),
+        }
+        for download in downloads
+    ], next_cursor)
 
 @router.get("/uploaded", response_model=List[FileInfo])
 async def get_uploaded_files(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    limit: int = PAGE_SIZE,
+    cursor: Optional[str] = None,
+    file_type: Optional[str] = None,
+    sort: FileSort = "-uploaded_at",
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     # Only ops users can view uploaded files
     if current_user.user_type != "ops":
@@ -261,18 +1167,246 @@ async def get_uploaded_files(
             detail="Only operations users can view uploaded files"
         )
     
-    files = db.query(FileRecord).filter(FileRecord.uploaded_by == current_user.id).all()
-    file_list = []
+    async def build():
+        statement = select(FileRecord).where(FileRecord.uploaded_by == current_user.id)
+        if file_type:
+            statement = statement.where(FileRecord.file_type == file_type)
+        keys, descending = FILE_SORT_KEYS[sort]
+        files, next_cursor = await keyset_page(db, statement, keys, descending, cursor, limit)
+        return page_response([file_info(file, current_user.email) for file in files], next_cursor)
     
-    for file in files:
-        file_list.append(FileInfo(
-            id=file.id,
-            filename=file.original_filename,
-            original_filename=file.original_filename,
-            file_type=file.file_type,
-            file_size=file.file_size,
-            uploaded_by=current_user.email,
-            uploaded_at=file.uploaded_at
-        ))
+    key = ("uploaded", current_user.id, limit, cursor, file_type, sort)
+    return await listing_cache.page(request, key, build)
+
+# Previews
+#
+# Made in the background after upload (app/core/previews.py) and kept per
+# content digest. A file's content never changes, so a preview is cached by
+# clients until the preview format does.
+
+async def get_previewable_file(db: AsyncSession, file_id: int, current_user: Principal):
+    """The file's digest, storage key and preview row, for users who can see the file."""
+    row = (await db.execute(
+        select(FileRecord.sha256, FileRecord.storage_key, FileRecord.uploaded_by, FilePreview)
+        .outerjoin(FilePreview, FilePreview.sha256 == FileRecord.sha256)
+        .where(FileRecord.id == file_id)
+    )).first()
+    # Clients see the whole catalog; ops users see the files they uploaded
+    if row is None or (current_user.user_type != "client" and row.uploaded_by != current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return row
+
+def preview_etag(sha256: str) -> str:
+    return f'"{sha256[:32]}.{PREVIEW_VERSION}"'
+
+PREVIEW_CACHE_CONTROL = "private, max-age=86400"
+
+@router.get("/{file_id}/preview")
+async def get_file_preview(
+    file_id: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    sha256, storage_key, _, preview = await get_previewable_file(db, file_id, current_user)
+    if sha256 is None:
+        # Stored before content addressing; the maintenance job only knows blobs
+        return FastJSONResponse({"file_id": file_id, "status": "unavailable"})
+    if (
+        preview is None
+        or preview.version < PREVIEW_VERSION
+        or (preview.status == "failed" and preview.attempts < settings.PREVIEW_MAX_ATTEMPTS)
+    ):
+        # Queueing again is harmless: jobs skip content that already has a preview
+        preview_generator.add(sha256, storage_key)
+        return FastJSONResponse(
+            {"file_id": file_id, "status": "pending"},
+            status_code=status.HTTP_202_ACCEPTED,
+            headers={"Retry-After": "2", "Cache-Control": "no-store"}
+        )
+    
+    etag = preview_etag(sha256)
+    headers = {"ETag": etag, "Cache-Control": PREVIEW_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    body = {"file_id": file_id, "status": preview.status}
+    if preview.status == "ready":
+        body.update(orjson.loads(preview.content))
+        body["thumbnail_url"] = f"/api/files/{file_id}/thumbnail" if preview.thumbnail_key else None
+    return FastJSONResponse(body, headers=headers)
+
+@router.get("/{file_id}/thumbnail")
+async def get_file_thumbnail(
+    file_id: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    sha256, _, _, preview = await get_previewable_file(db, file_id, current_user)
+    if preview is None or preview.version != PREVIEW_VERSION or not preview.thumbnail_key:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No thumbnail for this file"
+        )
+    thumbnail_key, thumbnail_type = preview.thumbnail_key, preview.thumbnail_type
+    # Don't hold a pooled connection while the image is read
+    await db.close()
+    
+    etag = preview_etag(sha256)
+    headers = {"ETag": etag, "Cache-Control": PREVIEW_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    def read_thumbnail() -> bytes:
+        with storage.open(thumbnail_key) as thumbnail:
+            return thumbnail.read()
+    
+    try:
+        content = await anyio.to_thread.run_sync(read_thumbnail)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No thumbnail for this file"
+        )
+    return Response(content, media_type=thumbnail_type, headers=headers)
+
+@router.get("/previews")
+async def get_preview_stats(current_user: Principal = Depends(get_current_user)):
+    # Only ops users can inspect preview generation
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view preview statistics"
+        )
+    return preview_generator.stats()
+
+@router.get("/upload-validation")
+async def get_upload_validation_stats(current_user: Principal = Depends(get_current_user)):
+    # Only ops users can inspect upload checks
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view upload validation statistics"
+        )
+    return package_validator.stats()
+
+@router.get("/audit-queue")
+async def get_audit_queue_stats(current_user: Principal = Depends(get_current_user)):
+    # Only ops users can inspect the audit queue
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view audit statistics"
+        )
+    return audit_writer.stats()
+
+@router.get("/events")
+async def catalog_events(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Only client users can follow the catalog, as only they can list it
+    if current_user.user_type != "client":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only client users can follow catalog changes"
+        )
+    
+    # Streams stay open for hours; don't hold a pooled connection meanwhile
+    await db.close()
+    
+    if catalog_feed.connections >= catalog_feed.max_connections:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open event streams",
+            headers={"Retry-After": "30"}
+        )
+    
+    return StreamingResponse(
+        catalog_feed.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/event-streams")
+async def get_event_stream_stats(current_user: Principal = Depends(get_current_user)):
+    # Check if user is ops
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view event stream statistics"
+        )
+    return catalog_feed.stats()
+
+@router.get("/listing-cache")
+async def get_listing_cache_stats(current_user: Principal = Depends(get_current_user)):
+    # Only ops users can inspect the listing cache
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view cache statistics"
+        )
+    return listing_cache.stats()
+
+@router.get("/maintenance")
+async def get_maintenance_stats(current_user: Principal = Depends(get_current_user)):
+    # Only ops users can inspect background maintenance
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view maintenance statistics"
+        )
+    return maintenance_scheduler.stats()
+
+@router.delete("/{file_id}")
+async def delete_file(
+    file_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Only the ops user who uploaded a file can delete it
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can delete files"
+        )
+    
+    # Queued download records for this file must be written before they are deleted
+    await wait_for_audit_writes(db)
+    
+    file_record = await db.scalar(select(FileRecord).where(
+        FileRecord.id == file_id,
+        FileRecord.uploaded_by == current_user.id
+    ))
+    if not file_record:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    
+    if file_record.sha256:
+        orphaned_keys = await release_blob(db, file_record.sha256)
+    else:
+        # Stored before content addressing; the object belongs to this record alone
+        orphaned_keys = [file_record.storage_key]
+    for model in (DownloadRecord, ArchivedDownload):
+        await db.execute(
+            delete(model)
+            .where(model.file_id == file_id)
+            .execution_options(synchronize_session=False)
+        )
+    await db.execute(delete_statement(db, file_id))
+    await db.delete(file_record)
+    await db.commit()
+    publish_catalog_change({"type": "file.removed", "file_id": file_id})
+    
+    for orphaned_key in orphaned_keys:
+        await anyio.to_thread.run_sync(storage.delete, orphaned_key)
     
-    return file_list
\ No newline at end of file
+    return {"message": "File deleted successfully"}
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+import anyio
+
+from app.routers.auth import get_current_user
+from app.core.principal_cache import Principal
+from app.core.profiling import profiler
+
+router = APIRouter()
+
+def require_ops(current_user: Principal):
+    # Only ops users can read profiles
+    if current_user.user_type != "ops":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operations users can view profiles"
+        )
+
+@router.get("/")
+async def list_profiles(current_user: Principal = Depends(get_current_user)):
+    require_ops(current_user)
+    return await anyio.to_thread.run_sync(profiler.store.list)
+
+@router.get("/{profile_id}")
+async def download_profile(profile_id: str, current_user: Principal = Depends(get_current_user)):
+    require_ops(current_user)
+    path = profiler.store.path(profile_id)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    # Collapsed stacks, ready for flamegraph.pl or speedscope
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
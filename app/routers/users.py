@@ -1,22 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Literal
 
 from app.database import get_db
 from app.models import User
 from app.routers.auth import get_current_user
+from app.core.principal_cache import Principal
+from app.core.pagination import keyset_page
+from app.core.responses import page_response
 from app.schemas import User as UserSchema
 
 router = APIRouter()
 
 @router.get("/profile", response_model=UserSchema)
-async def get_user_profile(current_user: User = Depends(get_current_user)):
+async def get_user_profile(current_user: Principal = Depends(get_current_user)):
     return current_user
 
 @router.get("/", response_model=List[UserSchema])
 async def list_users(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    user_type: Optional[Literal["ops", "client"]] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     # Only ops users can list all users
     if current_user.user_type != "ops":
@@ -25,5 +32,17 @@ async def list_users(
             detail="Only operations users can list users"
         )
     
-    users = db.query(User).all()
-    return users
\ No newline at end of file
+    statement = select(User)
+    if user_type:
+        statement = statement.where(User.user_type == user_type)
+    users, next_cursor = await keyset_page(db, statement, [User.id], False, cursor, limit)
+    return page_response([
+        {
+            "id": user.id,
+            "email": user.email,
+            "user_type": user.user_type,
+            "is_verified": user.is_verified,
+            "created_at": user.created_at,
+        }
+        for user in users
+    ], next_cursor)
\ No newline at end of file
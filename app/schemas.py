@@ -39,8 +39,21 @@ class FileUploadResponse(BaseModel):
     filename: str
     file_type: str
     file_size: int
+    sha256: str
     message: str
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    file_size: int
+    sha256: Optional[str] = None
+
+class UploadSessionInfo(BaseModel):
+    id: str
+    filename: str
+    file_size: int
+    offset: int
+    expires_at: datetime
+
 class FileInfo(BaseModel):
     id: int
     filename: str
@@ -57,8 +70,25 @@ class DownloadResponse(BaseModel):
     download_link: str
     message: str
 
+class BulkDownloadRequest(BaseModel):
+    file_ids: List[int]
+
+class BulkDownloadLink(BaseModel):
+    file_id: int
+    download_link: str
+
+class BulkDownloadResponse(BaseModel):
+    links: List[BulkDownloadLink]
+    missing_file_ids: List[int]
+    message: str
+
+class ArchiveRequest(BaseModel):
+    file_ids: List[int]
+    filename: Optional[str] = None
+
 class DownloadHistoryItem(BaseModel):
-    id: int
+    # None for a download this worker hasn't written to the database yet
+    id: Optional[int] = None
     filename: str
     file_type: str
     downloaded_at: datetime
@@ -68,6 +98,17 @@ class DownloadHistoryItem(BaseModel):
     class Config:
         from_attributes = True
 
+class ArchivedDownloadItem(BaseModel):
+    id: int
+    filename: str
+    file_type: str
+    downloaded_at: datetime
+    expires_at: datetime
+    is_used: bool
+    
+    class Config:
+        from_attributes = True
+
 # Email verification
 class EmailVerificationResponse(BaseModel):
     encrypted_url: str
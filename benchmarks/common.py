@@ -0,0 +1,86 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench_environment(workdir: Path) -> dict:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    env["UPLOAD_DIR"] = str(workdir / "uploads")
+    env["PYTHONPATH"] = str(ROOT)
+    # Benchmarks drive more traffic from one address than the rate limits allow
+    env["ADMISSION_ENABLED"] = "false"
+    return env
+
+
+def seed_user(env: dict, workdir: Path, email: str, password: str, user_type: str) -> None:
+    """Create a verified user in the benchmark database."""
+    script = (
+        "from app.database import SessionLocal\n"
+        "from app.models import User\n"
+        "from app.core.migrations import upgrade_database\n"
+        "from app.core.security import get_password_hash\n"
+        "upgrade_database()\n"
+        "db = SessionLocal()\n"
+        f"db.add(User(email={email!r}, hashed_password=get_password_hash({password!r}),"
+        f" user_type={user_type!r}, is_verified=True))\n"
+        "db.commit()\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=workdir, env=env, check=True)
+
+
+@contextlib.contextmanager
+def running_server(workers: int = 1, env: dict = None):
+    """Start uvicorn against a throwaway database and yield its base URL."""
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        env = {**bench_environment(workdir), **(env or {})}
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app",
+             "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=workdir,
+            env=env,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    httpx.get(f"{base_url}/health", timeout=1)
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline or process.poll() is not None:
+                        raise RuntimeError("server did not start")
+                    time.sleep(0.1)
+            yield base_url, env, workdir
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
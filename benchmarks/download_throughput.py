@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Measure secure download throughput for a large file, whole and by ranges.
+
+    python -m benchmarks.download_throughput --size-mb 256
+"""
+import argparse
+import time
+
+import httpx
+
+from benchmarks.common import running_server, seed_user
+from tests.documents import minimal_docx
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def login(client: httpx.Client, email: str, password: str, user_type: str) -> str:
+    response = client.post(
+        "/api/auth/login",
+        json={"email": email, "password": password, "user_type": user_type},
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def timed_download(client: httpx.Client, path: str, token: str, headers: dict = None) -> tuple:
+    started = time.perf_counter()
+    received = 0
+    with client.stream("GET", path, headers={"Authorization": f"Bearer {token}", **(headers or {})}) as response:
+        for chunk in response.iter_raw():
+            received += len(chunk)
+    return received, time.perf_counter() - started
+
+
+def run(base_url: str, size_mb: int, rounds: int) -> None:
+    payload = minimal_docx(size_mb * 1024 * 1024)
+    with httpx.Client(base_url=base_url, timeout=600) as client:
+        ops_token = login(client, "bench-ops@example.com", "benchpass123", "ops")
+        client_token = login(client, "bench-client@example.com", "benchpass123", "client")
+        file_id = client.post(
+            "/api/files/upload",
+            files={"file": ("large.docx", payload, DOCX_MIME)},
+            headers={"Authorization": f"Bearer {ops_token}"},
+        ).json()["id"]
+        link = client.get(
+            f"/api/files/download-file/{file_id}",
+            headers={"Authorization": f"Bearer {client_token}"},
+        ).json()["download_link"]
+        path = link.split("localhost:8000", 1)[1]
+
+        half = len(payload) // 2
+        quarter = len(payload) // 4
+        four_ranges = ",".join(f"{i * quarter}-{i * quarter + quarter // 2}" for i in range(4))
+        cases = (
+            ("full body", None),
+            ("second half (Range)", {"Range": f"bytes={half}-"}),
+            ("4 ranges (multipart)", {"Range": f"bytes={four_ranges}"}),
+        )
+        for label, headers in cases:
+            best = None
+            for _ in range(rounds):
+                received, elapsed = timed_download(client, path, client_token, headers)
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{label}: {received / 1024 / 1024:.1f} MB in {best * 1000:.1f} ms "
+                  f"({received / 1024 / 1024 / best:.1f} MB/s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    env = {"MAX_FILE_SIZE": str((args.size_mb + 1) * 1024 * 1024)}
+    with running_server(env=env) as (base_url, server_env, workdir):
+        seed_user(server_env, workdir, "bench-ops@example.com", "benchpass123", "ops")
+        seed_user(server_env, workdir, "bench-client@example.com", "benchpass123", "client")
+        run(base_url, args.size_mb, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Compare serialization time and bytes on the wire for a large file listing.
+
+The "model" path is what a handler returning response models costs: build
+a FileInfo per row, re-validate the list against the response_model, encode
+it and render with the standard json module. The "trusted" path builds plain
+dicts and renders them with orjson, as the listing endpoints now do.
+Compressed sizes and times are measured on the rendered body.
+
+    python -m benchmarks.json_listing --rows 10000
+"""
+import argparse
+import gzip
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.core.compression import brotli
+from app.core.config import settings
+from app.core.responses import FastJSONResponse
+from app.schemas import FileInfo
+
+
+def sample_rows(count: int) -> List[dict]:
+    started = datetime(2024, 1, 1)
+    return [
+        {
+            "id": index,
+            "filename": f"quarterly-report-{index:05d}.xlsx",
+            "original_filename": f"quarterly-report-{index:05d}.xlsx",
+            "file_type": "xlsx",
+            "file_size": 1000 + index * 37,
+            "uploaded_by": f"ops{index % 7}@example.com",
+            "uploaded_at": started + timedelta(seconds=index * 61, microseconds=index),
+        }
+        for index in range(count)
+    ]
+
+
+def model_path(rows: List[dict]) -> bytes:
+    models = [FileInfo(**row) for row in rows]
+    validated = TypeAdapter(List[FileInfo]).validate_python(models, from_attributes=True)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def trusted_path(rows: List[dict]) -> bytes:
+    return FastJSONResponse([dict(row) for row in rows]).body
+
+
+def best_of(function, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings), result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = sample_rows(args.rows)
+    model_ms, model_body = best_of(lambda: model_path(rows), args.repeat)
+    trusted_ms, trusted_body = best_of(lambda: trusted_path(rows), args.repeat)
+    assert model_body == trusted_body, "the two paths must render identical JSON"
+
+    def report(label: str, ms: float, body: bytes, note: str = "") -> None:
+        print(f"{label:<20}{ms:8.1f}ms {len(body):>12,} bytes  {note}")
+
+    print(f"{args.rows} rows, identical JSON from both paths")
+    report("model + json", model_ms, model_body)
+    report("trusted + orjson", trusted_ms, trusted_body, f"{model_ms / trusted_ms:.0f}x faster")
+
+    gzip_ms, gzipped = best_of(
+        lambda: gzip.compress(trusted_body, compresslevel=settings.GZIP_COMPRESSION_LEVEL), args.repeat
+    )
+    report(f"gzip level {settings.GZIP_COMPRESSION_LEVEL}", gzip_ms, gzipped,
+           f"{len(trusted_body) / len(gzipped):.1f}x smaller")
+    if brotli is not None:
+        brotli_ms, brotlied = best_of(
+            lambda: brotli.compress(trusted_body, quality=settings.BROTLI_QUALITY), args.repeat
+        )
+        report(f"brotli quality {settings.BROTLI_QUALITY}", brotli_ms, brotlied,
+               f"{len(trusted_body) / len(brotlied):.1f}x smaller")
+    else:
+        print("brotli: not installed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Drive the API with scripted ops and client users and report latency per endpoint.
+
+Ops users log in, upload documents and page through their uploads. Client
+users sign up, verify their email, log in, then browse the file list,
+generate download links, download and check their history. Every request
+is timed and reported per endpoint as throughput and p50/p95/p99.
+
+The app runs in-process (httpx's ASGI transport, one event loop shared
+with the users) or as a uvicorn server with --workers processes. Both use a
+throwaway SQLite database unless --database-url points at a local Postgres.
+
+    python -m benchmarks.load_test --duration 30 --ops 2 --clients 8
+    python -m benchmarks.load_test --target server --workers 4 --save baseline.json
+    python -m benchmarks.load_test --target server --workers 4 --compare baseline.json
+
+With --compare, endpoints whose p95 grew or whose throughput dropped by more
+than --tolerance are flagged and the exit status is 1.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import bench_environment, percentile, running_server, seed_user
+from tests.documents import minimal_docx
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PASSWORD = "benchpass123"
+
+
+class Recorder:
+    """Latencies and status codes per endpoint label."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Dict[str, int] = Counter()
+
+    async def request(self, client: httpx.AsyncClient, label: str, method: str, url: str,
+                      expect=(200,), **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            return None
+        self.latencies[label].append((time.perf_counter() - started) * 1000)
+        self.statuses[label][response.status_code] += 1
+        if response.status_code not in expect:
+            self.errors[label] += 1
+            return None
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for label in sorted(set(self.latencies) | set(self.errors)):
+            samples = self.latencies[label]
+            endpoints[label] = {
+                "count": len(samples),
+                "errors": self.errors[label],
+                "rps": len(samples) / elapsed,
+                "p50_ms": percentile(samples, 50),
+                "p95_ms": percentile(samples, 95),
+                "p99_ms": percentile(samples, 99),
+                "max_ms": max(samples, default=0.0),
+                "statuses": {str(code): count for code, count in sorted(self.statuses[label].items())},
+            }
+        everything = [sample for samples in self.latencies.values() for sample in samples]
+        total = {
+            "count": len(everything),
+            "errors": sum(self.errors.values()),
+            "rps": len(everything) / elapsed,
+            "p50_ms": percentile(everything, 50),
+            "p95_ms": percentile(everything, 95),
+            "p99_ms": percentile(everything, 99),
+            "max_ms": max(everything, default=0.0),
+        }
+        return {"elapsed_seconds": elapsed, "endpoints": endpoints, "total": total}
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def login(client: httpx.AsyncClient, recorder: Recorder, email: str, user_type: str) -> Optional[str]:
+    response = await recorder.request(
+        client, "POST /api/auth/login", "POST", "/api/auth/login",
+        json={"email": email, "password": PASSWORD, "user_type": user_type},
+    )
+    return response.json()["access_token"] if response is not None else None
+
+
+async def pause(think_ms: float) -> None:
+    if think_ms:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * think_ms / 1000)
+    else:
+        # Let the other users in even when nothing here awaits
+        await asyncio.sleep(0)
+
+
+async def ops_user(client: httpx.AsyncClient, recorder: Recorder, email: str, deadline: float,
+                   document: bytes, think_ms: float) -> None:
+    token = await login(client, recorder, email, "ops")
+    if token is None:
+        return
+    headers = bearer(token)
+    uploaded = 0
+    while time.monotonic() < deadline:
+        await recorder.request(
+            client, "POST /api/files/upload", "POST", "/api/files/upload",
+            files={"file": (f"load-{uploaded}.docx", document, DOCX_MIME)},
+            headers=headers,
+        )
+        uploaded += 1
+        await pause(think_ms)
+        await recorder.request(
+            client, "GET /api/files/uploaded", "GET", "/api/files/uploaded",
+            params={"limit": 50}, headers=headers,
+        )
+        await pause(think_ms)
+
+
+async def client_user(client: httpx.AsyncClient, recorder: Recorder, email: str, deadline: float,
+                      think_ms: float) -> None:
+    # Imported late: in-process runs must set the environment before app settings load
+    from app.core.security import decrypt_url
+
+    response = await recorder.request(
+        client, "POST /api/auth/signup", "POST", "/api/auth/signup",
+        json={"email": email, "password": PASSWORD},
+    )
+    if response is None:
+        return
+    # The benchmark shares ENCRYPTION_KEY with the server, so it can read the emailed link
+    verification_url = decrypt_url(response.json()["encrypted_url"].rsplit("/", 1)[1])
+    verification_token = verification_url.split("token=", 1)[1]
+    if await recorder.request(
+        client, "POST /api/auth/verify-email", "POST", "/api/auth/verify-email",
+        json={"token": verification_token},
+    ) is None:
+        return
+    token = await login(client, recorder, email, "client")
+    if token is None:
+        return
+    headers = bearer(token)
+    while time.monotonic() < deadline:
+        response = await recorder.request(
+            client, "GET /api/files/list", "GET", "/api/files/list",
+            params={"limit": 50}, headers=headers,
+        )
+        await pause(think_ms)
+        files = response.json() if response is not None else []
+        if not files:
+            await asyncio.sleep(0.05)
+            continue
+        file_id = random.choice(files)["id"]
+        response = await recorder.request(
+            client, "GET /api/files/download-file/{id}", "GET", f"/api/files/download-file/{file_id}",
+            headers=headers,
+        )
+        await pause(think_ms)
+        if response is not None:
+            path = "/api/files/secure-download/" + response.json()["download_link"].rsplit("/", 1)[1]
+            await recorder.request(
+                client, "GET /api/files/secure-download/{token}", "GET", path, headers=headers,
+            )
+            await pause(think_ms)
+        await recorder.request(
+            client, "GET /api/files/download-history", "GET", "/api/files/download-history",
+            params={"limit": 50}, headers=headers,
+        )
+        await pause(think_ms)
+
+
+async def run_users(client: httpx.AsyncClient, args: argparse.Namespace, ops_emails: List[str],
+                    run_id: str) -> dict:
+    recorder = Recorder()
+    document = minimal_docx(args.file_kb * 1024)
+    started = time.perf_counter()
+    deadline = time.monotonic() + args.duration
+    users = [
+        ops_user(client, recorder, email, deadline, document, args.think_ms)
+        for email in ops_emails
+    ] + [
+        client_user(client, recorder, f"load-client-{run_id}-{index}@example.com", deadline, args.think_ms)
+        for index in range(args.clients)
+    ]
+    await asyncio.gather(*users)
+    return recorder.report(time.perf_counter() - started)
+
+
+def seed_ops_users(env: dict, workdir: Path, count: int, run_id: str) -> List[str]:
+    emails = [f"load-ops-{run_id}-{index}@example.com" for index in range(count)]
+    for email in emails:
+        seed_user(env, workdir, email, PASSWORD, "ops")
+    return emails
+
+
+def client_limits(args: argparse.Namespace) -> httpx.Limits:
+    return httpx.Limits(max_connections=args.ops + args.clients + 5)
+
+
+async def run_in_process(args: argparse.Namespace, env: dict, ops_emails: List[str], run_id: str) -> dict:
+    # Settings are read when the app is imported, so the environment comes first
+    os.environ.update(env)
+    from app.main import app
+
+    # The ASGI transport doesn't run the lifespan, so start the worker up as a server would
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test",
+                                     timeout=300, limits=client_limits(args)) as client:
+            return await run_users(client, args, ops_emails, run_id)
+
+
+async def run_against(base_url: str, args: argparse.Namespace, ops_emails: List[str], run_id: str) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=client_limits(args)) as client:
+        return await run_users(client, args, ops_emails, run_id)
+
+
+def server_environment(args: argparse.Namespace) -> dict:
+    env = {}
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    if args.rounds:
+        env["BCRYPT_ROUNDS"] = str(args.rounds)
+    return env
+
+
+def run(args: argparse.Namespace) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    if args.target == "server":
+        with running_server(workers=args.workers, env=server_environment(args)) as (base_url, env, workdir):
+            ops_emails = seed_ops_users(env, workdir, args.ops, run_id)
+            result = asyncio.run(run_against(base_url, args, ops_emails, run_id))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            workdir = Path(tmp)
+            env = {**bench_environment(workdir), **server_environment(args)}
+            ops_emails = seed_ops_users(env, workdir, args.ops, run_id)
+            with contextlib.chdir(workdir):
+                result = asyncio.run(run_in_process(args, env, ops_emails, run_id))
+    result["meta"] = {
+        "target": args.target,
+        "workers": args.workers if args.target == "server" else None,
+        "database": "postgresql" if args.database_url and args.database_url.startswith("postgres") else "sqlite",
+        "duration_seconds": args.duration,
+        "ops_users": args.ops,
+        "client_users": args.clients,
+        "think_ms": args.think_ms,
+        "file_kb": args.file_kb,
+        "bcrypt_rounds": args.rounds,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "recorded_at": datetime.utcnow().isoformat() + "Z",
+    }
+    return result
+
+
+def print_report(result: dict) -> None:
+    meta = result["meta"]
+    workers = f", {meta['workers']} workers" if meta["workers"] else ""
+    print(
+        f"{meta['target']}{workers}, {meta['database']}, {meta['ops_users']} ops + "
+        f"{meta['client_users']} client users for {result['elapsed_seconds']:.1f}s"
+    )
+    print(f"{'endpoint':<42}{'count':>7}{'err':>5}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = list(result["endpoints"].items()) + [("total", result["total"])]
+    for label, stats in rows:
+        print(
+            f"{label:<42}{stats['count']:>7}{stats['errors']:>5}{stats['rps']:>8.1f}"
+            f"{stats['p50_ms']:>8.1f}ms{stats['p95_ms']:>7.1f}ms{stats['p99_ms']:>7.1f}ms{stats['max_ms']:>7.1f}ms"
+        )
+
+
+def compare(result: dict, baseline: dict, tolerance: float, min_ms: float) -> List[str]:
+    """Endpoints that got slower or less reliable than the baseline."""
+    regressions = []
+    for label, before in baseline["endpoints"].items():
+        after = result["endpoints"].get(label)
+        if after is None:
+            regressions.append(f"{label}: no requests completed (baseline had {before['count']})")
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance) and after["p95_ms"] - before["p95_ms"] > min_ms:
+            regressions.append(f"{label}: p95 {before['p95_ms']:.1f}ms -> {after['p95_ms']:.1f}ms")
+        if after["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {before['rps']:.1f} -> {after['rps']:.1f} req/s")
+        error_rate_before = before["errors"] / max(before["count"], 1)
+        error_rate_after = after["errors"] / max(after["count"], 1)
+        if error_rate_after > error_rate_before + 0.01:
+            regressions.append(f"{label}: error rate {error_rate_before:.1%} -> {error_rate_after:.1%}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["inprocess", "server"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (server target)")
+    parser.add_argument("--database-url", default=None, help="e.g. a local Postgres; SQLite by default")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load after sign-in")
+    parser.add_argument("--ops", type=int, default=2, help="ops users uploading")
+    parser.add_argument("--clients", type=int, default=8, help="client users browsing and downloading")
+    parser.add_argument("--think-ms", type=float, default=0, help="average pause between a user's requests")
+    parser.add_argument("--file-kb", type=int, default=64, help="size of each uploaded document")
+    parser.add_argument("--rounds", type=int, default=None, help="bcrypt cost for the server")
+    parser.add_argument("--save", type=Path, help="write the results as a JSON baseline")
+    parser.add_argument("--compare", type=Path, help="flag regressions against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95/throughput change")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="ignore p95 increases smaller than this")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.save:
+        args.save.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"saved baseline to {args.save}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        for key in ("target", "workers", "database", "ops_users", "client_users", "think_ms", "file_kb", "cpus"):
+            if baseline["meta"].get(key) != result["meta"][key]:
+                print(f"warning: {key} differs from the baseline "
+                      f"({baseline['meta'].get(key)} vs {result['meta'][key]})")
+        regressions = compare(result, baseline, args.tolerance, args.min_ms)
+        if regressions:
+            print(f"regressions against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"no regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
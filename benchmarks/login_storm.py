@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Measure login throughput and /health latency during a burst of logins.
+
+    python -m benchmarks.login_storm --logins 200 --concurrency 50 --rounds 12
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import running_server, seed_user, percentile
+from benchmarks.upload_concurrency import probe_health
+
+
+async def login(client: httpx.AsyncClient, latencies: list) -> int:
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/auth/login",
+        json={"email": "bench-ops@example.com", "password": "benchpass123", "user_type": "ops"},
+    )
+    latencies.append((time.perf_counter() - started) * 1000)
+    return response.status_code
+
+
+async def run(base_url: str, logins: int, concurrency: int) -> None:
+    limits = httpx.Limits(max_connections=concurrency + 5)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        idle = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(client, stop, idle))
+        await asyncio.sleep(1)
+        stop.set()
+        await prober
+
+        latencies = []
+        gate = asyncio.Semaphore(concurrency)
+
+        async def limited_login() -> int:
+            async with gate:
+                return await login(client, latencies)
+
+        loaded = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(client, stop, loaded))
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(limited_login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await prober
+
+    ok = sum(1 for code in statuses if code == 200)
+    shed = sum(1 for code in statuses if code == 503)
+    print(f"logins: {ok}/{logins} ok, {shed} shed with 503, {ok / elapsed:.1f} logins/s")
+    print(
+        f"login latency: p50={percentile(latencies, 50):.1f}ms "
+        f"p99={percentile(latencies, 99):.1f}ms"
+    )
+    for label, samples in (("idle", idle), ("during logins", loaded)):
+        print(
+            f"/health {label}: n={len(samples)} "
+            f"p50={percentile(samples, 50):.2f}ms p99={percentile(samples, 99):.2f}ms "
+            f"max={max(samples):.2f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost for the server")
+    parser.add_argument("--workers", type=int, default=None, help="password hashing threads")
+    args = parser.parse_args()
+
+    env = {"BCRYPT_ROUNDS": str(args.rounds)}
+    if args.workers:
+        env["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    with running_server(env=env) as (base_url, server_env, workdir):
+        seed_user(server_env, workdir, "bench-ops@example.com", "benchpass123", "ops")
+        asyncio.run(run(base_url, args.logins, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
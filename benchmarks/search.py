@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Search latency over a large index.
+
+Fills a throwaway SQLite database with synthetic documents (file names and
+a few hundred words of text each, drawn from a skewed vocabulary so some
+words are in most documents and most words in few), then runs the two
+queries /api/files/search runs for a page: the ranked id lookup and the
+page's file rows. Reported per kind of query:
+
+  rare        a word in a handful of documents
+  common      a word in most documents (only the newest matches are scored)
+  prefix      the first letters of a word, as typed
+  two words   a common and a rare word together
+
+    python -m benchmarks.search --documents 100000
+    python -m benchmarks.search --documents 100000 --budget-p95-ms 50
+
+With a budget, the exit status is 1 when any kind's p95 goes over it.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import percentile
+
+WORDS = 20000
+WORDS_PER_DOCUMENT = 300
+
+
+def word(rank: int) -> str:
+    # Distinct pronounceable words: "ba", "be", ... "bababe", ...
+    syllables = []
+    while True:
+        syllables.append("bcdfghjklmnpqrstvwz"[rank % 19] + "aeiou"[rank // 19 % 5])
+        rank //= 95
+        if not rank:
+            return "".join(syllables)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200, help="per kind of query")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--ranked", type=int, help="matches scored per query (default SEARCH_MAX_RANKED)")
+    parser.add_argument("--budget-p95-ms", type=float)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'search.db'}"
+        os.environ["UPLOAD_DIR"] = str(Path(tmp) / "uploads")
+        # Imported only now, so the app picks up the throwaway database
+        from sqlalchemy import insert, select, text
+        from sqlalchemy.orm import joinedload
+        from app.core.migrations import upgrade_database
+        from app.core.search import search_statement
+        from app.database import SessionLocal
+        from app.models import FileRecord, User
+
+        upgrade_database()
+        rng = random.Random(7)
+        vocabulary = [word(rank) for rank in range(WORDS)]
+        weights = [1 / (rank + 1) for rank in range(WORDS)]
+
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            db.add(User(id=1, email="search-bench@example.com", hashed_password="-", user_type="ops", is_verified=True))
+            for start in range(0, args.documents, 5000):
+                count = min(5000, args.documents - start)
+                db.execute(insert(FileRecord), [
+                    {
+                        "id": file_id,
+                        "filename": f"{file_id}.docx",
+                        "original_filename": f"{' '.join(rng.choices(vocabulary, weights, k=3))} {file_id}.docx",
+                        "storage_key": f"{file_id}.docx",
+                        "file_type": "docx",
+                        "file_size": 1000,
+                        "uploaded_by": 1,
+                    }
+                    for file_id in range(start + 1, start + count + 1)
+                ])
+                db.execute(
+                    text("INSERT INTO file_search (rowid, original_filename, content) "
+                         "SELECT id, original_filename, :content FROM files WHERE id = :file_id"),
+                    [
+                        {"file_id": file_id, "content": " ".join(rng.choices(vocabulary, weights, k=WORDS_PER_DOCUMENT))}
+                        for file_id in range(start + 1, start + count + 1)
+                    ]
+                )
+                db.commit()
+                print(f"\rindexed {start + count} documents", end="", file=sys.stderr)
+        print(f"\rindexed {args.documents} documents in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        queries = {
+            "rare": lambda: [vocabulary[rng.randrange(5000, WORDS)]],
+            "common": lambda: [vocabulary[rng.randrange(0, 5)]],
+            "prefix": lambda: [vocabulary[rng.randrange(100, 2000)][:3]],
+            "two words": lambda: [vocabulary[rng.randrange(0, 50)], vocabulary[rng.randrange(500, 5000)]],
+        }
+        over = []
+        with SessionLocal() as db:
+            for kind, terms_for in queries.items():
+                samples = []
+                matched = 0
+                for _ in range(args.queries):
+                    terms = terms_for()
+                    query_started = time.perf_counter()
+                    file_ids = db.scalars(search_statement(db, terms, None, args.limit + 1, 0, args.ranked)).all()
+                    db.scalars(
+                        select(FileRecord).options(joinedload(FileRecord.uploader))
+                        .where(FileRecord.id.in_(file_ids[:args.limit]))
+                    ).all()
+                    samples.append((time.perf_counter() - query_started) * 1000)
+                    matched += bool(file_ids)
+                p95 = percentile(samples, 95)
+                print(f"{kind:<10} p50 {percentile(samples, 50):7.2f}ms  p95 {p95:7.2f}ms  "
+                      f"p99 {percentile(samples, 99):7.2f}ms  ({matched}/{args.queries} with results)")
+                if args.budget_p95_ms is not None and p95 > args.budget_p95_ms:
+                    over.append(f"{kind}: p95 {p95:.1f}ms over the {args.budget_p95_ms:.1f}ms budget")
+    for line in over:
+        print(f"OVER BUDGET {line}")
+    if over:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
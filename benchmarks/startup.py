@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start time: importing the app, and starting a server up to its
+first answered request.
+
+Each run uses a fresh process and a fresh database, as a new instance
+would when autoscaling. Reported per run:
+
+  import        `import app.main` in a new interpreter
+  ready         process start until /health answers
+  first query   process start until a signed-in listing answers (touches
+                the database, the principal lookup and the listing query)
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 5 --workers 4 --budget-import 1.5 --budget-ready 3
+    python -m benchmarks.startup --top 15     # slowest modules to import
+
+With a budget, the exit status is 1 when the median goes over it.
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.common import ROOT, bench_environment, free_port, seed_user
+
+IMPORT_SCRIPT = (
+    "import time\n"
+    "started = time.perf_counter()\n"
+    "import app.main\n"
+    "print(time.perf_counter() - started)\n"
+)
+PASSWORD = "benchpass123"
+
+
+def time_import(env: dict, workdir: Path) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=workdir, env=env, check=True, capture_output=True, text=True
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env: dict, workdir: Path, count: int) -> list:
+    """(cumulative seconds, module) for the slowest top-level imports of app.main."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=workdir, env=env, check=True, capture_output=True, text=True
+    )
+    modules = []
+    for line in output.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        # Only modules imported directly by the app or the interpreter, not their children
+        if match and len(match.group(2)) <= 3:
+            modules.append((int(match.group(1)) / 1e6, match.group(3)))
+    return sorted(modules, reverse=True)[:count]
+
+
+def token_for(env: dict, workdir: Path, email: str) -> str:
+    script = (
+        "from app.core.security import create_access_token\n"
+        f"print(create_access_token(data={{'sub': {email!r}}}))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], cwd=workdir, env=env, check=True,
+                            capture_output=True, text=True)
+    return output.stdout.strip()
+
+
+def wait_for(client: httpx.Client, url: str, process: subprocess.Popen, headers: dict = None,
+             timeout: float = 60) -> None:
+    # One client for all attempts: building one per attempt costs more CPU than the server's startup steps
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if client.get(url, headers=headers, timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline or process.poll() is not None:
+            raise RuntimeError("server did not start")
+        time.sleep(0.01)
+
+
+def time_server_start(workers: int, launcher: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        env = {**bench_environment(workdir), "BCRYPT_ROUNDS": "4"}
+        port = free_port()
+        if launcher == "run":
+            env.update(HOST="127.0.0.1", PORT=str(port), WORKERS=str(workers))
+            command = [sys.executable, str(ROOT / "run.py")]
+        else:
+            command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                       "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+        # The user is signed in with a token; its row is added once the server has made the schema
+        email = "startup-client@example.com"
+        headers = {"Authorization": f"Bearer {token_for(env, workdir, email)}"}
+        base_url = f"http://127.0.0.1:{port}"
+
+        client = httpx.Client()
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=workdir, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(client, f"{base_url}/health", process)
+            ready = time.perf_counter() - started
+            seed_user(env, workdir, email, PASSWORD, "client")
+            seeded = time.perf_counter()
+            wait_for(client, f"{base_url}/api/files/list?limit=1", process, headers=headers)
+            first_query = ready + time.perf_counter() - seeded
+        finally:
+            client.close()
+            process.terminate()
+            process.wait(timeout=30)
+        return {"ready": ready, "first_query": first_query}
+
+
+def summary(label: str, samples: list) -> str:
+    return (f"{label:<14}median {statistics.median(samples) * 1000:8.1f}ms   "
+            f"min {min(samples) * 1000:8.1f}ms   max {max(samples) * 1000:8.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--launcher", choices=["uvicorn", "run"], default="uvicorn",
+                        help="start with uvicorn directly or through run.py (gunicorn with several workers)")
+    parser.add_argument("--top", type=int, default=0, help="also list the slowest imports")
+    parser.add_argument("--budget-import", type=float, help="seconds allowed for the median import")
+    parser.add_argument("--budget-ready", type=float, help="seconds allowed for the median time to /health")
+    parser.add_argument("--budget-first-query", type=float, help="seconds allowed for the median first query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        env = bench_environment(workdir)
+        imports = [time_import(env, workdir) for _ in range(args.runs)]
+        top = slowest_imports(env, workdir, args.top) if args.top else []
+    starts = [time_server_start(args.workers, args.launcher) for _ in range(args.runs)]
+
+    print(f"{args.runs} runs, {args.workers} worker(s) via {args.launcher}")
+    print(summary("import", imports))
+    print(summary("ready", [run["ready"] for run in starts]))
+    print(summary("first query", [run["first_query"] for run in starts]))
+    for seconds, module in top:
+        print(f"  {seconds * 1000:8.1f}ms  {module}")
+
+    over = []
+    for label, budget, samples in (
+        ("import", args.budget_import, imports),
+        ("ready", args.budget_ready, [run["ready"] for run in starts]),
+        ("first query", args.budget_first_query, [run["first_query"] for run in starts]),
+    ):
+        if budget is not None and statistics.median(samples) > budget:
+            over.append(f"{label}: median {statistics.median(samples):.2f}s over the {budget:.2f}s budget")
+    for line in over:
+        print(f"OVER BUDGET {line}")
+    if over:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
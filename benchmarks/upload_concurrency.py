@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Measure /health latency while many uploads run at once.
+
+    python -m benchmarks.upload_concurrency --uploads 50 --size-mb 8
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import running_server, seed_user, percentile
+from tests.documents import minimal_docx
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str, user_type: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"email": email, "password": password, "user_type": user_type},
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def upload(client: httpx.AsyncClient, token: str, payload: bytes, index: int) -> int:
+    response = await client.post(
+        "/api/files/upload",
+        files={"file": (f"bench-{index}.docx", payload, DOCX_MIME)},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return response.status_code
+
+
+async def probe_health(client: httpx.AsyncClient, stop: asyncio.Event, samples: list) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/health")
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def run(base_url: str, uploads: int, size_mb: int) -> None:
+    payload = minimal_docx(size_mb * 1024 * 1024)
+    limits = httpx.Limits(max_connections=uploads + 5)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        token = await login(client, "bench-ops@example.com", "benchpass123", "ops")
+
+        idle = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(client, stop, idle))
+        await asyncio.sleep(1)
+        stop.set()
+        await prober
+
+        loaded = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(client, stop, loaded))
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(upload(client, token, payload, i) for i in range(uploads)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await prober
+
+    ok = sum(1 for code in statuses if code == 200)
+    print(f"uploads: {ok}/{uploads} ok, {uploads * size_mb / elapsed:.1f} MB/s aggregate")
+    for label, samples in (("idle", idle), ("during uploads", loaded)):
+        print(
+            f"/health {label}: n={len(samples)} "
+            f"p50={percentile(samples, 50):.2f}ms p99={percentile(samples, 99):.2f}ms "
+            f"max={max(samples):.2f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uploads", type=int, default=50)
+    parser.add_argument("--size-mb", type=int, default=8)
+    args = parser.parse_args()
+
+    env = {"MAX_FILE_SIZE": str((args.size_mb + 1) * 1024 * 1024)}
+    with running_server(env=env) as (base_url, server_env, workdir):
+        seed_user(server_env, workdir, "bench-ops@example.com", "benchpass123", "ops")
+        asyncio.run(run(base_url, args.uploads, args.size_mb))
+
+
+if __name__ == "__main__":
+    main()
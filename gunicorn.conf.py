@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for running the API with several uvicorn workers:
+
+    gunicorn app.main:app --config gunicorn.conf.py
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, so they share the imported modules' memory and start
+serving without importing anything themselves. The schema is migrated in
+the master before the first fork.
+"""
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WORKERS", os.cpu_count() or 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+accesslog = "-"
+
+
+def on_starting(server):
+    from app.core.config import settings
+    from app.core.startup import prepare_host
+    # run.py has migrated already when it started gunicorn
+    if settings.MIGRATE_ON_STARTUP:
+        prepare_host()
+
+
+def post_fork(server, worker):
+    from app.core.startup import after_fork
+    after_fork()
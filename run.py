@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 """
 Production-ready runner for the Secure File Sharing System
+
+With WORKERS > 1 the workers are forked by gunicorn from one process that
+has already imported the app (see gunicorn.conf.py), so they share its
+memory; without gunicorn installed, uvicorn starts them instead.
 """
-import uvicorn
+import importlib.util
 import os
-from app.main import app
+import sys
+
+import uvicorn
+
+from app.core.startup import prepare_host
 
 if __name__ == "__main__":
     # Production configuration
@@ -12,6 +20,13 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     workers = int(os.getenv("WORKERS", 1))
     
+    # Migrate once here rather than in every worker
+    prepare_host()
+    
+    if workers > 1 and importlib.util.find_spec("gunicorn") is not None:
+        config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+        os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "app.main:app", "--config", config])
+    
     uvicorn.run(
         "app.main:app",
         host=host,
@@ -20,4 +35,4 @@ if __name__ == "__main__":
         reload=False,  # Set to False in production
         access_log=True,
         log_level="info"
-    )
\ No newline at end of file
+    )
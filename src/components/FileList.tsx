@@ -1,51 +1,90 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import { Download, FileText, Calendar, Shield, Loader2, CheckCircle2 } from 'lucide-react';
 import { FileItem, DownloadResponse } from '../types';
+import { ApiFile, useCatalogEvents } from '../hooks/useCatalogEvents';
+
+const toFileItem = (file: ApiFile): FileItem => ({
+  id: String(file.id),
+  filename: file.original_filename,
+  fileType: file.file_type,
+  size: file.file_size,
+  uploadedAt: file.uploaded_at,
+  uploadedBy: file.uploaded_by,
+});
 
 const FileList: React.FC = () => {
   const [files, setFiles] = useState<FileItem[]>([]);
   const [downloading, setDownloading] = useState<string | null>(null);
   const [downloadUrl, setDownloadUrl] = useState<string | null>(null);
 
-  useEffect(() => {
-    // Simulate fetching available files
-    const mockFiles: FileItem[] = [
-      {
-        id: '1',
-        filename: 'Q4-Financial-Report.xlsx',
-        fileType: 'xlsx',
-        size: 2048000,
-        uploadedAt: '2024-01-15T10:30:00Z',
-        uploadedBy: 'operations@company.com'
-      },
-      {
-        id: '2',
-        filename: 'Company-Presentation.pptx',
-        fileType: 'pptx',
-        size: 5120000,
-        uploadedAt: '2024-01-14T14:15:00Z',
-        uploadedBy: 'operations@company.com'
-      },
-      {
-        id: '3',
-        filename: 'Policy-Document.docx',
-        fileType: 'docx',
-        size: 1024000,
-        uploadedAt: '2024-01-13T09:45:00Z',
-        uploadedBy: 'operations@company.com'
-      },
-      {
-        id: '4',
-        filename: 'Budget-Analysis.xlsx',
-        fileType: 'xlsx',
-        size: 3072000,
-        uploadedAt: '2024-01-12T16:20:00Z',
-        uploadedBy: 'operations@company.com'
+  const loadFiles = useCallback(async () => {
+    try {
+      const response = await fetch('/api/files/list', {
+        headers: {
+          'Authorization': `Bearer ${localStorage.getItem('token')}`,
+        },
+      });
+      if (!response.ok) {
+        throw new Error('Listing failed');
       }
-    ];
-    setFiles(mockFiles);
+      const data: ApiFile[] = await response.json();
+      setFiles(data.map(toFileItem));
+    } catch (error) {
+      // For demo purposes, fall back to sample files
+      const mockFiles: FileItem[] = [
+        {
+          id: '1',
+          filename: 'Q4-Financial-Report.xlsx',
+          fileType: 'xlsx',
+          size: 2048000,
+          uploadedAt: '2024-01-15T10:30:00Z',
+          uploadedBy: 'operations@company.com'
+        },
+        {
+          id: '2',
+          filename: 'Company-Presentation.pptx',
+          fileType: 'pptx',
+          size: 5120000,
+          uploadedAt: '2024-01-14T14:15:00Z',
+          uploadedBy: 'operations@company.com'
+        },
+        {
+          id: '3',
+          filename: 'Policy-Document.docx',
+          fileType: 'docx',
+          size: 1024000,
+          uploadedAt: '2024-01-13T09:45:00Z',
+          uploadedBy: 'operations@company.com'
+        },
+        {
+          id: '4',
+          filename: 'Budget-Analysis.xlsx',
+          fileType: 'xlsx',
+          size: 3072000,
+          uploadedAt: '2024-01-12T16:20:00Z',
+          uploadedBy: 'operations@company.com'
+        }
+      ];
+      setFiles(mockFiles);
+    }
   }, []);
 
+  useEffect(() => {
+    loadFiles();
+  }, [loadFiles]);
+
+  // New and deleted files are pushed by the server instead of polled for
+  useCatalogEvents(localStorage.getItem('token'), (event) => {
+    if (event.type === 'file.added') {
+      const added = toFileItem(event.file);
+      setFiles((current) => [added, ...current.filter((file) => file.id !== added.id)]);
+    } else if (event.type === 'file.removed') {
+      setFiles((current) => current.filter((file) => file.id !== String(event.file_id)));
+    } else {
+      loadFiles();
+    }
+  });
+
   const handleDownload = async (fileId: string) => {
     setDownloading(fileId);
     try {
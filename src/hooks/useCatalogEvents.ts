@@ -0,0 +1,77 @@
+import { useEffect, useRef } from 'react';
+
+// A file as sent by the API (snake_case, see FileInfo in app/schemas.py)
+export interface ApiFile {
+  id: number;
+  filename: string;
+  original_filename: string;
+  file_type: 'pptx' | 'docx' | 'xlsx';
+  file_size: number;
+  uploaded_by: string;
+  uploaded_at: string;
+}
+
+export type CatalogEvent =
+  | { type: 'file.added'; version: number; file: ApiFile }
+  | { type: 'file.removed'; version: number; file_id: number }
+  | { type: 'resync' };
+
+const RECONNECT_DELAY_MS = 3000;
+
+/**
+ * Subscribe to catalog changes pushed by GET /api/files/events.
+ *
+ * Read with fetch rather than EventSource so the token goes in the
+ * Authorization header, not the URL. Reconnects after errors and resumes
+ * from the last event id; after a "resync" event the listing should be
+ * fetched again.
+ */
+export function useCatalogEvents(token: string | null, onEvent: (event: CatalogEvent) => void) {
+  const handler = useRef(onEvent);
+  handler.current = onEvent;
+
+  useEffect(() => {
+    if (!token) return;
+    const controller = new AbortController();
+    let lastEventId: string | null = null;
+
+    const dispatch = (block: string) => {
+      let data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('id: ')) lastEventId = line.slice(4);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (data) handler.current(JSON.parse(data) as CatalogEvent);
+    };
+
+    const connect = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          const headers: Record<string, string> = { Authorization: `Bearer ${token}` };
+          if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+          const response = await fetch('/api/files/events', { headers, signal: controller.signal });
+          if (!response.ok || !response.body) throw new Error(`Event stream failed: ${response.status}`);
+
+          const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+          let buffer = '';
+          for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+            let end;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+              dispatch(buffer.slice(0, end));
+              buffer = buffer.slice(end + 2);
+            }
+          }
+        } catch (error) {
+          if (controller.signal.aborted) return;
+        }
+        await new Promise((resolve) => setTimeout(resolve, RECONNECT_DELAY_MS));
+      }
+    };
+
+    connect();
+    return () => controller.abort();
+  }, [token]);
+}
@@ -1,3 +1,8 @@
+import os
+
+# Profiling is off by default; the suite exercises it, and settings are read on first import
+os.environ.setdefault("PROFILING_ENABLED", "true")
+
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -0,0 +1,64 @@
+import io
+import os
+import zipfile
+from xml.sax.saxutils import escape
+
+# Unlike tests.utils, importing this sets up no database, so benchmarks can too
+
+# Main part, its content type and its body for each kind of package
+PACKAGE_PARTS = {
+    "docx": (
+        "word/document.xml",
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml",
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        '<w:body>{paragraphs}</w:body></w:document>',
+    ),
+    "pptx": (
+        "ppt/presentation.xml",
+        "application/vnd.openxmlformats-officedocument.presentationml.presentation.main+xml",
+        '<p:presentation xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main"/>',
+    ),
+    "xlsx": (
+        "xl/workbook.xml",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml",
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"/>',
+    ),
+}
+
+
+def minimal_package(file_type: str = "docx", size: int = 0, text: str = "Test document") -> bytes:
+    """A valid Office document of file_type (a Word document holds one
+    paragraph per line of text), padded with a stored media part of random
+    bytes to about size bytes. Documents given a size are all distinct."""
+    main_part, content_type, body = PACKAGE_PARTS[file_type]
+    paragraphs = "".join(f"<w:p><w:r><w:t>{escape(line)}</w:t></w:r></w:p>" for line in text.splitlines())
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as document:
+        document.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Default Extension="bin" ContentType="application/octet-stream"/>'
+            f'<Override PartName="/{main_part}" ContentType="{content_type}"/>'
+            '</Types>'
+        ))
+        document.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Target="{main_part}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>'
+        ))
+        document.writestr(main_part, (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>' + body.format(paragraphs=paragraphs)
+        ))
+        if size > 0:
+            padding = max(size - buffer.tell(), 16)
+            media = f"{main_part.split('/')[0]}/media/padding.bin"
+            document.writestr(zipfile.ZipInfo(media), os.urandom(padding), zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+
+def minimal_docx(size: int = 0, text: str = "Test document") -> bytes:
+    return minimal_package("docx", size, text)
@@ -0,0 +1,57 @@
+import io
+import threading
+from datetime import datetime, timezone
+
+
+class FakeClientError(Exception):
+    """Shaped like botocore's ClientError."""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """In-memory stand-in for the boto3 S3 client methods S3Storage uses."""
+
+    def __init__(self):
+        self.objects = {}
+        self.get_requests = []
+        self._lock = threading.Lock()
+
+    def _put(self, bucket: str, key: str, data: bytes) -> None:
+        with self._lock:
+            self.objects[(bucket, key)] = (data, datetime.now(timezone.utc))
+
+    def _get(self, bucket: str, key: str):
+        with self._lock:
+            if (bucket, key) not in self.objects:
+                raise FakeClientError("404")
+            return self.objects[(bucket, key)]
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, "rb") as source:
+            self._put(Bucket, Key, source.read())
+
+    def upload_fileobj(self, Fileobj, Bucket, Key):
+        self._put(Bucket, Key, Fileobj.read())
+
+    def head_object(self, Bucket, Key):
+        data, modified = self._get(Bucket, Key)
+        return {"ContentLength": len(data), "LastModified": modified}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data, _ = self._get(Bucket, Key)
+        self.get_requests.append((Key, Range))
+        if Range:
+            start, end = Range.removeprefix("bytes=").split("-")
+            data = data[int(start):int(end) + 1]
+        return {"Body": io.BytesIO(data)}
+
+    def copy_object(self, Bucket, Key, CopySource):
+        data, _ = self._get(CopySource["Bucket"], CopySource["Key"])
+        self._put(Bucket, Key, data)
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
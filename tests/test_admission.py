@@ -0,0 +1,141 @@
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+
+from fastapi.testclient import TestClient
+
+from app.core.admission import (
+    DOWNLOADS, UPLOADS, AdmissionController, AdmissionMiddleware, Budget, SharedLimits, classify
+)
+from app.core.security import create_access_token
+from app.main import app
+from tests.utils import seed_user
+
+
+def test_routes_are_classified():
+    assert classify("POST", "/api/auth/login") == ("auth", None)
+    assert classify("GET", "/api/auth/me") == (None, None)
+    assert classify("POST", "/api/files/upload") == ("upload", UPLOADS)
+    assert classify("PUT", "/api/files/upload-sessions/abc") == ("upload", UPLOADS)
+    assert classify("POST", "/api/files/upload-sessions") == ("upload", None)
+    assert classify("GET", "/api/files/secure-download/token") == ("download", DOWNLOADS)
+    assert classify("POST", "/api/files/archive") == ("download", DOWNLOADS)
+    assert classify("GET", "/api/files/download-file/1") == ("download", None)
+    assert classify("GET", "/api/files/list") == ("listing", None)
+    assert classify("GET", "/api/files/search") == ("listing", None)
+    assert classify("GET", "/api/files/7/preview") == ("listing", None)
+    assert classify("GET", "/api/files/download-history/archive") == ("listing", None)
+    assert classify("GET", "/api/files/events") == (None, None)
+    assert classify("GET", "/health") == (None, None)
+
+
+def test_buckets_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "admission")
+    budget = Budget(per_minute=60, burst=2)
+    first, second = SharedLimits(path, 1024), SharedLimits(path, 1024)
+    assert first.take("listing:user:a", budget) == 0
+    assert second.take("listing:user:a", budget) == 0
+    retry_after = first.take("listing:user:a", budget)
+    assert 0.9 < retry_after <= 1.0
+    # Other clients and classes have their own buckets
+    assert second.take("listing:user:b", budget) == 0
+    assert second.take("auth:user:a", budget) == 0
+
+
+def test_full_tables_reuse_idle_buckets(tmp_path):
+    limits = SharedLimits(str(tmp_path / "admission"), 4)
+    budget = Budget(per_minute=60, burst=1)
+    for client in range(20):
+        assert limits.take(f"listing:ip:{client}", budget) == 0
+
+
+def test_exited_workers_leave_no_requests_in_flight(tmp_path):
+    limits = SharedLimits(str(tmp_path / "admission"), 1024)
+    # A worker that died holding requests
+    mapped = limits._mapped()
+    limits._worker.pack_into(mapped, limits._worker.size, 2 ** 22 + 1, 5, 5, 5)
+    assert limits.in_flight(UPLOADS) == (5, 5)
+
+    # The next process to claim a slot clears it
+    assert limits.acquire(UPLOADS, 2)
+    assert limits.in_flight(UPLOADS) == (1, 0)
+    limits.release(UPLOADS)
+    assert limits.in_flight(UPLOADS) == (0, 0)
+
+
+class TestAdmissionMiddleware:
+    def setup_method(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.controller = AdmissionController(
+            SharedLimits(os.path.join(self.state_dir, "admission"), 1024),
+            {
+                # Slow enough to refill that two bcrypt checks can't earn a third sign-in
+                "auth": Budget(per_minute=6, burst=2),
+                "upload": Budget(per_minute=600, burst=100),
+                "download": Budget(per_minute=600, burst=100),
+                "listing": Budget(per_minute=60, burst=2),
+            },
+            {UPLOADS: 1, DOWNLOADS: 1},
+            max_queued=1,
+            queue_timeout=0.2,
+        )
+        self.client = TestClient(AdmissionMiddleware(app, controller=self.controller))
+        for email in ("admit-one@example.com", "admit-two@example.com"):
+            seed_user(email, "client")
+
+    def teardown_method(self):
+        shutil.rmtree(self.state_dir)
+
+    def headers(self, email: str) -> dict:
+        return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}
+
+    def test_sign_ins_are_limited_per_ip(self):
+        credentials = {"email": "admit-one@example.com", "password": "wrong", "user_type": "client"}
+        for _ in range(2):
+            assert self.client.post("/api/auth/login", json=credentials).status_code == 401
+        response = self.client.post("/api/auth/login", json={**credentials, "email": "admit-two@example.com"})
+        assert response.status_code == 429
+        assert 1 <= int(response.headers["retry-after"]) <= 10
+        # Routes outside the limited classes are unaffected
+        assert self.client.get("/health").status_code == 200
+
+    def test_listings_are_limited_per_user(self):
+        one, two = self.headers("admit-one@example.com"), self.headers("admit-two@example.com")
+        assert [self.client.get("/api/files/list", headers=one).status_code for _ in range(3)] == [200, 200, 429]
+        assert self.client.get("/api/files/list", headers=two).status_code == 200
+        assert self.controller.stats()["rate_limited"] == 1
+
+    def test_uploads_beyond_the_cap_are_shed(self):
+        upload = {"file": ("busy.docx", io.BytesIO(b"x"), "application/octet-stream")}
+        headers = self.headers("admit-one@example.com")
+        # Another worker holds the only upload slot
+        assert self.controller.limits.acquire(UPLOADS, 1)
+        response = self.client.post("/api/files/upload", files=upload, headers=headers)
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert self.controller.stats()["shed"] == 1
+
+        self.controller.limits.release(UPLOADS)
+        response = self.client.post("/api/files/upload", files=upload, headers=headers)
+        # Admitted; the handler itself turns client users away
+        assert response.status_code == 403
+        assert self.controller.stats()["uploads_in_flight"] == 0
+
+    def test_queued_requests_run_when_a_slot_frees(self):
+        limits = self.controller.limits
+        assert limits.acquire(DOWNLOADS, 1)
+
+        async def scenario():
+            waiting = asyncio.ensure_future(self.controller.acquire(DOWNLOADS))
+            await asyncio.sleep(0.02)
+            assert limits.in_flight(DOWNLOADS) == (1, 1)
+            # The queue holds one request; the next is shed straight away
+            assert not await self.controller.acquire(DOWNLOADS)
+            limits.release(DOWNLOADS)
+            assert await waiting
+
+        asyncio.run(scenario())
+        assert limits.in_flight(DOWNLOADS) == (1, 0)
+        self.controller.release(DOWNLOADS)
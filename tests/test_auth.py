@@ -1,28 +1,16 @@
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.main import app
-from app.database import get_db, Base
+import asyncio
+import threading
+import time
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from app.models import User
+from app.core.security import create_access_token
+from app.core.principal_cache import Principal, PrincipalCache, principal_cache
+from app.core.passwords import PasswordHasher
 from app.core.config import settings
 
-# Test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base.metadata.create_all(bind=engine)
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
-
-client = TestClient(app)
+from tests.utils import client, TestingSessionLocal
 
 class TestAuth:
     def test_signup_success(self):
@@ -68,4 +56,97 @@ class TestAuth:
             json={"token": "invalid_token"}
         )
         assert response.status_code == 400
-        assert "Invalid verification token" in response.json()["detail"]
\ No newline at end of file
+        assert "Invalid verification token" in response.json()["detail"]
+    def test_current_user_is_cached_and_invalidated_on_verification(self):
+        client.post(
+            "/api/auth/signup",
+            json={"email": "cached@example.com", "password": "testpass123"}
+        )
+        db = TestingSessionLocal()
+        verification_token = db.query(User).filter(User.email == "cached@example.com").one().verification_token
+        db.close()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'cached@example.com'})}"}
+        
+        misses = principal_cache.stats()["misses"]
+        assert client.get("/api/auth/me", headers=headers).json()["is_verified"] is False
+        hits = principal_cache.stats()["hits"]
+        assert client.get("/api/auth/me", headers=headers).json()["is_verified"] is False
+        assert principal_cache.stats()["hits"] == hits + 1
+        assert principal_cache.stats()["misses"] == misses + 1
+        
+        client.post("/api/auth/verify-email", json={"token": verification_token})
+        assert client.get("/api/auth/me", headers=headers).json()["is_verified"] is True
+
+    def test_principal_cache_bounds_and_stale_snapshots(self):
+        cache = PrincipalCache(max_entries=2, ttl_seconds=60)
+        principals = [Principal(i, f"user{i}@example.com", "client", True, None) for i in range(3)]
+        expires = time.time() + 60
+        for principal in principals:
+            cache.put(f"token{principal.id}", principal, expires, cache.generation(principal.email))
+        # Least recently used entry was evicted
+        assert cache.get("token0") is None
+        assert cache.get("token2") == principals[2]
+        
+        # Tokens that already expired are never cached
+        cache.put("expired", principals[0], time.time() - 1, 0)
+        assert cache.get("expired") is None
+        
+        # A snapshot read before an invalidation must not be cached afterwards
+        generation = cache.generation("user1@example.com")
+        cache.invalidate_email("user1@example.com")
+        cache.put("token1", principals[1], expires, generation)
+        assert cache.get("token1") is None
+
+    def test_login_upgrades_hash_made_with_old_cost(self):
+        old_cost = 4 if settings.BCRYPT_ROUNDS != 4 else 5
+        old_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=old_cost)
+        db = TestingSessionLocal()
+        db.add(User(
+            email="rehash@example.com",
+            hashed_password=old_context.hash("testpass123"),
+            user_type="ops",
+            is_verified=True
+        ))
+        db.commit()
+        db.close()
+        
+        response = client.post(
+            "/api/auth/login",
+            json={"email": "rehash@example.com", "password": "testpass123", "user_type": "ops"}
+        )
+        assert response.status_code == 200
+        assert response.json()["user"]["email"] == "rehash@example.com"
+        
+        db = TestingSessionLocal()
+        hashed_password = db.query(User).filter(User.email == "rehash@example.com").one().hashed_password
+        db.close()
+        assert hashed_password.split("$")[2] == f"{settings.BCRYPT_ROUNDS:02d}"
+        
+        # The upgraded hash still verifies
+        response = client.post(
+            "/api/auth/login",
+            json={"email": "rehash@example.com", "password": "testpass123", "user_type": "ops"}
+        )
+        assert response.status_code == 200
+
+    def test_password_hasher_rejects_work_beyond_queue_limit(self):
+        hasher = PasswordHasher(CryptContext(schemes=["bcrypt"], bcrypt__rounds=4), max_workers=1, max_pending=1)
+        release = threading.Event()
+        
+        async def storm():
+            blocked = asyncio.ensure_future(hasher.run(release.wait))
+            await asyncio.sleep(0)
+            with pytest.raises(HTTPException) as rejected:
+                await hasher.hash("testpass123")
+            release.set()
+            await blocked
+            return rejected.value
+        
+        error = asyncio.run(storm())
+        assert error.status_code == 503
+        assert error.headers["Retry-After"] == "1"
+        assert hasher.stats()["rejected"] == 1
+        assert hasher.stats()["pending"] == 0
+        
+        verified, new_hash = asyncio.run(hasher.verify_and_update("testpass123", hasher.context.hash("testpass123")))
+        assert verified and new_hash is None
@@ -0,0 +1,208 @@
+import asyncio
+import io
+import os
+import subprocess
+import sys
+from functools import partial
+
+import anyio
+import orjson
+
+from app.core.catalog_events import CatalogFeed, EventRing
+from app.main import app
+from tests.documents import minimal_docx
+from tests.utils import client, ROOT, seed_user
+
+
+def parse_frames(data: bytes) -> list:
+    """(id, event) for each data frame in an SSE body."""
+    frames = []
+    for block in data.split(b"\n\n"):
+        fields = dict(line.split(b": ", 1) for line in block.split(b"\n") if b": " in line and not line.startswith(b":"))
+        if b"data" in fields:
+            frames.append((fields[b"id"].decode(), orjson.loads(fields[b"data"])))
+    return frames
+
+
+class EventStream:
+    """A request to an SSE endpoint driven straight through the ASGI app.
+
+    TestClient only returns once a response is complete, which an event
+    stream never is.
+    """
+
+    def __init__(self, asgi_app, path: str, headers: dict):
+        self.app = asgi_app
+        self.scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80),
+        }
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.disconnected = asyncio.Event()
+        self.status = None
+        self.buffer = b""
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        await self.messages.put(message)
+
+    async def __aenter__(self):
+        self.task = asyncio.create_task(self.app(self.scope, self.receive, self.send))
+        start = await asyncio.wait_for(self.messages.get(), 5)
+        self.status = start["status"]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.disconnected.set()
+        await asyncio.wait_for(self.task, 5)
+
+    async def next_events(self, count: int = 1, timeout: float = 5) -> list:
+        while len(parse_frames(self.buffer)) < count:
+            message = await asyncio.wait_for(self.messages.get(), timeout)
+            self.buffer += message.get("body", b"")
+        return parse_frames(self.buffer)[:count]
+
+
+def test_event_ring_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "events")
+    publisher, reader = EventRing(path, slots=4, slot_size=64), EventRing(path, slots=4, slot_size=64)
+    assert reader.head()[1] == 0
+    for number in range(1, 7):
+        assert publisher.publish(b'{"n":%d}' % number) == number
+    epoch, head = reader.head()
+    assert head == 6
+    assert publisher.head() == (epoch, 6)
+    # Only the newest slots are kept
+    assert reader.read(2) is None
+    assert reader.read(6) == b'{"n":6}'
+    # Events that don't fit a slot are left for readers to resync on
+    assert reader.read(publisher.publish(b"x" * 100)) is None
+
+
+def test_event_ring_reads_are_never_torn(tmp_path):
+    path = str(tmp_path / "events")
+    reader = EventRing(path, slots=1, slot_size=1 << 20)
+    reader.head()
+    # Another process laps the ring with events made of one repeated byte each
+    script = (
+        "import sys; from app.core.catalog_events import EventRing\n"
+        "ring = EventRing(sys.argv[1], slots=1, slot_size=1 << 20)\n"
+        "for number in range(1, 3001):\n"
+        "    ring.publish(bytes([number % 256]) * (ring.capacity - number % 7))\n"
+    )
+    publisher = subprocess.Popen([sys.executable, "-c", script, path],
+                                 env={**os.environ, "PYTHONPATH": str(ROOT)})
+    try:
+        while publisher.poll() is None:
+            _, head = reader.head()
+            payload = reader.read(head) if head else None
+            # Gone or still being written is fine, a mix of two events isn't
+            assert payload is None or payload == bytes([head % 256]) * (reader.capacity - head % 7)
+    finally:
+        publisher.wait()
+    assert publisher.returncode == 0
+    assert reader.read(3000) == bytes([3000 % 256]) * (reader.capacity - 3000 % 7)
+
+
+def test_streams_resume_after_last_event_id(tmp_path):
+    feed = CatalogFeed(EventRing(str(tmp_path / "events"), slots=8, slot_size=128), 0.01, 5, 10)
+
+    async def collect(stream, count):
+        frames = b""
+        while len(parse_frames(frames)) < count:
+            frames += await asyncio.wait_for(stream.__anext__(), 5)
+        return parse_frames(frames)
+
+    async def scenario():
+        live = feed.stream()
+        assert await live.__anext__() == b"retry: 3000\n\n"
+        waiting = asyncio.ensure_future(collect(live, 1))
+        await asyncio.sleep(0.05)
+        feed.publish({"type": "file.removed", "file_id": 1})
+        [(first_id, event)] = await waiting
+        assert event == {"type": "file.removed", "file_id": 1}
+
+        # Published by another worker: picked up by the polling thread
+        EventRing(feed.ring.path, slots=8, slot_size=128).publish(b'{"type":"file.removed","file_id":2}')
+        [(_, event)] = await collect(live, 1)
+        assert event["file_id"] == 2
+        await live.aclose()
+
+        feed.publish({"type": "file.removed", "file_id": 3})
+        resumed = feed.stream(first_id)
+        events = [event for _, event in await collect(resumed, 2)]
+        assert [event["file_id"] for event in events] == [2, 3]
+        await resumed.aclose()
+
+        # Too far behind, or from another ring file
+        for _ in range(10):
+            feed.publish({"type": "file.removed", "file_id": 4})
+        for last_event_id in (first_id, "ffff.1", "garbage"):
+            stale = feed.stream(last_event_id)
+            [(_, event)] = await collect(stale, 1)
+            assert event == {"type": "resync"}
+            await stale.aclose()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        feed.stop()
+    assert feed.connections == 0
+
+
+class TestCatalogEvents:
+    def setup_method(self):
+        self.ops = seed_user("events-ops@example.com", "ops")
+        self.client = seed_user("events-client@example.com", "client")
+
+    def test_requires_authentication(self):
+        assert client.get("/api/files/events").status_code == 403
+
+    def test_ops_users_cannot_follow_the_catalog(self):
+        response = client.get("/api/files/events", headers=self.ops)
+        assert response.status_code == 403
+        assert response.json()["detail"] == "Only client users can follow catalog changes"
+
+    def test_uploads_and_deletes_are_pushed(self):
+        async def scenario():
+            async with EventStream(app, "/api/files/events", self.client) as stream:
+                assert stream.status == 200
+                response = await anyio.to_thread.run_sync(partial(
+                    client.post,
+                    "/api/files/upload",
+                    files={"file": ("pushed.docx", io.BytesIO(minimal_docx(64)), "application/octet-stream")},
+                    headers=self.ops
+                ))
+                file_id = response.json()["id"]
+                [(_, added)] = await stream.next_events(1)
+                assert added["type"] == "file.added"
+                assert added["file"]["id"] == file_id
+                assert added["file"]["filename"] == "pushed.docx"
+                assert added["file"]["uploaded_by"] == "events-ops@example.com"
+                assert added["file"]["uploaded_at"]
+                # The version matches the one in the listing's ETag
+                listing = await anyio.to_thread.run_sync(partial(client.get, "/api/files/list", headers=self.client))
+                assert f".{added['version']}-" in listing.headers["etag"]
+
+                await anyio.to_thread.run_sync(partial(client.delete, f"/api/files/{file_id}", headers=self.ops))
+                [_, (_, removed)] = await stream.next_events(2)
+                assert removed["type"] == "file.removed"
+                assert removed["file_id"] == file_id
+
+                stats = await anyio.to_thread.run_sync(partial(client.get, "/api/files/event-streams", headers=self.ops))
+                assert stats.json()["connections"] >= 1
+
+        asyncio.run(scenario())
@@ -0,0 +1,70 @@
+import gzip
+
+import brotli
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.compression import CompressionMiddleware, negotiate_encoding
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+BODY = "compressible text " * 200
+
+
+@app.get("/text")
+async def text():
+    return PlainTextResponse(BODY)
+
+
+@app.get("/binary")
+async def binary():
+    return Response(BODY.encode(), media_type="application/octet-stream")
+
+
+@app.get("/stream")
+async def stream():
+    async def chunks():
+        for _ in range(10):
+            yield BODY
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+client = TestClient(app)
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5") == "gzip"
+    assert negotiate_encoding("br;q=0, gzip") == "gzip"
+    assert negotiate_encoding("*") == "br"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+
+
+def test_compresses_whole_and_streamed_bodies():
+    response = client.get("/text", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(BODY)
+    assert response.text == BODY
+    
+    response = client.get("/stream", headers={"Accept-Encoding": "br"})
+    assert response.headers["content-encoding"] == "br"
+    assert "content-length" not in response.headers
+    assert response.text == BODY * 10
+
+
+def test_leaves_binary_and_unaccepted_responses_alone():
+    response = client.get("/binary", headers={"Accept-Encoding": "gzip, br"})
+    assert "content-encoding" not in response.headers
+    response = client.get("/text", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.text == BODY
+
+
+def test_raw_bytes_decode_with_standard_tools():
+    with client.stream("GET", "/text", headers={"Accept-Encoding": "gzip"}) as response:
+        assert gzip.decompress(b"".join(response.iter_raw())).decode() == BODY
+    with client.stream("GET", "/text", headers={"Accept-Encoding": "br"}) as response:
+        assert brotli.decompress(b"".join(response.iter_raw())).decode() == BODY
@@ -0,0 +1,29 @@
+from app.database import async_database_url, pool_options, TimedAsyncQueuePool
+from app.core.config import settings
+
+from tests.utils import client
+
+
+def test_async_database_url_picks_async_driver():
+    assert async_database_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert async_database_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert async_database_url("postgresql+asyncpg://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+
+
+def test_pool_options_follow_settings():
+    options = pool_options("sqlite:///./app.db")
+    assert options["poolclass"] is TimedAsyncQueuePool
+    assert options["pool_size"] == settings.DB_POOL_SIZE
+    assert options["max_overflow"] == settings.DB_MAX_OVERFLOW
+    assert options["pool_recycle"] == settings.DB_POOL_RECYCLE
+    assert options["pool_pre_ping"] == settings.DB_POOL_PRE_PING
+    assert pool_options("sqlite:///:memory:") == {}
+
+
+def test_pool_stats_endpoint():
+    response = client.get("/health/db")
+    assert response.status_code == 200
+    pool = response.json()["pool"]
+    assert pool["pool_class"] == "TimedAsyncQueuePool"
+    for key in ("size", "checkedout", "overflow", "checkouts", "wait_seconds_max"):
+        assert key in pool
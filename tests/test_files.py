@@ -1,30 +1,48 @@
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.main import app
-from app.database import get_db, Base
-from app.models import User
+from sqlalchemy import event
+from app.schemas import FileInfo
+from app.models import User, UploadSession, StoredBlob, FileRecord, DownloadRecord, ArchivedDownload, RevokedDownloadToken
 from app.core.security import get_password_hash, create_access_token
+from app.core.config import settings
+from app.core.uploads import exclusive_writer, receive_multipart_file
+from app.core.file_responses import FileRangeResponse, parse_range_header
+from app.core.zip_stream import ZipEntry, ZipStream
+from app.core.download_tokens import create_signed_download_token, verify_signed_download_token
+from app.routers.files import purge_expired_upload_sessions, session_part_path
+from fastapi import HTTPException, Request
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
 import io
+import os
+import zipfile
 
-# Test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test_files.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from app.core.audit import AuditWriter, PendingLink, audit_writer
+from app.core.listing_cache import catalog_version
+from app.core.pagination import encode_cursor
+from app.core.maintenance import (
+    MaintenanceScheduler,
+    archive_expired_downloads,
+    delete_archived_downloads,
+    delete_expired_revocations
+)
+from tests.documents import minimal_docx, minimal_package
+from tests.utils import client, async_engine, TestingSessionLocal, AsyncTestingSessionLocal
 
-Base.metadata.create_all(bind=engine)
-
-def override_get_db():
+@contextmanager
+def count_queries():
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
     try:
-        db = TestingSessionLocal()
-        yield db
+        yield statements
     finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
-
-client = TestClient(app)
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
 
 class TestFiles:
     def setup_method(self):
@@ -32,22 +50,24 @@ class TestFiles:
         db = TestingSessionLocal()
         
         # Create ops user
-        ops_user = User(
-            email="ops@example.com",
-            hashed_password=get_password_hash("opspass123"),
-            user_type="ops",
-            is_verified=True
-        )
-        db.add(ops_user)
+        if not db.query(User).filter(User.email == "ops@example.com").first():
+            ops_user = User(
+                email="ops@example.com",
+                hashed_password=get_password_hash("opspass123"),
+                user_type="ops",
+                is_verified=True
+            )
+            db.add(ops_user)
         
         # Create client user
-        client_user = User(
-            email="client@example.com",
-            hashed_password=get_password_hash("clientpass123"),
-            user_type="client",
-            is_verified=True
-        )
-        db.add(client_user)
+        if not db.query(User).filter(User.email == "client@example.com").first():
+            client_user = User(
+                email="client@example.com",
+                hashed_password=get_password_hash("clientpass123"),
+                user_type="client",
+                is_verified=True
+            )
+            db.add(client_user)
         
         db.commit()
         db.close()
@@ -58,7 +78,8 @@ class TestFiles:
 
     def test_upload_file_success(self):
         # Create a test file
-        test_file = io.BytesIO(b"test file content")
+        content = minimal_docx(text="test file content")
+        test_file = io.BytesIO(content)
         test_file.name = "test.docx"
         
         response = client.post(
@@ -69,8 +90,434 @@ class TestFiles:
         assert response.status_code == 200
         data = response.json()
         assert data["filename"] == "test.docx"
+        assert data["file_size"] == len(content)
+        assert data["sha256"] == hashlib.sha256(content).hexdigest()
         assert data["message"] == "File uploaded successfully"
 
+    def upload(self, name: str, content: bytes):
+        return client.post(
+            "/api/files/upload",
+            files={"file": (name, io.BytesIO(content), "application/octet-stream")},
+            headers={"Authorization": f"Bearer {self.ops_token}"}
+        )
+
+    def test_duplicate_uploads_share_one_blob(self):
+        content = minimal_package("pptx", 256)
+        digest = hashlib.sha256(content).hexdigest()
+        first = self.upload("template.pptx", content).json()
+        second = self.upload("template-copy.pptx", content).json()
+        assert first["sha256"] == second["sha256"] == digest
+        assert first["id"] != second["id"]
+        
+        db = TestingSessionLocal()
+        blob = db.query(StoredBlob).filter(StoredBlob.sha256 == digest).one()
+        assert blob.ref_count == 2
+        blob_path = Path(settings.UPLOAD_DIR) / blob.storage_key
+        assert blob_path.read_bytes() == content
+        assert len(list(Path(settings.UPLOAD_DIR).glob(f"**/{digest}*"))) == 1
+        
+        headers = {"Authorization": f"Bearer {self.ops_token}"}
+        assert client.delete(f"/api/files/{first['id']}", headers=headers).status_code == 200
+        db.expire_all()
+        assert db.query(StoredBlob).filter(StoredBlob.sha256 == digest).one().ref_count == 1
+        assert blob_path.exists()
+        
+        assert client.delete(f"/api/files/{second['id']}", headers=headers).status_code == 200
+        db.expire_all()
+        assert db.query(StoredBlob).filter(StoredBlob.sha256 == digest).first() is None
+        db.close()
+        assert not blob_path.exists()
+
+    def test_upload_session_completes_by_digest(self):
+        content = minimal_docx(128)
+        digest = hashlib.sha256(content).hexdigest()
+        self.upload("known.docx", content)
+        
+        headers = {"Authorization": f"Bearer {self.ops_token}"}
+        response = client.post(
+            "/api/files/upload-sessions",
+            json={"filename": "known-again.docx", "file_size": len(content), "sha256": digest},
+            headers=headers
+        )
+        session = response.json()
+        assert session["offset"] == len(content)
+        
+        response = client.post(f"/api/files/upload-sessions/{session['id']}/complete", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["sha256"] == digest
+
+    def download_path(self, content: bytes) -> str:
+        file_id = self.upload("report.docx", content).json()["id"]
+        response = client.get(
+            f"/api/files/download-file/{file_id}",
+            headers={"Authorization": f"Bearer {self.client_token}"}
+        )
+        return response.json()["download_link"].split("localhost:8000", 1)[1]
+
+    def download(self, path: str, **headers):
+        headers["Authorization"] = f"Bearer {self.client_token}"
+        return client.get(path, headers=headers)
+
+    def test_secure_download_full_body_and_validators(self):
+        content = minimal_docx(4096)
+        path = self.download_path(content)
+        
+        response = self.download(path)
+        assert response.status_code == 200
+        assert response.content == content
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["etag"] == f'"{hashlib.sha256(content).hexdigest()}"'
+        assert "last-modified" in response.headers
+        
+        response = self.download(path, **{"If-None-Match": response.headers["etag"]})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_signed_download_links(self, monkeypatch):
+        monkeypatch.setattr(settings, "DOWNLOAD_TOKEN_MODE", "signed")
+        content = minimal_docx(2048)
+        # Records queued by earlier tests mustn't land while rows are counted
+        audit_writer.flush()
+        db = TestingSessionLocal()
+        records_before = db.query(DownloadRecord).count()
+        path = self.download_path(content)
+        token = path.rsplit("/", 1)[1]
+        assert db.query(DownloadRecord).count() == records_before
+        
+        with count_queries() as statements:
+            response = self.download(path)
+        assert response.status_code == 200
+        assert response.content == content
+        assert not any(statement.lstrip().upper().startswith("UPDATE") for statement in statements)
+        assert self.download(path, Range="bytes=0-9").status_code == 206
+        
+        # Served requests are audited once per link after the response
+        audit_writer.flush()
+        records = db.query(DownloadRecord).filter(DownloadRecord.download_token == token).all()
+        assert len(records) == 1 and records[0].is_used
+        db.close()
+        history = client.get(
+            "/api/files/download-history",
+            headers={"Authorization": f"Bearer {self.client_token}"}
+        ).json()
+        assert token in [item["download_url"].rsplit("/", 1)[1] for item in history]
+        
+        # Tampered and foreign tokens are rejected
+        payload, signature = token.split(".")
+        forged = payload + "." + ("A" if signature[0] != "A" else "B") + signature[1:]
+        assert self.download(f"/api/files/secure-download/{forged}").status_code == 404
+        other_token = create_access_token(data={"sub": "ops@example.com"})
+        assert client.get(path, headers={"Authorization": f"Bearer {other_token}"}).status_code == 403
+        
+        # Revoked links stop working in this process right away
+        headers = {"Authorization": f"Bearer {self.client_token}"}
+        assert client.delete(f"/api/files/download-links/{token}", headers=headers).status_code == 200
+        response = self.download(path)
+        assert response.status_code == 410
+        assert response.json()["detail"] == "Download link has been revoked"
+
+    def test_concurrent_revocations_of_a_signed_link(self, monkeypatch):
+        monkeypatch.setattr(settings, "DOWNLOAD_TOKEN_MODE", "signed")
+        token = self.download_path(minimal_docx(64)).rsplit("/", 1)[1]
+        claims = verify_signed_download_token(token)
+        
+        # Another request records the revocation just before this one inserts it
+        raced = []
+        
+        def revoke_first(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO revoked_download_tokens") and not raced:
+                raced.append(statement)
+                db = TestingSessionLocal()
+                db.add(RevokedDownloadToken(token_id=claims.token_id, expires_at=claims.expires_at))
+                db.commit()
+                db.close()
+        
+        event.listen(async_engine.sync_engine, "before_cursor_execute", revoke_first)
+        try:
+            headers = {"Authorization": f"Bearer {self.client_token}"}
+            assert client.delete(f"/api/files/download-links/{token}", headers=headers).status_code == 200
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", revoke_first)
+        assert raced
+        assert self.download(f"/api/files/secure-download/{token}").status_code == 410
+
+    def test_revoke_database_download_link(self):
+        path = self.download_path(minimal_docx(64))
+        token = path.rsplit("/", 1)[1]
+        headers = {"Authorization": f"Bearer {self.client_token}"}
+        assert client.delete(f"/api/files/download-links/{token}", headers=headers).status_code == 200
+        assert self.download(path).status_code == 410
+        assert client.delete("/api/files/download-links/unknown", headers=headers).status_code == 404
+
+    def test_signed_download_token_round_trip(self):
+        expires_at = datetime.utcnow().replace(microsecond=0) + timedelta(hours=1)
+        token = create_signed_download_token(12, 34, expires_at)
+        assert len(token) < 70
+        claims = verify_signed_download_token(token)
+        assert (claims.file_id, claims.user_id, claims.expires_at) == (12, 34, expires_at)
+        assert create_signed_download_token(12, 34, expires_at) != token
+        with pytest.raises(HTTPException):
+            verify_signed_download_token("not.a-token")
+
+    def test_bulk_download_links(self):
+        first = self.upload("bulk-1.docx", minimal_docx(64)).json()["id"]
+        second = self.upload("bulk-2.xlsx", minimal_package("xlsx", 64)).json()["id"]
+        headers = {"Authorization": f"Bearer {self.client_token}"}
+        
+        response = client.post(
+            "/api/files/download-links",
+            json={"file_ids": [first, second, first, 999999]},
+            headers=headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert [link["file_id"] for link in data["links"]] == [first, second]
+        assert data["missing_file_ids"] == [999999]
+        audit_writer.flush()
+        db = TestingSessionLocal()
+        assert db.query(DownloadRecord).filter(DownloadRecord.file_id.in_([first, second])).count() == 2
+        db.close()
+        path = data["links"][1]["download_link"].split("localhost:8000", 1)[1]
+        assert self.download(path).status_code == 200
+        
+        response = client.post("/api/files/download-links", json={"file_ids": []}, headers=headers)
+        assert response.status_code == 400
+        ops_headers = {"Authorization": f"Bearer {self.ops_token}"}
+        response = client.post("/api/files/download-links", json={"file_ids": [first]}, headers=ops_headers)
+        assert response.status_code == 403
+
+    def test_zip_archive_of_selected_files(self):
+        contents = [minimal_package("pptx", 300 * 1024), minimal_package("pptx", 10), minimal_docx(10)]
+        file_ids = [
+            self.upload("deck.pptx", contents[0]).json()["id"],
+            self.upload("deck.pptx", contents[1]).json()["id"],
+            self.upload("../../evil.docx", contents[2]).json()["id"],
+        ]
+        headers = {"Authorization": f"Bearer {self.client_token}"}
+        response = client.post(
+            "/api/files/archive",
+            json={"file_ids": file_ids, "filename": "quarterly"},
+            headers=headers
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        assert response.headers["content-disposition"] == 'attachment; filename="quarterly.zip"'
+        assert int(response.headers["content-length"]) == len(response.content)
+        
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert archive.testzip() is None
+        assert archive.namelist() == ["deck.pptx", "deck (2).pptx", "evil.docx"]
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+        assert [archive.read(name) for name in archive.namelist()] == contents
+        
+        response = client.post("/api/files/archive", json={"file_ids": [file_ids[0], 999999]}, headers=headers)
+        assert response.status_code == 404
+        assert "999999" in response.json()["detail"]
+
+    def test_zip_stream_zip64_records(self, tmp_path):
+        entries = []
+        for index, size in enumerate([0, 1, 70000]):
+            path = tmp_path / f"part{index}"
+            path.write_bytes(os.urandom(size))
+            entries.append(ZipEntry(f"part{index}.docx", str(path), size, datetime(2024, 1, 2, 3, 4, 6)))
+        archive = ZipStream(entries, force_zip64=True)
+        
+        async def collect():
+            return b"".join([chunk async for chunk in archive])
+        
+        data = asyncio.run(collect())
+        assert len(data) == archive.content_length()
+        assert b"PK\x06\x06" in data and b"PK\x06\x07" in data
+        with zipfile.ZipFile(io.BytesIO(data)) as reader:
+            assert reader.testzip() is None
+            for entry in entries:
+                assert reader.read(entry.name) == Path(entry.path).read_bytes()
+
+    def test_download_records_are_written_behind(self, monkeypatch):
+        monkeypatch.setattr(audit_writer, "flush_interval", 60)
+        # A batch already collecting would still close on the old interval
+        audit_writer.flush()
+        path = self.download_path(minimal_docx(64))
+        token = path.rsplit("/", 1)[1]
+        db = TestingSessionLocal()
+        assert db.query(DownloadRecord).filter(DownloadRecord.download_token == token).first() is None
+        db.close()
+        
+        # The link works before its record is written, and the used mark is queued too
+        assert self.download(path).status_code == 200
+        assert audit_writer.pending_link(token).is_used
+        
+        # History lists this process's queued records without flushing them
+        headers = {"Authorization": f"Bearer {self.client_token}"}
+        history = client.get("/api/files/download-history", headers=headers).json()
+        listed = [item for item in history if item["download_url"].endswith(token)]
+        assert len(listed) == 1 and listed[0]["id"] is None
+        assert audit_writer.pending_link(token) is not None
+        
+        audit_writer.flush()
+        history = client.get("/api/files/download-history", headers=headers).json()
+        listed = [item for item in history if item["download_url"].endswith(token)]
+        assert len(listed) == 1 and listed[0]["id"] is not None
+        db = TestingSessionLocal()
+        assert db.query(DownloadRecord).filter(DownloadRecord.download_token == token).one().is_used
+        db.close()
+        
+        # durable=true returns only once the record is committed
+        file_id = self.upload("durable.docx", minimal_docx(64)).json()["id"]
+        response = client.get(
+            f"/api/files/download-file/{file_id}?durable=true",
+            headers={"Authorization": f"Bearer {self.client_token}"}
+        )
+        token = response.json()["download_link"].rsplit("/", 1)[1]
+        db = TestingSessionLocal()
+        assert db.query(DownloadRecord).filter(DownloadRecord.download_token == token).one().is_used is False
+        db.close()
+
+    def test_audit_writer_batches_and_deduplicates(self):
+        file_id = self.upload("batched.docx", minimal_docx(16)).json()["id"]
+        db = TestingSessionLocal()
+        user_id = db.query(User).filter(User.email == "client@example.com").one().id
+        db.close()
+        writer = AuditWriter(TestingSessionLocal, batch_size=100, flush_interval=60)
+        expires_at = datetime.utcnow() + timedelta(hours=1)
+        tokens = [f"batched-{index}" for index in range(20)]
+        for token in tokens:
+            writer.add_link(PendingLink(token, user_id, file_id, expires_at))
+        writer.add_link(PendingLink(tokens[0], user_id, file_id, expires_at))
+        writer.mark_used(tokens[1])
+        writer.flush()
+        assert writer.stats()["batches"] == 1
+        assert writer.stats()["queue_depth"] == 0
+        
+        writer.mark_used(tokens[2])
+        writer.close()
+        db = TestingSessionLocal()
+        records = db.query(DownloadRecord).filter(DownloadRecord.download_token.in_(tokens)).all()
+        db.close()
+        assert len(records) == 20
+        assert {record.download_token for record in records if record.is_used} == {tokens[1], tokens[2]}
+        stats = writer.stats()
+        assert stats["written"] == 23 and stats["failed"] == 0 and stats["batches"] == 2
+        
+        headers = {"Authorization": f"Bearer {self.ops_token}"}
+        assert "queue_depth" in client.get("/api/files/audit-queue", headers=headers).json()
+
+    def test_secure_download_single_range(self):
+        content = minimal_docx(3 * 256 * 1024 + 17)
+        path = self.download_path(content)
+        
+        # Spans several read chunks
+        response = self.download(path, Range="bytes=1000-600000")
+        assert response.status_code == 206
+        assert response.content == content[1000:600001]
+        assert response.headers["content-range"] == f"bytes 1000-600000/{len(content)}"
+        
+        response = self.download(path, Range="bytes=-100")
+        assert response.status_code == 206
+        assert response.content == content[-100:]
+        
+        response = self.download(path, Range=f"bytes={len(content)}-")
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(content)}"
+
+    def test_range_header_parsing(self):
+        assert parse_range_header("bytes=0-9, 5-19", 100) == [(0, 19)]
+        assert parse_range_header("bytes=-10", 5) == [(0, 4)]
+        # Only plain digits are byte offsets
+        for malformed in ("bytes=+5-9", "bytes=5_0-60", "bytes=0-1_0", "bytes=-+5", "bytes= 5-9 x", "bytes=-"):
+            assert parse_range_header(malformed, 100) is None
+        # Nothing in an empty representation can be satisfied
+        assert parse_range_header("bytes=-5", 0) == []
+        assert parse_range_header("bytes=0-", 0) == []
+
+    def test_secure_download_multiple_ranges(self):
+        content = minimal_docx(10000)
+        path = self.download_path(content)
+        
+        response = self.download(path, Range="bytes=0-9,500-599,9990-")
+        assert response.status_code == 206
+        content_type = response.headers["content-type"]
+        assert content_type.startswith("multipart/byteranges")
+        boundary = content_type.split("boundary=")[1].encode()
+        parts = response.content.split(b"--" + boundary)[1:-1]
+        bodies = [part.split(b"\r\n\r\n", 1)[1][:-2] for part in parts]
+        assert bodies == [content[0:10], content[500:600], content[9990:]]
+        assert int(response.headers["content-length"]) == len(response.content)
+
+    def test_secure_download_if_range(self):
+        content = minimal_docx(2048)
+        path = self.download_path(content)
+        etag = self.download(path).headers["etag"]
+        
+        response = self.download(path, Range="bytes=0-99", **{"If-Range": etag})
+        assert response.status_code == 206
+        assert response.content == content[:100]
+        
+        # A stale validator means the whole current file is sent
+        response = self.download(path, Range="bytes=0-99", **{"If-Range": '"stale"'})
+        assert response.status_code == 200
+        assert response.content == content
+
+    def test_range_response_uses_zero_copy_send_when_offered(self, tmp_path):
+        path = tmp_path / "blob"
+        path.write_bytes(b"0123456789")
+        response = FileRangeResponse(str(path), 10, [(2, 5)], {}, "application/octet-stream")
+        messages = []
+        
+        async def send(message):
+            messages.append(message)
+        
+        scope = {"type": "http", "extensions": {"http.response.zerocopysend": {}}}
+        asyncio.run(response(scope, None, send))
+        assert messages[0]["status"] == 206
+        assert messages[1]["type"] == "http.response.zerocopysend"
+        assert (messages[1]["offset"], messages[1]["count"]) == (2, 4)
+        assert messages[1]["file"].name == str(path)
+
+    def test_upload_file_too_large(self, monkeypatch):
+        monkeypatch.setattr(settings, "MAX_FILE_SIZE", 16)
+        monkeypatch.setattr(settings, "UPLOAD_CHUNK_SIZE", 4)
+        test_file = io.BytesIO(b"PK\x03\x04" + b"x" * 60)
+        
+        response = client.post(
+            "/api/files/upload",
+            files={"file": ("big.docx", test_file, "application/vnd.openxmlformats-officedocument.wordprocessingml.document")},
+            headers={"Authorization": f"Bearer {self.ops_token}"}
+        )
+        assert response.status_code == 400
+        assert "File too large" in response.json()["detail"]
+        # The partially written temp file must not be left behind
+        assert not list(Path(settings.UPLOAD_DIR).glob(".*.part"))
+
+    def test_stream_aborts_once_limit_is_crossed(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, "MAX_FILE_SIZE", 16)
+        monkeypatch.setattr(settings, "UPLOAD_CHUNK_SIZE", 4)
+        body = (
+            b"--xyz\r\n"
+            b'Content-Disposition: form-data; name="file"; filename="big.docx"\r\n\r\n'
+            + b"x" * 64 + b"\r\n--xyz--\r\n"
+        )
+        chunks = [body[i:i + 8] for i in range(0, len(body), 8)]
+        received = []
+        
+        async def receive():
+            chunk = chunks[len(received)]
+            received.append(chunk)
+            return {"type": "http.request", "body": chunk, "more_body": len(received) < len(chunks)}
+        
+        # No Content-Length, so the limit can only be enforced while streaming
+        request = Request({
+            "type": "http",
+            "method": "POST",
+            "headers": [(b"content-type", b"multipart/form-data; boundary=xyz")],
+        }, receive)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(receive_multipart_file(request, tmp_path, lambda name: None))
+        assert exc_info.value.status_code == 400
+        assert len(received) < len(chunks)
+        assert list(tmp_path.iterdir()) == []
+
     def test_upload_file_client_forbidden(self):
         test_file = io.BytesIO(b"test file content")
         test_file.name = "test.docx"
@@ -95,6 +542,127 @@ class TestFiles:
         assert response.status_code == 400
         assert "File type not allowed" in response.json()["detail"]
 
+    def test_resumable_upload_session(self):
+        headers = {"Authorization": f"Bearer {self.ops_token}"}
+        content = minimal_package("pptx", 100)
+        
+        response = client.post(
+            "/api/files/upload-sessions",
+            json={"filename": "deck.pptx", "file_size": len(content)},
+            headers=headers
+        )
+        assert response.status_code == 200
+        session_id = response.json()["id"]
+        assert response.json()["offset"] == 0
+        
+        response = client.put(
+            f"/api/files/upload-sessions/{session_id}?offset=0",
+            content=content[:40],
+            headers=headers
+        )
+        assert response.status_code == 200
+        assert response.json()["offset"] == 40
+        
+        # A retransmitted chunk at a stale offset is rejected with the resume point
+        response = client.put(
+            f"/api/files/upload-sessions/{session_id}?offset=0",
+            content=content[:40],
+            headers=headers
+        )
+        assert response.status_code == 409
+        assert response.headers["Upload-Offset"] == "40"
+        
+        response = client.post(f"/api/files/upload-sessions/{session_id}/complete", headers=headers)
+        assert response.status_code == 409
+        
+        response = client.put(
+            f"/api/files/upload-sessions/{session_id}?offset=40",
+            content=content[40:],
+            headers=headers
+        )
+        assert response.json()["offset"] == len(content)
+        
+        response = client.post(f"/api/files/upload-sessions/{session_id}/complete", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["filename"] == "deck.pptx"
+        assert data["file_size"] == len(content)
+        
+        response = client.get(f"/api/files/upload-sessions/{session_id}", headers=headers)
+        assert response.status_code == 404
+
+    def test_upload_session_rejects_overflowing_chunk(self):
+        headers = {"Authorization": f"Bearer {self.ops_token}"}
+        response = client.post(
+            "/api/files/upload-sessions",
+            json={"filename": "sheet.xlsx", "file_size": 4},
+            headers=headers
+        )
+        session_id = response.json()["id"]
+        
+        response = client.put(
+            f"/api/files/upload-sessions/{session_id}?offset=0",
+            content=b"too many bytes",
+            headers=headers
+        )
+        assert response.status_code == 400
+        response = client.get(f"/api/files/upload-sessions/{session_id}", headers=headers)
+        assert response.json()["offset"] == 0
+
+    def test_upload_session_allows_one_writer_at_a_time(self):
+        headers = {"Authorization": f"Bearer {self.ops_token}"}
+        content = minimal_package("xlsx", 100)
+        response = client.post(
+            "/api/files/upload-sessions",
+            json={"filename": "ledger.xlsx", "file_size": len(content)},
+            headers=headers
+        )
+        session_id = response.json()["id"]
+        
+        # A chunk still being written holds the part file; a second PUT at the same offset waits its turn
+        with exclusive_writer(session_part_path(session_id)):
+            response = client.put(
+                f"/api/files/upload-sessions/{session_id}?offset=0",
+                content=content,
+                headers=headers
+            )
+            assert response.status_code == 409
+        
+        response = client.put(
+            f"/api/files/upload-sessions/{session_id}?offset=0",
+            content=content,
+            headers=headers
+        )
+        assert response.json()["offset"] == len(content)
+        assert session_part_path(session_id).read_bytes() == content
+
+    def test_expired_upload_sessions_are_purged(self):
+        headers = {"Authorization": f"Bearer {self.ops_token}"}
+        response = client.post(
+            "/api/files/upload-sessions",
+            json={"filename": "old.docx", "file_size": 10},
+            headers=headers
+        )
+        session_id = response.json()["id"]
+        assert session_part_path(session_id).exists()
+        
+        db = TestingSessionLocal()
+        db.query(UploadSession).filter(UploadSession.id == session_id).update(
+            {UploadSession.expires_at: datetime.utcnow() - timedelta(minutes=1)}
+        )
+        db.commit()
+        db.close()
+        
+        async def purge():
+            async with AsyncTestingSessionLocal() as async_db:
+                return await purge_expired_upload_sessions(async_db)
+        
+        assert asyncio.run(purge()) >= 1
+        db = TestingSessionLocal()
+        assert db.query(UploadSession).filter(UploadSession.id == session_id).first() is None
+        db.close()
+        assert not session_part_path(session_id).exists()
+
     def test_list_files_client_success(self):
         response = client.get(
             "/api/files/list",
@@ -103,6 +671,216 @@ class TestFiles:
         assert response.status_code == 200
         assert isinstance(response.json(), list)
 
+    def seed_files(self, count: int, prefix: str = "seeded"):
+        db = TestingSessionLocal()
+        ops_user = db.query(User).filter(User.email == "ops@example.com").one()
+        for index in range(count):
+            db.add(FileRecord(
+                filename=f"{prefix}-{index}",
+                original_filename=f"{prefix}-{index:04d}.xlsx",
+                storage_key=f"missing/{prefix}-{index}",
+                file_type="xlsx",
+                file_size=index,
+                uploaded_by=ops_user.id
+            ))
+        db.commit()
+        db.close()
+        # Written behind the API's back, so tell the listing cache
+        catalog_version.bump()
+
+    def list_page(self, **params):
+        return client.get(
+            "/api/files/list",
+            params=params,
+            headers={"Authorization": f"Bearer {self.client_token}"}
+        )
+
+    def test_list_files_rows_match_schema_and_are_compressed(self):
+        self.seed_files(60, prefix="compressed")
+        headers = {"Authorization": f"Bearer {self.client_token}"}
+        for encoding in ("br", "gzip"):
+            response = client.get(
+                "/api/files/list",
+                params={"limit": 50, "file_type": "xlsx"},
+                headers={**headers, "Accept-Encoding": encoding}
+            )
+            assert response.status_code == 200
+            assert response.headers["content-encoding"] == encoding
+            assert "Accept-Encoding" in response.headers["vary"]
+            assert "x-next-cursor" in response.headers
+            rows = response.json()
+            assert len(rows) == 50
+            # Rows skip response-model validation, so check they still match it exactly
+            for row in rows:
+                assert FileInfo.model_validate(row).model_dump(mode="json") == row
+        
+        response = client.get(
+            "/api/files/list",
+            params={"limit": 1},
+            headers={**headers, "Accept-Encoding": "gzip"}
+        )
+        assert "content-encoding" not in response.headers
+
+    def test_list_files_keyset_pagination(self):
+        self.seed_files(25, prefix="paged")
+        
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 7, "file_type": "xlsx", "sort": "filename"}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.list_page(**params)
+            assert response.status_code == 200
+            assert len(response.json()) <= 7
+            seen.extend(item["filename"] for item in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        
+        paged = [name for name in seen if name.startswith("paged-")]
+        assert paged == sorted(paged)
+        assert len(paged) == len(set(paged)) == 25
+        
+        assert self.list_page(cursor="not-a-cursor").status_code == 400
+        # Well-formed cursors whose values don't fit the sort keys
+        for values in ([[1], 5], [{}, 5], [None, 5], ["paged-1", True], [3, 5]):
+            assert self.list_page(sort="filename", cursor=encode_cursor(values)).status_code == 400
+        assert self.list_page(cursor=encode_cursor(["7"])).status_code == 400
+        headers = {"Authorization": f"Bearer {self.client_token}"}
+        response = client.get(f"/api/files/search?q=paged&cursor={encode_cursor([True])}", headers=headers)
+        assert response.status_code == 400
+
+    def test_list_files_query_count_independent_of_table_size(self):
+        self.seed_files(5, prefix="small")
+        # Authenticate first so only the listing's own queries are counted
+        self.list_page(limit=1)
+        with count_queries() as small:
+            assert len(self.list_page(limit=5).json()) == 5
+        
+        self.seed_files(200, prefix="large")
+        with count_queries() as large:
+            response = self.list_page(limit=5)
+            assert len(response.json()) == 5
+        with count_queries() as next_page:
+            self.list_page(limit=5, cursor=response.headers["X-Next-Cursor"])
+        
+        assert len(small) == len(large) == len(next_page)
+
+    def test_download_history_query_count_independent_of_size(self):
+        headers = {"Authorization": f"Bearer {self.client_token}"}
+        file_id = self.upload("history.docx", minimal_docx(32)).json()["id"]
+        
+        def history_queries():
+            with count_queries() as statements:
+                response = client.get("/api/files/download-history?limit=3", headers=headers)
+                assert len(response.json()) == 3
+            return len(statements)
+        
+        for _ in range(3):
+            client.get(f"/api/files/download-file/{file_id}", headers=headers)
+        audit_writer.flush()
+        few = history_queries()
+        for _ in range(30):
+            client.get(f"/api/files/download-file/{file_id}", headers=headers)
+        audit_writer.flush()
+        assert history_queries() == few
+
+    def test_expired_downloads_are_archived_in_batches(self):
+        headers = {"Authorization": f"Bearer {self.client_token}"}
+        file_id = self.upload("archived.docx", minimal_docx(32)).json()["id"]
+        db = TestingSessionLocal()
+        user_id = db.query(User).filter(User.email == "client@example.com").one().id
+        long_ago = datetime.utcnow() - timedelta(days=30)
+        for index in range(7):
+            db.add(DownloadRecord(
+                user_id=user_id,
+                file_id=file_id,
+                download_token=f"archived-{index}",
+                expires_at=long_ago + timedelta(minutes=index),
+                is_used=index % 2 == 0
+            ))
+        db.add(DownloadRecord(
+            user_id=user_id,
+            file_id=file_id,
+            download_token="archived-live",
+            expires_at=datetime.utcnow() + timedelta(hours=1)
+        ))
+        db.commit()
+        
+        # Two batches of three leave the newest expired record for the next run
+        assert archive_expired_downloads(db, long_ago + timedelta(hours=1), batch_size=3, max_batches=2) == 6
+        remaining = {record.download_token for record in db.query(DownloadRecord).filter(DownloadRecord.file_id == file_id)}
+        assert remaining == {"archived-6", "archived-live"}
+        assert archive_expired_downloads(db, long_ago + timedelta(hours=1), batch_size=3, max_batches=2) == 1
+        archived = db.query(ArchivedDownload).filter(ArchivedDownload.file_id == file_id).all()
+        db.close()
+        assert len(archived) == 7
+        assert sum(record.is_used for record in archived) == 4
+        
+        # Archived rows are paged newest first and no longer in the live history
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            response = client.get("/api/files/download-history/archive", params=params, headers=headers)
+            assert response.status_code == 200
+            seen.extend(item["id"] for item in response.json() if item["filename"] == "archived.docx")
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == sorted((record.id for record in archived), reverse=True)
+        history = client.get("/api/files/download-history", headers=headers).json()
+        assert not {item["id"] for item in history} & set(seen)
+        
+        # Retention deletes archived rows; deleting the file removes the rest
+        db = TestingSessionLocal()
+        assert delete_archived_downloads(db, long_ago + timedelta(minutes=3), batch_size=2, max_batches=10) == 3
+        db.close()
+        ops_headers = {"Authorization": f"Bearer {self.ops_token}"}
+        assert client.delete(f"/api/files/{file_id}", headers=ops_headers).status_code == 200
+        db = TestingSessionLocal()
+        assert db.query(ArchivedDownload).filter(ArchivedDownload.file_id == file_id).count() == 0
+        db.close()
+
+    def test_expired_revocations_are_deleted_by_maintenance(self):
+        db = TestingSessionLocal()
+        now = datetime.utcnow()
+        db.add_all([
+            RevokedDownloadToken(token_id="expired-revocation", expires_at=now - timedelta(minutes=1)),
+            RevokedDownloadToken(token_id="live-revocation", expires_at=now + timedelta(hours=1)),
+        ])
+        db.commit()
+        assert delete_expired_revocations(db) >= 1
+        assert db.get(RevokedDownloadToken, "expired-revocation") is None
+        assert db.get(RevokedDownloadToken, "live-revocation") is not None
+        db.close()
+
+    def test_maintenance_scheduler_runs_due_jobs(self):
+        calls = []
+        
+        def job(db):
+            calls.append(db)
+            return 2
+        
+        def failing_job(db):
+            raise RuntimeError("boom")
+        
+        scheduler = MaintenanceScheduler(TestingSessionLocal)
+        scheduler.add_job("counted", job, interval=3600)
+        scheduler.add_job("failing", failing_job, interval=3600)
+        assert scheduler.run_pending() == {"counted": 2, "failing": 0}
+        assert scheduler.run_pending() == {}
+        assert scheduler.run_pending(force=True) == {"counted": 2, "failing": 0}
+        stats = scheduler.stats()["jobs"]
+        assert stats["counted"]["runs"] == 2 and stats["counted"]["rows"] == 4
+        assert stats["failing"]["errors"] == 2 and stats["failing"]["last_error"] == "boom"
+        
+        response = client.get("/api/files/maintenance", headers={"Authorization": f"Bearer {self.ops_token}"})
+        assert {"download_archival", "revoked_tokens"} <= set(response.json()["jobs"])
+        response = client.get("/api/files/maintenance", headers={"Authorization": f"Bearer {self.client_token}"})
+        assert response.status_code == 403
+
     def test_list_files_ops_forbidden(self):
         response = client.get(
             "/api/files/list",
@@ -0,0 +1,87 @@
+import io
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app.core.listing_cache import CatalogVersion
+from tests.documents import minimal_docx
+from tests.utils import client, async_engine, seed_user
+
+
+@contextmanager
+def count_queries():
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+def test_catalog_version_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "catalog")
+    first, second = CatalogVersion(path), CatalogVersion(path)
+    epoch, version = first.get()
+    assert version == 0
+    assert second.bump() == 1
+    assert first.get() == (epoch, 1)
+    assert first.bump() == 2
+    assert second.get() == (epoch, 2)
+
+
+class TestListingCache:
+    def setup_method(self):
+        self.ops = seed_user("cache-ops@example.com", "ops")
+        self.ops2 = seed_user("cache-ops2@example.com", "ops")
+        self.client = seed_user("cache-client@example.com", "client")
+    
+    def upload(self, name: str, headers: dict) -> dict:
+        return client.post(
+            "/api/files/upload",
+            files={"file": (name, io.BytesIO(minimal_docx(64)), "application/octet-stream")},
+            headers=headers
+        ).json()
+    
+    def test_polls_are_answered_without_the_database(self):
+        self.upload("cached.docx", self.ops)
+        params = {"limit": 3, "sort": "-uploaded_at"}
+        first = client.get("/api/files/list", params=params, headers=self.client)
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "private, no-cache"
+        
+        with count_queries() as statements:
+            cached = client.get("/api/files/list", params=params, headers=self.client)
+            not_modified = client.get("/api/files/list", params=params, headers={**self.client, "If-None-Match": etag})
+        assert statements == []
+        assert cached.content == first.content
+        assert cached.headers["etag"] == etag
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        
+        # An upload moves the catalog version on; the old ETag no longer matches
+        uploaded = self.upload("newer.docx", self.ops)
+        changed = client.get("/api/files/list", params=params, headers={**self.client, "If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert changed.json()[0]["id"] == uploaded["id"]
+        
+        # So does a delete
+        assert client.delete(f"/api/files/{uploaded['id']}", headers=self.ops).status_code == 200
+        after_delete = client.get("/api/files/list", params=params, headers=self.client)
+        assert uploaded["id"] not in [row["id"] for row in after_delete.json()]
+    
+    def test_uploaded_pages_are_kept_per_user(self):
+        mine = self.upload("mine.docx", self.ops)
+        theirs = self.upload("theirs.docx", self.ops2)
+        for headers, expected, other in ((self.ops, mine, theirs), (self.ops2, theirs, mine)):
+            for _ in range(2):
+                ids = [row["id"] for row in client.get("/api/files/uploaded", headers=headers).json()]
+                assert expected["id"] in ids and other["id"] not in ids
+        
+        stats = client.get("/api/files/listing-cache", headers=self.ops).json()
+        assert stats["hits"] >= 2
+        assert client.get("/api/files/listing-cache", headers=self.client).status_code == 403
@@ -0,0 +1,100 @@
+import io
+import json
+import re
+
+from app.core.config import settings
+from app.core.listing_cache import listing_cache
+from app.core.metrics import MetricsRegistry, merge_snapshots, render_snapshots
+from tests.documents import minimal_docx
+from tests.utils import client, seed_user
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """Value of one sample in a Prometheus text exposition."""
+    wanted = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = "^" + re.escape(name) + (r"\{" + re.escape(wanted) + r"\}" if wanted else "") + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    assert match, f"{name} {labels} not found"
+    return float(match.group(1))
+
+
+def test_render_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    latency = registry.histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 1.0))
+    requests.inc("/a")
+    requests.inc("/a", amount=2)
+    latency.observe("/a", value=0.05)
+    latency.observe("/a", value=0.5)
+    latency.observe("/a", value=5)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert sample(text, "requests_total", route="/a") == 3
+    assert sample(text, "latency_seconds_bucket", route="/a", le="0.1") == 1
+    assert sample(text, "latency_seconds_bucket", route="/a", le="1") == 2
+    assert sample(text, "latency_seconds_bucket", route="/a", le="+Inf") == 3
+    assert sample(text, "latency_seconds_count", route="/a") == 3
+    assert sample(text, "latency_seconds_sum", route="/a") == 5.55
+
+
+def test_merge_worker_snapshots(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+    registry.counter("requests_total", "Requests").inc(amount=2)
+    registry.gauge("in_progress", "In progress").set(value=1)
+
+    # A worker that has exited leaves its counters but not its gauges behind
+    other = registry.snapshot()
+    other["pid"] = 2 ** 22 + 1
+    (tmp_path / f"metrics-{other['pid']}.json").write_text(json.dumps(other))
+
+    merged = merge_snapshots(registry.read_snapshots())
+    assert merged["requests_total"]["samples"] == {(): 4}
+    assert merged["in_progress"]["samples"] == {(): 1}
+    assert "requests_total 4" in render_snapshots(registry.read_snapshots())
+
+
+class TestMetricsEndpoint:
+    def setup_method(self):
+        self.headers = seed_user("metrics-ops@example.com", "ops")
+
+    def test_routes_are_labelled_by_template(self):
+        response = client.post(
+            "/api/files/upload",
+            files={"file": ("metrics.docx", io.BytesIO(minimal_docx(128)), "application/octet-stream")},
+            headers=self.headers
+        )
+        file_id = response.json()["id"]
+        client.get(f"/api/files/download-file/{file_id}", headers=self.headers)
+        client.get("/no/such/path")
+
+        text = client.get("/metrics").text
+        route = "/api/files/download-file/{file_id}"
+        assert sample(text, "http_requests_total", method="GET", route=route, status="403") >= 1
+        assert sample(text, "http_requests_total", method="GET", route="unmatched", status="404") >= 1
+        assert f"/api/files/download-file/{file_id}\"" not in text
+        assert sample(text, "http_request_body_bytes_total", route="/api/files/upload") >= 128
+        assert sample(text, "http_request_duration_seconds_count", method="POST", route="/api/files/upload") >= 1
+        assert sample(text, "uploads_in_progress") == 0
+
+    def test_database_queries_are_counted(self):
+        route = "/api/files/uploaded"
+        client.get(route, headers=self.headers)
+        before = client.get("/metrics").text
+        # A cached page would be served without queries
+        listing_cache.clear()
+        client.get(route, headers=self.headers)
+
+        text = client.get("/metrics").text
+        count = sample(text, "http_request_db_queries_count", route=route)
+        assert count == sample(before, "http_request_db_queries_count", route=route) + 1
+        no_queries = sample(text, "http_request_db_queries_bucket", route=route, le="0")
+        assert no_queries == sample(before, "http_request_db_queries_bucket", route=route, le="0")
+        assert sample(text, "db_queries_total", engine="async") >= 1
+
+    def test_token(self, monkeypatch):
+        monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+        assert client.get("/metrics").status_code == 401
+        response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
@@ -0,0 +1,219 @@
+import io
+import zipfile
+
+from app.core.ooxml import read_preview
+from app.core.previews import preview_generator
+from app.models import FilePreview, FileRecord
+from tests.test_search import broken_docx
+from tests.documents import minimal_docx
+from tests.utils import client, TestingSessionLocal, seed_user
+
+RELATIONSHIPS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+
+def package(path, parts: dict) -> str:
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content in parts.items():
+            archive.writestr(name, content)
+    return str(path)
+
+
+def rels(*relationships) -> str:
+    return (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + "".join(f'<Relationship Id="{rid}" Type="{kind}" Target="{target}"/>' for rid, kind, target in relationships)
+        + "</Relationships>"
+    )
+
+
+def test_document_preview_stops_at_the_first_page_break(tmp_path):
+    path = package(tmp_path / "report.docx", {
+        "word/document.xml": (
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+            '<w:p><w:r><w:t>Annual</w:t></w:r><w:r><w:t> report</w:t></w:r></w:p>'
+            '<w:p><w:r><w:br w:type="page"/><w:t>Appendix</w:t></w:r></w:p>'
+            '</w:body></w:document>'
+        ),
+        "docProps/core.xml": (
+            '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>Report 2026</dc:title></cp:coreProperties>'
+        ),
+    })
+    preview = read_preview(path, max_chars=1000, max_rows=10, max_thumbnail_bytes=1000)
+    assert preview == {"type": "docx", "title": "Report 2026", "text": "Annual report"}
+    assert read_preview(path, max_chars=3, max_rows=10, max_thumbnail_bytes=1000)["text"] == "Ann"
+
+
+def test_presentation_preview_has_the_first_slide_and_thumbnail(tmp_path):
+    slide = (
+        '<p:sld xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+        'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">'
+        '<a:p><a:r><a:t>{}</a:t></a:r></a:p></p:sld>'
+    )
+    path = package(tmp_path / "deck.pptx", {
+        "_rels/.rels": rels(
+            ("rId1", "http://schemas.openxmlformats.org/package/2006/relationships/metadata/thumbnail",
+             "docProps/thumbnail.png"),
+        ),
+        "docProps/thumbnail.png": PNG,
+        "ppt/presentation.xml": (
+            f'<p:presentation xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+            f'xmlns:r="{RELATIONSHIPS}"><p:sldIdLst>'
+            '<p:sldId id="256" r:id="rId3"/><p:sldId id="257" r:id="rId2"/>'
+            '</p:sldIdLst></p:presentation>'
+        ),
+        "ppt/_rels/presentation.xml.rels": rels(
+            ("rId2", f"{RELATIONSHIPS}/slide", "slides/slide1.xml"),
+            ("rId3", f"{RELATIONSHIPS}/slide", "slides/slide2.xml"),
+        ),
+        "ppt/slides/slide1.xml": slide.format("Second"),
+        "ppt/slides/slide2.xml": slide.format("Opening"),
+    })
+    preview = read_preview(path, max_chars=1000, max_rows=10, max_thumbnail_bytes=1000)
+    # Slides go in presentation order, not part name order
+    assert (preview["slides"], preview["text"]) == (2, "Opening")
+    assert (preview["thumbnail"], preview["thumbnail_type"]) == (PNG, "image/png")
+    assert "thumbnail" not in read_preview(path, max_chars=1000, max_rows=10, max_thumbnail_bytes=10)
+
+
+def test_workbook_preview_has_the_first_rows_of_the_first_sheet(tmp_path):
+    path = package(tmp_path / "budget.xlsx", {
+        "xl/workbook.xml": (
+            f'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="{RELATIONSHIPS}">'
+            '<sheets><sheet name="Budget" r:id="rId1"/><sheet name="Notes" r:id="rId2"/></sheets></workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": rels(
+            ("rId1", f"{RELATIONSHIPS}/worksheet", "worksheets/sheet1.xml"),
+            ("rId2", f"{RELATIONSHIPS}/worksheet", "worksheets/sheet2.xml"),
+        ),
+        "xl/worksheets/sheet1.xml": (
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            '<row r="1"><c r="A1" t="s"><v>1</v></c><c r="C1" t="s"><v>0</v></c></row>'
+            '<row r="2"><c r="A2"><v>42</v></c><c r="B2" t="inlineStr"><is><t>inline</t></is></c></row>'
+            '<row r="3"><c r="A3"><v>7</v></c></row>'
+            '</sheetData></worksheet>'
+        ),
+        "xl/sharedStrings.xml": (
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<si><t>Amount</t></si><si><t>Region</t></si><si><t>Unused</t></si></sst>'
+        ),
+    })
+    preview = read_preview(path, max_chars=1000, max_rows=2, max_thumbnail_bytes=1000)
+    assert preview["sheets"] == ["Budget", "Notes"]
+    assert preview["rows"] == [["Region", None, "Amount"], ["42", "inline"]]
+
+
+def test_files_that_are_not_packages_have_no_preview(tmp_path):
+    (tmp_path / "random.docx").write_bytes(b"not a zip file")
+    assert read_preview(str(tmp_path / "random.docx"), 1000, 10, 1000)["type"] is None
+    path = package(tmp_path / "other.docx", {"readme.txt": "hello"})
+    assert read_preview(path, 1000, 10, 1000)["type"] is None
+
+
+class TestPreviewEndpoints:
+    def setup_method(self):
+        self.ops = seed_user("preview-ops@example.com", "ops")
+        self.client = seed_user("preview-client@example.com", "client")
+
+    def upload(self, name: str, content: bytes) -> int:
+        response = client.post(
+            "/api/files/upload",
+            files={"file": (name, io.BytesIO(content), "application/octet-stream")},
+            headers=self.ops
+        )
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    def test_preview_is_made_after_upload_and_cached(self):
+        file_id = self.upload("preview-notes.docx", minimal_docx(text="Lighthouse keeper's log"))
+        preview_generator.flush()
+
+        response = client.get(f"/api/files/{file_id}/preview", headers=self.client)
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+        assert response.json()["text"] == "Lighthouse keeper's log"
+        assert response.json()["thumbnail_url"] is None
+
+        cached = client.get(
+            f"/api/files/{file_id}/preview",
+            headers={**self.client, "If-None-Match": response.headers["etag"]}
+        )
+        assert cached.status_code == 304
+        assert client.get(f"/api/files/{file_id}/thumbnail", headers=self.client).status_code == 404
+
+    def test_embedded_thumbnails_are_served(self):
+        deck = io.BytesIO()
+        package(deck, {
+            "[Content_Types].xml": (
+                '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                '<Override PartName="/ppt/presentation.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.presentationml.presentation.main+xml"/>'
+                '</Types>'
+            ),
+            "_rels/.rels": rels(
+                ("rId1", "http://schemas.openxmlformats.org/package/2006/relationships/metadata/thumbnail",
+                 "docProps/thumbnail.png"),
+            ),
+            "docProps/thumbnail.png": PNG,
+            "ppt/presentation.xml": '<p:presentation xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main"/>',
+        })
+        file_id = self.upload("preview-deck.pptx", deck.getvalue())
+        preview_generator.flush()
+
+        preview = client.get(f"/api/files/{file_id}/preview", headers=self.client).json()
+        assert preview["slides"] == 0
+        response = client.get(preview["thumbnail_url"], headers=self.client)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert response.content == PNG
+        cached = client.get(
+            preview["thumbnail_url"],
+            headers={**self.client, "If-None-Match": response.headers["etag"]}
+        )
+        assert cached.status_code == 304
+
+    def test_unreadable_files_are_marked_unavailable(self):
+        file_id = self.upload("preview-broken.docx", broken_docx())
+        preview_generator.flush()
+        response = client.get(f"/api/files/{file_id}/preview", headers=self.client)
+        assert response.json()["status"] == "unavailable"
+
+    def test_missing_previews_are_queued_and_made_once(self):
+        content = minimal_docx(text="Pending preview")
+        file_id = self.upload("preview-pending.docx", content)
+        preview_generator.flush()
+        db = TestingSessionLocal()
+        db.query(FilePreview).delete()
+        db.commit()
+
+        response = client.get(f"/api/files/{file_id}/preview", headers=self.client)
+        assert response.status_code == 202
+        assert response.json()["status"] == "pending"
+        assert response.headers["retry-after"]
+        preview_generator.flush()
+        assert client.get(f"/api/files/{file_id}/preview", headers=self.client).json()["status"] == "ready"
+
+        # Running a job again, or for a second copy, doesn't parse the content again
+        skipped = preview_generator.stats()["skipped"]
+        second = self.upload("preview-pending-copy.docx", content)
+        preview_generator.flush()
+        assert preview_generator.stats()["skipped"] == skipped + 1
+
+        sha256 = db.get(FileRecord, file_id).sha256
+        client.delete(f"/api/files/{file_id}", headers=self.ops)
+        assert db.get(FilePreview, sha256) is not None
+        client.delete(f"/api/files/{second}", headers=self.ops)
+        db.expire_all()
+        assert db.get(FilePreview, sha256) is None
+        db.close()
+
+    def test_access_and_stats(self):
+        file_id = self.upload("preview-private.docx", minimal_docx(text="Ops only"))
+        preview_generator.flush()
+        other_ops = seed_user("other-preview-ops@example.com", "ops")
+        assert client.get(f"/api/files/{file_id}/preview", headers=self.ops).status_code == 200
+        assert client.get(f"/api/files/{file_id}/preview", headers=other_ops).status_code == 404
+        assert client.get("/api/files/999999/preview", headers=self.client).status_code == 404
+        assert client.get("/api/files/previews", headers=self.client).status_code == 403
+        assert client.get("/api/files/previews", headers=self.ops).json()["completed"] >= 1
@@ -0,0 +1,82 @@
+import asyncio
+import io
+import sys
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.profiling import Sampler, profiler
+from tests.documents import minimal_docx
+from tests.utils import client, seed_user
+
+
+def busy_dependency():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def waiting_handler():
+    await asyncio.sleep(0.05)
+
+
+def test_sampler_records_running_and_awaiting_stacks():
+    async def request():
+        sampler = Sampler(sys._getframe(), asyncio.current_task(), 0.002)
+        sampler.start()
+        busy_dependency()
+        await waiting_handler()
+        return sampler.stop()
+
+    stacks = asyncio.run(request())
+    running = [stack for stack in stacks if stack.split(";")[-1].startswith("busy_dependency")]
+    waiting = [stack for stack in stacks if "waiting_handler" in stack and stack.split(";")[-1].startswith("<await")]
+    assert running and waiting
+    # Stacks start below the frame the sampler was started from
+    assert all("request" not in stack.split(";")[0] for stack in stacks)
+
+
+class TestProfilingMiddleware:
+    @pytest.fixture(autouse=True)
+    def profile_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(profiler.store, "directory", str(tmp_path))
+        monkeypatch.setattr(settings, "PROFILING_INTERVAL_MS", 1.0)
+
+    def setup_method(self):
+        self.ops = seed_user("profile-ops@example.com", "ops")
+        self.client = seed_user("profile-client@example.com", "client")
+
+    def test_ops_header_profiles_request(self):
+        response = client.post(
+            "/api/files/upload",
+            files={"file": ("profiled.docx", io.BytesIO(minimal_docx(256 * 1024)), "application/octet-stream")},
+            headers={**self.ops, "X-Profile": "1"}
+        )
+        assert response.status_code == 200
+        profile_id = response.headers["X-Profile-Id"]
+
+        profiles = client.get("/api/profiles/", headers=self.ops).json()
+        info = next(profile for profile in profiles if profile["id"] == profile_id)
+        assert info["route"] == "/api/files/upload"
+        assert info["status"] == 200
+        assert info["trigger"] == "header"
+
+        folded = client.get(f"/api/profiles/{profile_id}", headers=self.ops)
+        assert folded.status_code == 200
+        lines = folded.text.splitlines()
+        assert len(lines) > 0
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == info["samples"]
+
+    def test_header_ignored_for_client_users(self):
+        response = client.get("/api/files/list", headers={**self.client, "X-Profile": "1"})
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response.headers
+        assert client.get("/api/profiles/", headers=self.client).status_code == 403
+
+    def test_sample_rate(self, monkeypatch):
+        monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 1.0)
+        response = client.get("/api/files/list", headers=self.client)
+        profile_id = response.headers["X-Profile-Id"]
+        assert client.get(f"/api/profiles/{profile_id}", headers=self.ops).status_code == 200
+        assert client.get("/api/profiles/../../etc", headers=self.ops).status_code == 404
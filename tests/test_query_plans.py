@@ -0,0 +1,263 @@
+"""
+Query-plan regression tests for the hot endpoints.
+
+The statements the endpoints actually run are captured against the test
+database and then planned with EXPLAIN on a schema built by the Alembic
+migrations, so a missing or unusable index fails here rather than in
+production. A plan step that reads a whole table fails unless the query
+is an ordered page over that table (the unfiltered listings), and sorting
+a page in a temporary structure always fails.
+
+Set TEST_POSTGRES_URL to plan the same statements on PostgreSQL too. The
+migrations are applied to that database, replacing its tables.
+"""
+import io
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Tuple
+
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, create_engine, event, text
+from sqlalchemy.sql.dml import Delete, Update
+from sqlalchemy.sql.selectable import Select
+
+from app.core.audit import audit_writer
+from app.core.maintenance import archive_expired_downloads, delete_archived_downloads
+from app.core.migrations import include_object_for, upgrade_database
+from app.core.security import create_access_token, get_password_hash
+from app.database import Base
+from app.models import User
+from tests.documents import minimal_package
+from tests.utils import client, async_engine, engine, TestingSessionLocal
+
+
+class CapturedQuery(NamedTuple):
+    label: str
+    statement: object
+    allow_scan: Tuple[str, ...]
+
+
+@contextmanager
+def capture(queries: List[CapturedQuery], label: str, allow_scan: Tuple[str, ...] = ()):
+    def record(conn, clauseelement, multiparams, params, execution_options):
+        if isinstance(clauseelement, (Select, Update, Delete)):
+            queries.append(CapturedQuery(label, clauseelement, allow_scan))
+
+    engines = [async_engine.sync_engine, engine]
+    for target in engines:
+        event.listen(target, "before_execute", record)
+    try:
+        yield
+    finally:
+        for target in engines:
+            event.remove(target, "before_execute", record)
+
+
+def ensure_user(email: str, user_type: str) -> str:
+    db = TestingSessionLocal()
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(
+            email=email,
+            hashed_password=get_password_hash("planpass123"),
+            user_type=user_type,
+            is_verified=True
+        ))
+        db.commit()
+    db.close()
+    return create_access_token(data={"sub": email})
+
+
+@pytest.fixture(scope="module")
+def hot_queries() -> List[CapturedQuery]:
+    ops = {"Authorization": f"Bearer {ensure_user('plan-ops@example.com', 'ops')}"}
+    client_headers = {"Authorization": f"Bearer {ensure_user('plan-client@example.com', 'client')}"}
+    file_ids = []
+    for index in range(3):
+        response = client.post(
+            "/api/files/upload",
+            files={"file": (f"plan-{index}.xlsx", io.BytesIO(minimal_package("xlsx", 64)), "application/octet-stream")},
+            headers=ops
+        )
+        file_ids.append(response.json()["id"])
+    # Authenticate both users once so principal lookups are cached below
+    client.get("/api/auth/me", headers=ops)
+    client.get("/api/auth/me", headers=client_headers)
+
+    queries: List[CapturedQuery] = []
+
+    def get_pages(label: str, path: str, headers: dict, allow_scan: Tuple[str, ...] = (), **params):
+        with capture(queries, label, allow_scan):
+            response = client.get(path, params={"limit": 1, **params}, headers=headers)
+            assert response.status_code == 200, response.text
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor:
+                client.get(path, params={"limit": 1, "cursor": cursor, **params}, headers=headers)
+
+    for sort in ("-uploaded_at", "uploaded_at", "filename", "-filename"):
+        get_pages(f"list files by {sort}", "/api/files/list", client_headers, allow_scan=("files",), sort=sort)
+        get_pages(f"list xlsx files by {sort}", "/api/files/list", client_headers, sort=sort, file_type="xlsx")
+        get_pages(f"uploaded files by {sort}", "/api/files/uploaded", ops, sort=sort)
+    get_pages("list users", "/api/users/", ops, allow_scan=("users",))
+    get_pages("list client users", "/api/users/", ops, user_type="client")
+
+    with capture(queries, "login"):
+        client.post("/api/auth/login", json={"email": "plan-client@example.com", "password": "planpass123"})
+    with capture(queries, "email verification"):
+        client.post("/api/auth/verify-email", json={"token": "no-such-token"})
+
+    with capture(queries, "download links"):
+        links = [
+            client.get(f"/api/files/download-file/{file_id}", headers=client_headers).json()["download_link"]
+            for file_id in file_ids
+        ]
+        audit_writer.flush()
+    tokens = [link.rsplit("/", 1)[1] for link in links]
+    with capture(queries, "secure download"):
+        assert client.get(f"/api/files/secure-download/{tokens[0]}", headers=client_headers).status_code == 200
+        audit_writer.flush()
+    with capture(queries, "revoke download link"):
+        client.delete(f"/api/files/download-links/{tokens[1]}", headers=client_headers)
+    get_pages("download history", "/api/files/download-history", client_headers)
+    get_pages("archived download history", "/api/files/download-history/archive", client_headers)
+
+    with capture(queries, "maintenance"):
+        db = TestingSessionLocal()
+        archive_expired_downloads(db, datetime.utcnow() - timedelta(days=1), batch_size=10, max_batches=1)
+        delete_archived_downloads(db, datetime.utcnow() - timedelta(days=365), batch_size=10, max_batches=1)
+        db.close()
+    with capture(queries, "delete file"):
+        assert client.delete(f"/api/files/{file_ids[2]}", headers=ops).status_code == 200
+
+    assert {query.label for query in queries} >= {"secure download", "download history", "delete file"}
+    return queries
+
+
+def compile_for(statement, dialect):
+    compiled = statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    return str(compiled), compiled
+
+
+SQLITE_SCAN = re.compile(r"SCAN (\w+)")
+
+
+def sqlite_problems(connection, query: CapturedQuery) -> List[str]:
+    sql, compiled = compile_for(query.statement, connection.dialect)
+    parameters = tuple(
+        value.isoformat(" ") if isinstance(value, datetime) else value
+        for value in (compiled.params[name] for name in compiled.positiontup)
+    )
+    plan = [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, parameters)]
+    problems = []
+    for step in plan:
+        scan = SQLITE_SCAN.match(step)
+        if scan and scan.group(1) not in query.allow_scan:
+            problems.append(step)
+        if "TEMP B-TREE" in step:
+            problems.append(step)
+    return [f"{query.label}: {problem}\n  {sql}" for problem in problems]
+
+
+def test_migrations_match_models(tmp_path):
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    upgrade_database(url)
+    with create_engine(url).connect() as connection:
+        context = MigrationContext.configure(connection, opts={"include_object": include_object_for("sqlite")})
+        assert compare_metadata(context, Base.metadata) == []
+
+
+def baseline_metadata() -> MetaData:
+    """The tables create_all made before the series of migrations began."""
+    metadata = MetaData()
+    Table(
+        "users", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("email", String, unique=True, index=True, nullable=False),
+        Column("hashed_password", String, nullable=False),
+        Column("user_type", String, nullable=False),
+        Column("is_verified", Boolean),
+        Column("verification_token", String),
+        Column("created_at", DateTime(timezone=True)),
+    )
+    Table(
+        "files", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("filename", String, nullable=False),
+        Column("original_filename", String, nullable=False),
+        Column("file_path", String, nullable=False),
+        Column("file_type", String, nullable=False),
+        Column("file_size", Integer, nullable=False),
+        Column("uploaded_by", Integer, ForeignKey("users.id")),
+        Column("uploaded_at", DateTime(timezone=True)),
+    )
+    Table(
+        "downloads", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("user_id", Integer, ForeignKey("users.id")),
+        Column("file_id", Integer, ForeignKey("files.id")),
+        Column("download_token", String, unique=True, nullable=False),
+        Column("downloaded_at", DateTime(timezone=True)),
+        Column("expires_at", DateTime(timezone=True), nullable=False),
+        Column("is_used", Boolean),
+    )
+    return metadata
+
+
+def test_databases_created_before_migrations_are_upgraded(tmp_path):
+    url = f"sqlite:///{tmp_path / 'baseline.db'}"
+    engine = create_engine(url)
+    baseline_metadata().create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO files (filename, original_filename, file_path, file_type, file_size) "
+            "VALUES ('legacy-1.docx', 'legacy.docx', 'uploads/legacy-1.docx', 'docx', 3)"
+        ))
+    upgrade_database(url)
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={"include_object": include_object_for("sqlite")})
+        assert compare_metadata(context, Base.metadata) == []
+        row = connection.execute(text("SELECT storage_key, sha256 FROM files")).one()
+        assert tuple(row) == ("legacy-1.docx", None)
+
+
+def test_sqlite_plans_use_indexes(hot_queries, tmp_path):
+    url = f"sqlite:///{tmp_path / 'plans.db'}"
+    upgrade_database(url)
+    with create_engine(url).connect() as connection:
+        problems = [problem for query in hot_queries for problem in sqlite_problems(connection, query)]
+    assert problems == []
+
+
+def postgres_seq_scans(plan: dict) -> List[str]:
+    scans = []
+    if plan.get("Node Type") == "Seq Scan":
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans.extend(postgres_seq_scans(child))
+    return scans
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL is not set")
+def test_postgres_plans_use_indexes(hot_queries):
+    url = os.environ["TEST_POSTGRES_URL"]
+    postgres = create_engine(url)
+    with postgres.begin() as connection:
+        Base.metadata.drop_all(connection)
+        connection.exec_driver_sql("DROP TABLE IF EXISTS alembic_version")
+    upgrade_database(url)
+
+    problems = []
+    with postgres.connect() as connection:
+        # Empty tables make a sequential scan the cheapest plan; only fall
+        # back to one when no index can answer the query
+        connection.exec_driver_sql("SET enable_seqscan = off")
+        for query in hot_queries:
+            sql, compiled = compile_for(query.statement, connection.dialect)
+            plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql, compiled.params).scalar()
+            for table in postgres_seq_scans(plan[0]["Plan"]):
+                if table not in query.allow_scan:
+                    problems.append(f"{query.label}: Seq Scan on {table}\n  {sql}")
+    assert problems == []
@@ -0,0 +1,133 @@
+import io
+import zipfile
+
+from sqlalchemy import text
+
+from app.core.search import extract_text, search_indexer
+from tests.documents import minimal_docx
+from tests.utils import client, TestingSessionLocal, seed_user
+
+
+def ooxml(parts: dict) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, xml in parts.items():
+            archive.writestr(name, xml)
+    buffer.seek(0)
+    return buffer
+
+
+def broken_docx() -> bytes:
+    document = minimal_docx(text="Cut short")
+    with zipfile.ZipFile(io.BytesIO(document)) as archive:
+        parts = {name: archive.read(name) for name in archive.namelist()}
+    parts["word/document.xml"] = parts["word/document.xml"][:-30]
+    return ooxml(parts).getvalue()
+
+
+def test_text_is_extracted_from_each_document_type():
+    assert extract_text(io.BytesIO(minimal_docx(text="Quarterly\nrevenue")), "docx", 1000).split() == [
+        "Quarterly", "revenue"
+    ]
+    slides = ooxml({
+        "ppt/slides/slide1.xml": (
+            '<p:sld xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+            'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">'
+            '<a:p><a:r><a:t>Road</a:t></a:r><a:r><a:t>map</a:t></a:r></a:p><a:p><a:r><a:t>2026</a:t></a:r></a:p>'
+            '</p:sld>'
+        ),
+        "ppt/slideLayouts/slideLayout1.xml": (
+            '<a:t xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">Click to edit</a:t>'
+        ),
+    })
+    # Runs of one paragraph join up; layouts aren't content
+    assert extract_text(slides, "pptx", 1000).split() == ["Roadmap", "2026"]
+    workbook = ooxml({
+        "xl/sharedStrings.xml": (
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<si><t>Region</t></si><si><t>Forecast</t></si></sst>'
+        ),
+    })
+    assert extract_text(workbook, "xlsx", 1000).split() == ["Region", "Forecast"]
+    assert extract_text(io.BytesIO(minimal_docx(text="x" * 500)), "docx", 100) == "x" * 100
+
+
+class TestSearch:
+    def setup_method(self):
+        self.ops = seed_user("search-ops@example.com", "ops")
+        self.client = seed_user("search-client@example.com", "client")
+
+    def upload(self, name: str, content: bytes) -> int:
+        response = client.post(
+            "/api/files/upload",
+            files={"file": (name, io.BytesIO(content), "application/octet-stream")},
+            headers=self.ops
+        )
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    def search(self, q: str, **params):
+        response = client.get("/api/files/search", params={"q": q, **params}, headers=self.client)
+        assert response.status_code == 200
+        return response
+
+    def test_finds_names_and_contents_best_match_first(self):
+        in_text = self.upload("notes.docx", minimal_docx(text="The zephyrine budget for next year"))
+        in_name = self.upload("zephyrine-plan.docx", minimal_docx(text="Nothing to see"))
+        # A valid package whose document is cut short
+        unreadable = self.upload("zephyrine-scan.docx", broken_docx())
+        search_indexer.flush()
+
+        ids = [row["id"] for row in self.search("zephyrine").json()]
+        # Name matches outrank text matches; unreadable files are found by name
+        assert set(ids[:2]) == {in_name, unreadable}
+        assert ids[2] == in_text
+        assert [row["id"] for row in self.search("budget zephyr").json()] == [in_text]
+        assert self.search("zephyrine budget").json()[0]["filename"] == "notes.docx"
+
+        first = self.search("zephyrine", limit=2)
+        second = self.search("zephyrine", limit=2, cursor=first.headers["x-next-cursor"])
+        assert [row["id"] for row in first.json() + second.json()] == ids
+        assert "x-next-cursor" not in second.headers
+        assert self.search("zephyrine", file_type="xlsx").json() == []
+
+        client.delete(f"/api/files/{in_text}", headers=self.ops)
+        assert self.search("budget zephyrine").json() == []
+
+    def test_files_missed_by_the_queue_are_indexed_by_maintenance(self):
+        file_id = self.upload("backfill.docx", minimal_docx(text="Quillwort inventory"))
+        search_indexer.flush()
+        db = TestingSessionLocal()
+        db.execute(text("DELETE FROM file_search WHERE rowid = :file_id"), {"file_id": file_id})
+        db.commit()
+        assert self.search("quillwort").json() == []
+
+        assert search_indexer.index_missing(db) >= 1
+        db.close()
+        assert [row["id"] for row in self.search("quillwort").json()] == [file_id]
+
+    def test_identical_content_is_extracted_once(self, monkeypatch):
+        extracted = []
+        document_text = search_indexer.document_text
+        
+        def counting_document_text(file_record):
+            extracted.append(file_record.id)
+            return document_text(file_record)
+        
+        monkeypatch.setattr(search_indexer, "document_text", counting_document_text)
+        content = minimal_docx(text="Marmalade ledger")
+        first = self.upload("first-copy.docx", content)
+        search_indexer.flush()
+        self.upload("second-copy.docx", content)
+        search_indexer.flush()
+        assert extracted == [first]
+        assert {row["filename"] for row in self.search("marmalade").json()} == {"first-copy.docx", "second-copy.docx"}
+
+    def test_queries_are_checked(self):
+        assert client.get("/api/files/search", params={"q": "x"}, headers=self.ops).status_code == 403
+        assert client.get("/api/files/search", params={"q": '"*'}, headers=self.client).status_code == 400
+        bad_cursor = client.get("/api/files/search", params={"q": "x", "cursor": "WyJhIl0"}, headers=self.client)
+        assert bad_cursor.status_code == 400
+        # Only the words reach the index, never query syntax
+        assert self.search('NEAR(zephyrine OR "x*').json() == []
+        assert client.get("/api/files/search-index", headers=self.ops).json()["indexed"] >= 0
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from app.core import startup
+from app.core.config import settings
+from tests.utils import ROOT
+
+
+def test_importing_the_app_has_no_side_effects(tmp_path):
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'app.db'}",
+        "UPLOAD_DIR": str(tmp_path / "uploads"),
+        "PYTHONPATH": str(ROOT),
+    }
+    script = "import sys, app.main; print('alembic' in sys.modules, 'passlib' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env=env,
+                            check=True, capture_output=True, text=True)
+    # Nothing is created, and migrations and password hashing aren't even imported
+    assert list(tmp_path.iterdir()) == []
+    assert output.stdout.split() == ["False", "False"]
+
+
+def test_workers_prepare_unless_the_host_has(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    monkeypatch.setattr(settings, "DATABASE_URL", url)
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(settings, "MIGRATE_ON_STARTUP", True)
+    monkeypatch.setenv("MIGRATE_ON_STARTUP", "true")
+
+    startup.prepare_worker()
+    assert (tmp_path / "uploads").is_dir()
+    with sqlite3.connect(tmp_path / "app.db") as connection:
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"users", "files", "alembic_version"} <= tables
+
+    startup.prepare_host()
+    assert settings.MIGRATE_ON_STARTUP is False
+    assert os.environ["MIGRATE_ON_STARTUP"] == "false"
+    # A worker started afterwards leaves the schema to the host
+    (tmp_path / "app.db").unlink()
+    startup.prepare_worker()
+    assert not (tmp_path / "app.db").exists()
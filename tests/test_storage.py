@@ -0,0 +1,189 @@
+import hashlib
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.migrations import upgrade_database
+from app.core.rehome import rehome
+from app.core.storage import LocalStorage, S3Storage, StorageBackend, object_key
+from app.models import FileRecord, StoredBlob
+from app.routers import files as files_router
+from tests.fake_s3 import FakeS3Client
+from tests.documents import minimal_docx
+from tests.utils import client, TestingSessionLocal, seed_user
+
+
+def test_object_key_fans_out_by_hash():
+    key = object_key("report.docx", depth=2)
+    first, second, name = key.split("/")
+    assert name == "report.docx"
+    assert len(first) == len(second) == 2
+    assert int(first + second, 16) >= 0
+    assert object_key("report.docx", depth=2) == key
+    assert object_key("report.docx", depth=0) == "report.docx"
+
+
+def test_local_storage_rejects_keys_outside_root(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    for key in ("../secret", "/etc/passwd", "a//b", "a/./b"):
+        with pytest.raises(ValueError):
+            storage.path(key)
+
+
+def test_storage_root_is_not_served():
+    # Stored objects are only reachable through the authenticated file routes
+    root = Path(settings.UPLOAD_DIR)
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "exposed.bin").write_bytes(b"private")
+    try:
+        assert client.get("/uploads/exposed.bin").status_code == 404
+    finally:
+        (root / "exposed.bin").unlink()
+
+
+def test_s3_storage_reads_ranges():
+    s3 = FakeS3Client()
+    storage = S3Storage("bucket", client=s3, prefix="files", read_buffer_size=4)
+    storage.put_stream(io.BytesIO(b"0123456789"), "ab/cd/object")
+    assert ("bucket", "files/ab/cd/object") in s3.objects
+    assert storage.stat("ab/cd/object").size == 10
+    assert storage.local_path("ab/cd/object") is None
+    
+    with storage.open("ab/cd/object") as reader:
+        reader.seek(6)
+        assert reader.read(3) == b"678"
+    assert s3.get_requests[-1] == ("files/ab/cd/object", "bytes=6-9")
+    
+    storage.delete("ab/cd/object")
+    with pytest.raises(FileNotFoundError):
+        storage.stat("ab/cd/object")
+
+
+def test_backends_must_implement_every_operation():
+    class ReadOnlyStorage(StorageBackend):
+        def stat(self, key):
+            raise FileNotFoundError(key)
+    
+    with pytest.raises(TypeError):
+        ReadOnlyStorage()
+
+
+def test_s3_errors_without_a_response_are_raised_as_they_are():
+    class TimeoutClient(FakeS3Client):
+        def head_object(self, Bucket, Key):
+            error = TimeoutError("read timed out")
+            error.response = None
+            raise error
+    
+    storage = S3Storage("bucket", client=TimeoutClient())
+    with pytest.raises(TimeoutError):
+        storage.stat("ab/cd/object")
+
+
+class TestS3Backend:
+    @pytest.fixture(autouse=True)
+    def s3_storage(self, monkeypatch):
+        self.s3 = FakeS3Client()
+        monkeypatch.setattr(files_router, "storage", S3Storage("bucket", client=self.s3, prefix="files"))
+    
+    def setup_method(self):
+        self.ops = seed_user("s3-ops@example.com", "ops")
+        self.client = seed_user("s3-client@example.com", "client")
+    
+    def test_upload_download_and_delete(self):
+        content = minimal_docx(300 * 1024)
+        digest = hashlib.sha256(content).hexdigest()
+        uploaded = client.post(
+            "/api/files/upload",
+            files={"file": ("remote.docx", io.BytesIO(content), "application/octet-stream")},
+            headers=self.ops
+        ).json()
+        
+        db = TestingSessionLocal()
+        storage_key = db.query(StoredBlob).filter(StoredBlob.sha256 == digest).one().storage_key
+        db.close()
+        assert self.s3.objects[("bucket", f"files/{storage_key}")][0] == content
+        assert not list(Path(settings.UPLOAD_DIR).glob(f"**/{digest}*"))
+        
+        link = client.get(f"/api/files/download-file/{uploaded['id']}", headers=self.client).json()["download_link"]
+        token = link.rsplit("/", 1)[1]
+        response = client.get(f"/api/files/secure-download/{token}", headers=self.client)
+        assert response.status_code == 200
+        assert response.content == content
+        
+        response = client.get(
+            f"/api/files/secure-download/{token}",
+            headers={**self.client, "Range": "bytes=1000-1999,-10"}
+        )
+        assert response.status_code == 206
+        assert content[1000:2000] in response.content
+        assert content[-10:] in response.content
+        
+        response = client.post("/api/files/archive", json={"file_ids": [uploaded["id"]]}, headers=self.client)
+        assert zipfile.ZipFile(io.BytesIO(response.content)).read("remote.docx") == content
+        
+        assert client.delete(f"/api/files/{uploaded['id']}", headers=self.ops).status_code == 200
+        assert ("bucket", f"files/{storage_key}") not in self.s3.objects
+
+
+def test_migration_turns_paths_into_keys(tmp_path):
+    url = f"sqlite:///{tmp_path / 'paths.db'}"
+    upgrade_database(url, "0002")
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO blobs (sha256, file_path, file_size, ref_count) VALUES ('d1', 'uploads/d1-0a0b', 3, 1)"
+        ))
+        connection.execute(text(
+            "INSERT INTO files (filename, original_filename, file_path, file_type, file_size, sha256) "
+            "VALUES ('d1-0a0b', 'a.docx', 'uploads/d1-0a0b', 'docx', 3, 'd1')"
+        ))
+    upgrade_database(url)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT storage_key FROM blobs")).scalar() == "d1-0a0b"
+        assert connection.execute(text("SELECT storage_key FROM files")).scalar() == "d1-0a0b"
+
+
+def test_rehome_into_fan_out_then_to_s3(tmp_path):
+    url = f"sqlite:///{tmp_path / 'rehome.db'}"
+    upgrade_database(url)
+    session_factory = sessionmaker(bind=create_engine(url))
+    local = LocalStorage(str(tmp_path / "files"))
+    local.root.mkdir()
+    
+    # A blob shared by two records and a file from before content addressing, stored flat
+    content = b"shared content"
+    digest = hashlib.sha256(content).hexdigest()
+    (local.root / f"{digest}-0001").write_bytes(content)
+    (local.root / "legacy.docx").write_bytes(b"legacy")
+    db = session_factory()
+    db.add(StoredBlob(sha256=digest, storage_key=f"{digest}-0001", file_size=len(content), ref_count=2))
+    for name in ("a.docx", "b.docx"):
+        db.add(FileRecord(filename=f"{digest}-0001", original_filename=name, storage_key=f"{digest}-0001",
+                          file_type="docx", file_size=len(content), sha256=digest))
+    db.add(FileRecord(filename="legacy.docx", original_filename="legacy.docx", storage_key="legacy.docx",
+                      file_type="docx", file_size=6))
+    db.commit()
+    
+    stats = rehome(local, local, session_factory, workers=2, batch_size=1)
+    assert (stats.moved, stats.skipped, stats.failed) == (2, 0, [])
+    blob_key = object_key(f"{digest}-0001")
+    assert db.query(StoredBlob).one().storage_key == blob_key
+    assert {record.storage_key for record in db.query(FileRecord)} == {blob_key, object_key("legacy.docx")}
+    assert (local.root / blob_key).read_bytes() == content
+    assert not (local.root / f"{digest}-0001").exists()
+    assert rehome(local, local, session_factory).skipped == 2
+    
+    s3 = S3Storage("bucket", client=FakeS3Client())
+    stats = rehome(local, s3, session_factory, workers=2)
+    assert stats.moved == 2
+    assert s3.stat(blob_key).size == len(content)
+    assert s3.stat(object_key("legacy.docx")).size == 6
+    # The app may still be reading from the local backend
+    assert (local.root / blob_key).exists()
+    db.close()
@@ -0,0 +1,209 @@
+import asyncio
+import io
+import struct
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
+from app.core.ooxml import END_OF_DIRECTORY, InvalidPackage, central_directory, check_contents, check_structure
+from app.core.uploads import receive_multipart_file
+from app.core.validation import check_zip_start, package_validator
+from app.core.zip_stream import ZipEntry, ZipStream
+from app.models import UploadSession
+from tests.documents import minimal_docx, minimal_package
+from tests.utils import client, TestingSessionLocal, seed_user
+
+LIMITS = {"max_entries": 100, "max_uncompressed_size": 10 * 1024 * 1024, "max_ratio": 100}
+
+
+def write_zip(path: Path, parts: dict, compression: int = zipfile.ZIP_DEFLATED) -> str:
+    with zipfile.ZipFile(path, "w", compression) as archive:
+        for name, content in parts.items():
+            archive.writestr(name, content)
+    return str(path)
+
+
+def docx_parts() -> dict:
+    with zipfile.ZipFile(io.BytesIO(minimal_docx())) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def corrupt_docx() -> bytes:
+    """A Word document whose main part doesn't inflate."""
+    content = bytearray(minimal_docx())
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        offset = archive.getinfo("word/document.xml").header_offset
+    name_size, extra_size = struct.unpack_from("<2H", content, offset + 26)
+    # A final deflate block of the reserved type
+    content[offset + 30 + name_size + extra_size] = 0x07
+    return bytes(content)
+
+
+def test_structure_is_read_from_the_central_directory(tmp_path):
+    path = tmp_path / "report.docx"
+    path.write_bytes(minimal_docx(5000))
+    entries, _ = central_directory(str(path), 100)
+    assert [entry.name for entry in entries][-1] == "word/media/padding.bin"
+    check_structure(str(path), "docx", **LIMITS)
+    check_contents(str(path), "docx")
+
+    # A Word document renamed to .xlsx lacks the workbook
+    with pytest.raises(InvalidPackage, match="xl/workbook.xml"):
+        check_structure(str(path), "xlsx", **LIMITS)
+    with pytest.raises(InvalidPackage, match="More than 2 parts"):
+        check_structure(str(path), "docx", **{**LIMITS, "max_entries": 2})
+
+    # Any ZIP archive isn't a package
+    other = write_zip(tmp_path / "photos.docx", {"photo.jpg": b"\xff\xd8" * 10})
+    with pytest.raises(InvalidPackage, match="Content_Types"):
+        check_structure(other, "docx", **LIMITS)
+    (tmp_path / "text.docx").write_bytes(b"just text, no archive")
+    with pytest.raises(InvalidPackage, match="Not a ZIP archive"):
+        check_structure(str(tmp_path / "text.docx"), "docx", **LIMITS)
+
+
+def test_zip64_directories_are_read(tmp_path):
+    entries = []
+    for name, content in docx_parts().items():
+        part = tmp_path / name.replace("/", "_")
+        part.write_bytes(content)
+        entries.append(ZipEntry(name, str(part), len(content), datetime(2024, 1, 2, 3, 4, 6)))
+    archive = ZipStream(entries, force_zip64=True)
+
+    async def collect():
+        return b"".join([chunk async for chunk in archive])
+
+    path = tmp_path / "zip64.docx"
+    path.write_bytes(asyncio.run(collect()))
+    check_structure(str(path), "docx", **LIMITS)
+    check_contents(str(path), "docx")
+
+
+def test_zip_bombs_are_refused(tmp_path):
+    bomb = write_zip(tmp_path / "bomb.docx", {**docx_parts(), "word/media/zeros.bin": b"\0" * (5 * 1024 * 1024)})
+    with pytest.raises(InvalidPackage, match="expands more than 100 times"):
+        check_structure(bomb, "docx", **LIMITS)
+
+    # Parts that compress no better than allowed can still add up to too much
+    stored = write_zip(tmp_path / "large.docx", {**docx_parts(), "word/media/zeros.bin": b"\0" * 2048}, zipfile.ZIP_STORED)
+    with pytest.raises(InvalidPackage, match="expand to more than"):
+        check_structure(stored, "docx", **{**LIMITS, "max_uncompressed_size": 2048})
+
+    # Entries sharing one compressed stream, as in overlapping zip bombs
+    data = Path(write_zip(tmp_path / "base.docx", docx_parts())).read_bytes()
+    end = data.rfind(b"PK\x05\x06")
+    record = list(END_OF_DIRECTORY.unpack_from(data, end))
+    # A second directory entry, with a name of the same length, for the first part's data
+    first = data[record[6]:record[6] + 46 + len("[Content_Types].xml")]
+    copy = first.replace(b"[Content_Types].xml", b"[Content_Types].bak")
+    record[3] += 1
+    record[4] += 1
+    record[5] += len(copy)
+    overlapping = tmp_path / "overlap.docx"
+    overlapping.write_bytes(data[:end] + copy + END_OF_DIRECTORY.pack(*record))
+    with pytest.raises(InvalidPackage, match="overlaps"):
+        check_structure(str(overlapping), "docx", **LIMITS)
+
+
+def test_content_types_must_match_the_claimed_type(tmp_path):
+    parts = docx_parts()
+    # A macro-enabled document renamed to .docx
+    macro = parts["[Content_Types].xml"].replace(
+        b"application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml",
+        b"application/vnd.ms-word.document.macroEnabled.main+xml"
+    )
+    docm = write_zip(tmp_path / "macros.docx", {**parts, "[Content_Types].xml": macro})
+    check_structure(docm, "docx", **LIMITS)
+    with pytest.raises(InvalidPackage, match="macroEnabled"):
+        check_contents(docm, "docx")
+
+    wrong_root = write_zip(tmp_path / "root.docx", {**parts, "word/document.xml": b"<workbook/>"})
+    with pytest.raises(InvalidPackage, match="isn't a docx main part"):
+        check_contents(wrong_root, "docx")
+
+
+def test_corrupt_parts_are_invalid(tmp_path):
+    path = tmp_path / "corrupt.docx"
+    path.write_bytes(corrupt_docx())
+    check_structure(str(path), "docx", **LIMITS)
+    with pytest.raises(InvalidPackage, match="invalid block type"):
+        check_contents(str(path), "docx")
+
+
+def test_stream_is_refused_by_its_first_bytes(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_SIZE", 8)
+    body = (
+        b"--xyz\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="renamed.docx"\r\n\r\n'
+        + b"MZ" + b"x" * 200 + b"\r\n--xyz--\r\n"
+    )
+    chunks = [body[i:i + 8] for i in range(0, len(body), 8)]
+    received = []
+
+    async def receive():
+        chunk = chunks[len(received)]
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": len(received) < len(chunks)}
+
+    request = Request({
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=xyz")],
+    }, receive)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(receive_multipart_file(request, tmp_path, lambda name: None, check_start=check_zip_start, start_size=4))
+    assert exc_info.value.status_code == 400
+    assert len(received) < len(chunks) / 2
+    assert list(tmp_path.iterdir()) == []
+
+
+class TestUploadValidation:
+    def setup_method(self):
+        self.ops = seed_user("validation-ops@example.com", "ops")
+
+    def upload(self, name: str, content: bytes):
+        return client.post(
+            "/api/files/upload",
+            files={"file": (name, io.BytesIO(content), "application/octet-stream")},
+            headers=self.ops
+        )
+
+    def test_uploads_must_be_the_claimed_type(self):
+        rejected = package_validator.stats()["rejected"]
+        assert self.upload("valid.xlsx", minimal_package("xlsx", 100)).status_code == 200
+
+        response = self.upload("renamed.docx", b"%PDF-1.7 not a document")
+        assert response.status_code == 400
+        assert "not a ZIP archive" in response.json()["detail"]
+        response = self.upload("renamed.xlsx", minimal_docx(100))
+        assert response.status_code == 400
+        assert response.json()["detail"].startswith("File is not a valid .xlsx document")
+        response = self.upload("corrupt.docx", corrupt_docx())
+        assert response.status_code == 400
+        assert package_validator.stats()["rejected"] == rejected + 2
+        assert not list(Path(settings.UPLOAD_DIR).glob(".*.part"))
+
+        stats = client.get("/api/files/upload-validation", headers=self.ops).json()
+        assert stats["accepted"] >= 1 and stats["pending"] == 0
+
+    def test_completed_sessions_are_checked(self):
+        content = minimal_docx(100)
+        response = client.post(
+            "/api/files/upload-sessions",
+            json={"filename": "session.pptx", "file_size": len(content)},
+            headers=self.ops
+        )
+        session_id = response.json()["id"]
+        client.put(f"/api/files/upload-sessions/{session_id}?offset=0", content=content, headers=self.ops)
+
+        response = client.post(f"/api/files/upload-sessions/{session_id}/complete", headers=self.ops)
+        assert response.status_code == 400
+        assert "ppt/presentation.xml" in response.json()["detail"]
+        # Resuming can't fix the content, so the session is gone
+        db = TestingSessionLocal()
+        assert db.get(UploadSession, session_id) is None
+        db.close()
@@ -0,0 +1,62 @@
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from app.main import app
+from app.database import get_db, Base
+from app.core.admission import admission
+from app.core.audit import audit_writer
+from app.core.maintenance import maintenance_scheduler
+from app.core.metrics import app_metrics
+from app.core.previews import preview_generator
+from app.core.profiling import profiler
+from app.core.search import search_indexer
+from app.core.security import create_access_token, get_password_hash
+from app.models import User
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Test database shared by all test modules; recreated on every run
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# TestClient runs each request on a fresh event loop, so connections can't be pooled across requests
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+app_metrics.instrument_engine(async_engine.sync_engine, "async")
+
+Base.metadata.drop_all(bind=engine)
+Base.metadata.create_all(bind=engine)
+
+async def override_get_db():
+    async with AsyncTestingSessionLocal() as db:
+        yield db
+
+app.dependency_overrides[get_db] = override_get_db
+audit_writer.session_factory = TestingSessionLocal
+maintenance_scheduler.session_factory = TestingSessionLocal
+profiler.session_factory = TestingSessionLocal
+search_indexer.session_factory = TestingSessionLocal
+preview_generator.session_factory = TestingSessionLocal
+# The suite signs in and uploads far faster than any client would
+admission.enabled = False
+
+client = TestClient(app)
+
+def seed_user(email: str, user_type: str) -> dict:
+    """Add a verified user unless there is one, and return headers signed in as it."""
+    db = TestingSessionLocal()
+    if not db.query(User).filter(User.email == email).first():
+        db.add(User(
+            email=email,
+            hashed_password=get_password_hash("testpass123"),
+            user_type=user_type,
+            is_verified=True
+        ))
+        db.commit()
+    db.close()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': email})}"}